@@ -2,6 +2,8 @@ import os
 import re
 from collections import OrderedDict
 
+from mcq_records import format_mcq_text, read_jsonl
+
 
 def parse_mapping(md_path: str) -> list[tuple[str, str]]:
     rows: list[tuple[str, str]] = []
@@ -25,29 +27,38 @@ def parse_mapping(md_path: str) -> list[tuple[str, str]]:
     return rows
 
 
-def build_comparison_table() -> str:
+def load_provider(provider: str, mapping_file: str, stale: dict[str, str] | None = None) -> tuple[list[tuple[str, str]], dict[str, str]]:
+    """Return (point -> ids rows, label -> MCQ text) for one provider.
+    Reads summary_mcqs_<provider>.jsonl when present; older runs fall back to the .md mapping and .txt blocks.
+    A provider in `stale` (provider -> reason) has no current output, so its files from an earlier run are ignored.
+    """
+    if stale and provider in stale:
+        return [], {}
     base_dir = os.path.dirname(os.path.abspath(__file__))
-    openai_md = os.path.join(base_dir, 'points_to_questions.md')
-    gemini_md = os.path.join(base_dir, 'points_to_questions_gemini.md')
-    mistral_md = os.path.join(base_dir, 'points_to_questions_mistral.md')
+    records = read_jsonl(os.path.join(base_dir, f'summary_mcqs_{provider}.jsonl'))
+    if records:
+        ids_by_point: "OrderedDict[str, list[str]]" = OrderedDict()
+        for record in records:
+            ids_by_point.setdefault(record['point'], []).append(record['id'])
+        rows = [(pt, ', '.join(ids)) for pt, ids in ids_by_point.items()]
+        blocks = {record['id'].lower(): format_mcq_text(record) for record in records}
+        return rows, blocks
+    rows = parse_mapping(os.path.join(base_dir, mapping_file))
+    # Parse MCQ blocks to map labels like "1a" -> full MCQ text block
+    blocks = parse_mcq_blocks(os.path.join(base_dir, f'summary_questions_{provider}.txt'))
+    return rows, blocks
 
-    openai_txt = os.path.join(base_dir, 'summary_questions_openai.txt')
-    gemini_txt = os.path.join(base_dir, 'summary_questions_gemini.txt')
-    mistral_txt = os.path.join(base_dir, 'summary_questions_mistral.txt')
 
-    openai_rows = parse_mapping(openai_md)
-    gemini_rows = parse_mapping(gemini_md)
-    mistral_rows = parse_mapping(mistral_md)
+def build_comparison_table(stale: dict[str, str] | None = None) -> str:
+    stale = stale or {}
+    openai_rows, openai_blocks = load_provider('openai', 'points_to_questions.md', stale)
+    gemini_rows, gemini_blocks = load_provider('gemini', 'points_to_questions_gemini.md', stale)
+    mistral_rows, mistral_blocks = load_provider('mistral', 'points_to_questions_mistral.md', stale)
 
     openai_map = {pt: ids for pt, ids in openai_rows}
     gemini_map = {pt: ids for pt, ids in gemini_rows}
     mistral_map = {pt: ids for pt, ids in mistral_rows}
 
-    # Parse MCQ blocks to map labels like "1a" -> full MCQ text block
-    openai_blocks = parse_mcq_blocks(openai_txt)
-    gemini_blocks = parse_mcq_blocks(gemini_txt)
-    mistral_blocks = parse_mcq_blocks(mistral_txt)
-
     # Row order: OpenAI first, then any extra points from Gemini/Mistral preserving discovery order
     ordered_points: "OrderedDict[str, None]" = OrderedDict()
     for pt, _ in openai_rows:
@@ -70,6 +81,10 @@ def build_comparison_table() -> str:
             mistral_cell = format_cell_from_ids(mistral_ids, mistral_blocks)
         else:
             mistral_cell = format_cell_from_row_index(idx, mistral_blocks)
+        openai_cell, gemini_cell, mistral_cell = (
+            f"_{stale[provider]}_" if provider in stale else cell
+            for provider, cell in (('openai', openai_cell), ('gemini', gemini_cell), ('mistral', mistral_cell))
+        )
         lines.append(f"| {idx} | {safe_point} | {openai_cell} | {gemini_cell} | {mistral_cell} |")
 
     return "\n".join(lines)
@@ -83,28 +98,16 @@ def html_escape(s: str) -> str:
     )
 
 
-def build_comparison_html() -> str:
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    openai_md = os.path.join(base_dir, 'points_to_questions.md')
-    gemini_md = os.path.join(base_dir, 'points_to_questions_gemini.md')
-    mistral_md = os.path.join(base_dir, 'points_to_questions_mistral.md')
-
-    openai_txt = os.path.join(base_dir, 'summary_questions_openai.txt')
-    gemini_txt = os.path.join(base_dir, 'summary_questions_gemini.txt')
-    mistral_txt = os.path.join(base_dir, 'summary_questions_mistral.txt')
-
-    openai_rows = parse_mapping(openai_md)
-    gemini_rows = parse_mapping(gemini_md)
-    mistral_rows = parse_mapping(mistral_md)
+def build_comparison_html(stale: dict[str, str] | None = None) -> str:
+    stale = stale or {}
+    openai_rows, openai_blocks = load_provider('openai', 'points_to_questions.md', stale)
+    gemini_rows, gemini_blocks = load_provider('gemini', 'points_to_questions_gemini.md', stale)
+    mistral_rows, mistral_blocks = load_provider('mistral', 'points_to_questions_mistral.md', stale)
 
     openai_map = {pt: ids for pt, ids in openai_rows}
     gemini_map = {pt: ids for pt, ids in gemini_rows}
     mistral_map = {pt: ids for pt, ids in mistral_rows}
 
-    openai_blocks = parse_mcq_blocks(openai_txt)
-    gemini_blocks = parse_mcq_blocks(gemini_txt)
-    mistral_blocks = parse_mcq_blocks(mistral_txt)
-
     ordered_points: "OrderedDict[str, None]" = OrderedDict()
     for pt, _ in openai_rows:
         ordered_points.setdefault(pt, None)
@@ -122,6 +125,10 @@ def build_comparison_html() -> str:
             mistral_cell = format_cell_from_ids_html(mistral_ids, mistral_blocks)
         else:
             mistral_cell = format_cell_from_row_index_html(idx, mistral_blocks)
+        openai_cell, gemini_cell, mistral_cell = (
+            f"<em>{html_escape(stale[provider])}</em>" if provider in stale else cell
+            for provider, cell in (('openai', openai_cell), ('gemini', gemini_cell), ('mistral', mistral_cell))
+        )
         rows_html.append(
             (
                 "<tr>"
@@ -279,16 +286,17 @@ def format_cell_from_row_index_html(row_index: int, label_to_block: dict[str, st
     return ''.join(parts) if parts else "-"
 
 
-def main() -> None:
+def main(stale: dict[str, str] | None = None) -> None:
+    """Write comparison_table.md/.html; `stale` maps providers with no output from this run to the reason shown instead"""
     base_dir = os.path.dirname(os.path.abspath(__file__))
     out_path = os.path.join(base_dir, 'comparison_table.md')
-    table = build_comparison_table()
+    table = build_comparison_table(stale)
     with open(out_path, 'w', encoding='utf-8') as f:
         f.write(table)
     print(f"Wrote {out_path}")
 
     html_out = os.path.join(base_dir, 'comparison_table.html')
-    html = build_comparison_html()
+    html = build_comparison_html(stale)
     with open(html_out, 'w', encoding='utf-8') as f:
         f.write(html)
     print(f"Wrote {html_out}")
@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from llm_cache import get_llm_cache, report_run
+from mcq_processor_from_summary_openai import extract_numbered_points, extract_text_from_pdf, get_openai_model
+from mcq_records import (MAX_TOKENS_PER_POINT, batch_points, build_batch_prompt, build_prompt, generate_batch_records,
+                         get_batch_size, records_from_batch_response, records_from_response, save_records)
+from point_journal import IncompleteRun
+from providers import get_openai_client, openai_chat, openai_request, sampling_params
+from rate_limit import report_limits
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REQUESTS_FILE = os.path.join(BASE_DIR, "bulk_requests_openai.jsonl")
+RESULTS_FILE = os.path.join(BASE_DIR, "bulk_results_openai.jsonl")
+ERRORS_FILE = os.path.join(BASE_DIR, "bulk_errors_openai.jsonl")
+JOB_FILE = os.path.join(BASE_DIR, "bulk_job_openai.json")
+ENDPOINT = "/v1/chat/completions"
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def get_poll_interval():
+    """Return seconds between status checks (MCQ_BULK_POLL_SECONDS, default 60)"""
+    return float(os.getenv("MCQ_BULK_POLL_SECONDS", "60"))
+
+def custom_id(batch):
+    """Request id naming the (contiguous) points a request covers, e.g. "points-5-8" """
+    return f"points-{batch[0][0]}-{batch[-1][0]}"
+
+def build_requests(points, model, batch_size):
+    """One chat-completion request per batch of points, in the batch API's JSONL line format"""
+    lines = []
+    for batch in batch_points(points, batch_size):
+        if len(batch) == 1:
+            body = openai_request(build_prompt(batch[0][1]), model)
+        else:
+            body = openai_request(build_batch_prompt(batch), model, schema="mcq_batch",
+                                  max_tokens=MAX_TOKENS_PER_POINT * len(batch))
+        lines.append({"custom_id": custom_id(batch), "method": "POST", "url": ENDPOINT, "body": body})
+    return lines
+
+def load_job():
+    """Return the job saved by submit_job(); raises if there is none"""
+    if not os.path.exists(JOB_FILE):
+        raise RuntimeError(f"No bulk job found ({os.path.basename(JOB_FILE)}); run: python bulk_jobs.py submit")
+    with open(JOB_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def submit_job(points, model, batch_size):
+    """Write the requests file, upload it and create the batch; the job is saved to bulk_job_openai.json"""
+    lines = build_requests(points, model, batch_size)
+    with open(REQUESTS_FILE, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+
+    client = get_openai_client()
+    with open(REQUESTS_FILE, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(input_file_id=input_file.id, endpoint=ENDPOINT, completion_window="24h")
+
+    job = {"batch_id": batch.id, "model": model, "batch_size": batch_size, "points": points,
+           "submitted_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+    with open(JOB_FILE, "w", encoding="utf-8") as f:
+        json.dump(job, f, indent=2, ensure_ascii=False)
+    print(f"Submitted {len(lines)} requests for {len(points)} points as batch {batch.id}")
+    return job
+
+def wait_for_job(job, poll_interval=None):
+    """Poll the batch until it reaches a final status and return it"""
+    poll_interval = get_poll_interval() if poll_interval is None else poll_interval
+    client = get_openai_client()
+    while True:
+        batch = client.batches.retrieve(job["batch_id"])
+        counts = batch.request_counts
+        progress = f" ({counts.completed}/{counts.total} done, {counts.failed} failed)" if counts else ""
+        print(f"Batch {batch.id}: {batch.status}{progress}")
+        if batch.status in FINAL_STATUSES:
+            return batch
+        time.sleep(poll_interval)
+
+def download_results(batch):
+    """Save the batch's output and error files to bulk_results_openai.jsonl and bulk_errors_openai.jsonl.
+    Returns {custom_id: reply text}; every failed request is printed with its error.
+    """
+    client = get_openai_client()
+    replies = {}
+    for file_id, path in ((batch.output_file_id, RESULTS_FILE), (batch.error_file_id, ERRORS_FILE)):
+        if not file_id:
+            # Don't leave an earlier job's file lying around as if it were this one's
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+        content = client.files.content(file_id).text
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            if response.get("status_code") == 200:
+                replies[item["custom_id"]] = response["body"]["choices"][0]["message"]["content"] or ""
+            else:
+                print(f"{item['custom_id']}: request failed: {item.get('error') or response.get('body')}")
+    return replies
+
+def batch_errors(batch):
+    """The batch-level errors OpenAI reports for a failed batch (e.g. a rejected input file), as one string"""
+    errors = getattr(getattr(batch, "errors", None), "data", None) or []
+    return "; ".join(f"{error.code}: {error.message}" for error in errors)
+
+def ingest_results(job, replies, retry_failed=False):
+    """Turn the batch replies into records and save them like an interactive run. Replies go into the LLM cache.
+    Points that failed or came back malformed are only asked again interactively, at full price, with
+    retry_failed; otherwise, or if any are still missing afterwards, nothing is written and IncompleteRun is raised.
+    """
+    model = job["model"]
+    cache = get_llm_cache()
+    records, retry = {}, []
+    for line in build_requests(job["points"], model, job["batch_size"]):
+        first, last = map(int, line["custom_id"].split("-")[1:])
+        batch = [(point_id, job["points"][point_id - 1]) for point_id in range(first, last + 1)]
+        reply = replies.get(line["custom_id"])
+        if reply is None:
+            retry.extend(batch)
+            continue
+        if cache is not None and not cache.readonly:
+            prompt = line["body"]["messages"][0]["content"]
+            cache.put(cache.key("openai", model, prompt, **sampling_params(line["body"])), "openai", model, reply)
+        if len(batch) == 1:
+            point_records, errors = records_from_response(reply, first, batch[0][1])
+            if errors or not point_records:
+                retry.extend(batch)
+            else:
+                records[first] = point_records
+        else:
+            done, failed = records_from_batch_response(reply, batch)
+            records.update(done)
+            retry.extend(failed)
+
+    if retry and not retry_failed:
+        ids = ", ".join(str(point_id) for point_id, _ in retry)
+        raise IncompleteRun(f"{len(retry)} point(s) failed or came back malformed in the batch ({ids}); nothing was "
+                            f"written. Ask for them interactively at full price with: python bulk_jobs.py collect --retry-failed")
+    if retry:
+        print(f"Asking again interactively for {len(retry)} point(s) that failed or were malformed in the batch...")
+        results = generate_batch_records(
+            lambda prompt: openai_chat(prompt, model),
+            lambda prompt, n_points: openai_chat(prompt, model, schema="mcq_batch", max_tokens=MAX_TOKENS_PER_POINT * n_points),
+            retry,
+        )
+        for point_id, (point_records, errors) in results.items():
+            for error in errors:
+                print(f"Point {point_id}: rejected {error}")
+            records[point_id] = point_records
+        missing = [str(point_id) for point_id, _ in retry if not records.get(point_id)]
+        if missing:
+            raise IncompleteRun(f"{len(missing)} point(s) still have no questions ({', '.join(missing)}); nothing was written")
+
+    ordered = [record for point_id in sorted(records) for record in records[point_id]]
+    save_records(ordered, 'openai', 'points_to_questions.md')
+    print(f"Ingested {len(ordered)} MCQs -> summary_mcqs_openai.jsonl, summary_questions_openai.txt, points_to_questions.md")
+    return ordered
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate summary MCQs through the OpenAI Batch API (results within 24h, at batch prices)")
+    parser.add_argument("command", choices=["run", "submit", "status", "collect"],
+                        help="run: submit, wait and ingest; submit: upload the job and exit; "
+                             "status: show the submitted job; collect: wait for it and ingest the results")
+    parser.add_argument("--pdf", default="kinematics_and_dynamics.pdf", help="Summary PDF (default: kinematics_and_dynamics.pdf)")
+    parser.add_argument("--poll", type=float, default=None, help="Seconds between status checks (default: MCQ_BULK_POLL_SECONDS or 60)")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Ask again interactively (at full price) for points that failed or were malformed in the batch")
+    args = parser.parse_args()
+
+    try:
+        if args.command in ("run", "submit"):
+            points = extract_numbered_points(extract_text_from_pdf(args.pdf))
+            if not points:
+                print("No numbered points were found in the PDF text.")
+                return
+            job = submit_job(points, get_openai_model(), get_batch_size())
+            if args.command == "submit":
+                print("Collect the results later with: python bulk_jobs.py collect")
+                return
+        else:
+            job = load_job()
+        if args.command == "status":
+            batch = get_openai_client().batches.retrieve(job["batch_id"])
+            print(f"Batch {batch.id} (submitted {job['submitted_at']}, {len(job['points'])} points): {batch.status}")
+            return
+        batch = wait_for_job(job, args.poll)
+        replies = download_results(batch)
+        if batch.status != "completed":
+            # Re-asking every point interactively would cost what the batch was meant to save
+            details = batch_errors(batch)
+            raise RuntimeError(f"Batch {batch.id} ended as {batch.status}{f' ({details})' if details else ''} with "
+                               f"{len(replies)} of {len(build_requests(job['points'], job['model'], job['batch_size']))} "
+                               f"replies; nothing was ingested. Fix the cause and submit again.")
+        ingest_results(job, replies, args.retry_failed)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        report_run()
+        report_limits()
+
+if __name__ == "__main__":
+    main()
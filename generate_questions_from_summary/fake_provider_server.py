@@ -0,0 +1,327 @@
+# Local stand-in for the OpenAI endpoints the summary scripts use, for trying them without an API key or cost.
+# Serves chat completions, streamed or not (also Mistral-compatible), and the batch workflow: file upload,
+# batch create/retrieve and file content. Replies are well-formed MCQ JSON derived from the prompt. It can also
+# throttle like a real provider (requests/min, concurrent requests, random 5xx) to exercise rate limiting, and
+# answer a share of requests very slowly to exercise hedging.
+# Point the scripts at it with:
+#     OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+#     MISTRAL_API_URL=http://127.0.0.1:8765/v1/chat/completions
+import argparse
+import collections
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+POINT_HEADER_PAT = re.compile(r"^### POINT (\d+)\n(.*?)(?=\n\n### POINT |\n\nReturn ONLY)", re.MULTILINE | re.DOTALL)
+SINGLE_POINT_PAT = re.compile(r"\nPoint:\n(.*?)\n\nReturn ONLY", re.DOTALL)
+
+
+def fake_questions(point_text):
+    """Three valid questions about a point"""
+    topic = " ".join(point_text.split()[:12])
+    return [
+        {
+            "stem": f"Stand-in question {k} about: {topic}",
+            "choices": [f"Option {letter} for question {k}" for letter in "ABCD"],
+            "answer": k % 4,
+            "explanation": f"Option {'ABCD'[k % 4]} is correct for this stand-in question.",
+        }
+        for k in range(1, 4)
+    ]
+
+def fake_reply(prompt):
+    """MCQ JSON in the shape the prompt asks for (batched points or a single point)"""
+    points = POINT_HEADER_PAT.findall(prompt)
+    if points:
+        return json.dumps({"points": [{"point_id": int(pid), "questions": fake_questions(text)} for pid, text in points]})
+    single = SINGLE_POINT_PAT.search(prompt)
+    return json.dumps({"questions": fake_questions(single.group(1) if single else prompt)})
+
+def chat_completion(body, ids):
+    """Chat completion object answering the last user message of a request body"""
+    prompt = body["messages"][-1]["content"]
+    content = fake_reply(prompt)
+    return {
+        "id": f"chatcmpl-{next(ids)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stand-in"),
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                  "total_tokens": (len(prompt) + len(content)) // 4},
+    }
+
+
+def stream_chunks(completion, size=24):
+    """chat.completion.chunk events carrying the reply `size` characters at a time"""
+    content = completion["choices"][0]["message"]["content"]
+    base = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"],
+            "model": completion["model"]}
+    yield {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]}
+    for i in range(0, len(content), size):
+        yield {**base, "choices": [{"index": 0, "delta": {"content": content[i:i + size]}, "finish_reason": None}]}
+    yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+
+
+class FakeProvider:
+    """In-memory files and batches; a batch completes batch_delay seconds after it is created.
+    Streamed replies pause stream_delay seconds between chunks, like a model generating tokens.
+    Chat requests over `rpm` a minute or `max_concurrent` at once get a 429 (with Retry-After when
+    retry_after is set), and a share `error_rate` of the rest fail with a 503. A share `slow_rate` of served
+    requests takes `slow_latency` seconds instead of `latency`. A share `batch_error_rate` of batch requests fails
+    into the batch's error file, and a batch can be made to end as `batch_status` (failed, expired or cancelled).
+    """
+
+    def __init__(self, batch_delay=2.0, stream_delay=0.02, latency=0.0, rpm=0, max_concurrent=0,
+                 error_rate=0.0, retry_after=None, slow_rate=0.0, slow_latency=30.0,
+                 batch_error_rate=0.0, batch_status="completed"):
+        self.batch_delay = batch_delay
+        self.stream_delay = stream_delay
+        self.latency = latency
+        self.rpm = rpm
+        self.max_concurrent = max_concurrent
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.batch_error_rate = batch_error_rate
+        self.batch_status = batch_status
+        self.recent = collections.deque()
+        self.in_flight = 0
+        self.stats = collections.Counter()
+        self.files = {}
+        self.batches = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def admit(self):
+        """Decide whether a chat request is served: returns (status, Retry-After seconds or None)"""
+        now = time.monotonic()
+        with self.lock:
+            while self.recent and self.recent[0] <= now - 60:
+                self.recent.popleft()
+            if (self.rpm and len(self.recent) >= self.rpm) or (self.max_concurrent and self.in_flight >= self.max_concurrent):
+                self.stats["throttled"] += 1
+                return 429, self.retry_after
+            if random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return 503, None
+            self.recent.append(now)
+            self.in_flight += 1
+            self.stats["served"] += 1
+            self.stats["peak_concurrency"] = max(self.stats["peak_concurrency"], self.in_flight)
+            return 200, None
+
+    def request_latency(self):
+        """Seconds a served chat request takes: usually `latency`, now and then `slow_latency`"""
+        if random.random() < self.slow_rate:
+            with self.lock:
+                self.stats["slow"] += 1
+            return self.slow_latency
+        return self.latency
+
+    def finish(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def add_file(self, content, filename, purpose):
+        file_id = f"file-{next(self.ids)}"
+        with self.lock:
+            self.files[file_id] = content
+        return {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+
+    def create_batch(self, params):
+        batch_id = f"batch_{next(self.ids)}"
+        batch = {
+            "id": batch_id, "object": "batch", "endpoint": params["endpoint"],
+            "input_file_id": params["input_file_id"], "completion_window": params["completion_window"],
+            "status": "in_progress", "created_at": int(time.time()), "in_progress_at": int(time.time()),
+            "output_file_id": None, "error_file_id": None, "metadata": params.get("metadata"),
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        with self.lock:
+            self.batches[batch_id] = batch
+        threading.Timer(self.batch_delay, self.run_batch, args=(batch_id,)).start()
+        return batch
+
+    def run_batch(self, batch_id):
+        """Answer the request lines of the batch's input file and attach the output and error files.
+        A failed batch gets neither; an expired or cancelled one only answers the first half of its lines.
+        """
+        batch = self.batches[batch_id]
+        lines = [json.loads(line) for line in self.files[batch["input_file_id"]].decode("utf-8").splitlines() if line.strip()]
+        if self.batch_status == "failed":
+            with self.lock:
+                batch.update(status="failed", failed_at=int(time.time()),
+                             errors={"object": "list", "data": [{"code": "invalid_request", "message": "Stand-in batch failure"}]})
+            return
+        if self.batch_status != "completed":
+            lines = lines[:len(lines) // 2]
+        output, errors = [], []
+        for line in lines:
+            if random.random() < self.batch_error_rate:
+                errors.append({
+                    "id": f"batch_req_{next(self.ids)}",
+                    "custom_id": line["custom_id"],
+                    "response": {"status_code": 500, "request_id": f"req_{next(self.ids)}",
+                                 "body": {"error": {"message": "Stand-in server_error", "type": "server_error"}}},
+                    "error": None,
+                })
+                continue
+            output.append({
+                "id": f"batch_req_{next(self.ids)}",
+                "custom_id": line["custom_id"],
+                "response": {"status_code": 200, "request_id": f"req_{next(self.ids)}", "body": chat_completion(line["body"], self.ids)},
+                "error": None,
+            })
+        files = {}
+        for name, items in (("output", output), ("error", errors)):
+            if items:
+                content = "".join(json.dumps(item) + "\n" for item in items).encode("utf-8")
+                files[f"{name}_file_id"] = self.add_file(content, f"{batch_id}_{name}.jsonl", f"batch_{name}")["id"]
+        with self.lock:
+            batch.update(status=self.batch_status, completed_at=int(time.time()), **files,
+                         request_counts={"total": len(lines), "completed": len(output), "failed": len(errors)})
+
+
+def parse_multipart(content_type, body):
+    """Return {field name: (filename, bytes)} for a multipart/form-data body"""
+    message = BytesParser().parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body)
+    return {part.get_param("name", header="content-disposition"): (part.get_filename(), part.get_payload(decode=True))
+            for part in message.get_payload()}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    provider = None
+    quiet = False
+
+    def send_json(self, data, status=200, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        self.send_json({"error": {"message": message, "type": "invalid_request_error"}}, status)
+
+    def send_stream(self, completion):
+        """Send a completion as server-sent events over a chunked response"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        events = [f"data: {json.dumps(chunk)}\n\n" for chunk in stream_chunks(completion)] + ["data: [DONE]\n\n"]
+        for event in events:
+            data = event.encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+            time.sleep(self.provider.stream_delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        body = self.read_body()
+        if self.path.endswith("/chat/completions"):
+            status, retry_after = self.provider.admit()
+            if status != 200:
+                headers = {"Retry-After": str(math.ceil(retry_after))} if retry_after is not None else {}
+                kind = "rate_limit_exceeded" if status == 429 else "server_error"
+                self.send_json({"error": {"message": f"Stand-in {kind}", "type": kind}}, status, headers)
+                return
+            try:
+                params = json.loads(body)
+                completion = chat_completion(params, self.provider.ids)
+                time.sleep(self.provider.request_latency())
+                if params.get("stream"):
+                    self.send_stream(completion)
+                else:
+                    self.send_json(completion)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up on this request, e.g. a hedged duplicate that lost the race
+                with self.provider.lock:
+                    self.provider.stats["abandoned"] += 1
+            finally:
+                self.provider.finish()
+        elif self.path.endswith("/files"):
+            fields = parse_multipart(self.headers["Content-Type"], body)
+            filename, content = fields["file"]
+            self.send_json(self.provider.add_file(content, filename, fields["purpose"][1].decode()))
+        elif self.path.endswith("/batches"):
+            params = json.loads(body)
+            if params.get("input_file_id") not in self.provider.files:
+                self.send_error_json(404, f"No such file: {params.get('input_file_id')}")
+            else:
+                self.send_json(self.provider.create_batch(params))
+        else:
+            self.send_error_json(404, f"Unknown endpoint: {self.path}")
+
+    def do_GET(self):
+        if self.path.endswith("/stats"):
+            self.send_json(dict(self.provider.stats))
+            return
+        batch = re.search(r"/batches/([\w-]+)$", self.path)
+        content = re.search(r"/files/([\w-]+)/content$", self.path)
+        if batch and batch.group(1) in self.provider.batches:
+            self.send_json(self.provider.batches[batch.group(1)])
+        elif content and content.group(1) in self.provider.files:
+            data = self.provider.files[content.group(1)]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.send_error_json(404, f"Unknown endpoint: {self.path}")
+
+    def log_message(self, format, *args):
+        if self.quiet:
+            return
+        print(f"{self.command} {self.path} -> {args[1] if len(args) > 1 else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI chat and batch endpoints")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--batch-delay", type=float, default=2.0, help="Seconds before a submitted batch completes")
+    parser.add_argument("--stream-delay", type=float, default=0.02, help="Seconds between streamed chunks")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds each chat request takes")
+    parser.add_argument("--rpm", type=int, default=0, help="Chat requests allowed per minute before 429s (0: no limit)")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="Concurrent chat requests allowed before 429s (0: no limit)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of chat requests answered with a 503")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After seconds sent with 429s (default: none)")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of chat requests that take --slow-latency seconds")
+    parser.add_argument("--slow-latency", type=float, default=30.0, help="Seconds a slow chat request takes (default 30)")
+    parser.add_argument("--batch-error-rate", type=float, default=0.0, help="Share of batch requests that fail into the error file")
+    parser.add_argument("--batch-status", choices=["completed", "failed", "expired", "cancelled"], default="completed",
+                        help="How batches end (default: completed)")
+    parser.add_argument("--quiet", action="store_true", help="Don't log every request")
+    args = parser.parse_args()
+
+    Handler.provider = FakeProvider(args.batch_delay, args.stream_delay, args.latency, args.rpm, args.max_concurrent,
+                                    args.error_rate, args.retry_after, args.slow_rate, args.slow_latency,
+                                    args.batch_error_rate, args.batch_status)
+    Handler.quiet = args.quiet
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"Stand-in provider on http://{args.host}:{args.port}/v1 (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Stats: {dict(Handler.provider.stats)}")
+
+if __name__ == "__main__":
+    main()
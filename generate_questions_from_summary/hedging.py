@@ -0,0 +1,252 @@
+import asyncio
+import collections
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+from dotenv import load_dotenv
+
+from providers import chat
+from rate_limit import RequestTicket, current_ticket
+
+load_dotenv()
+
+# Latencies of successful calls per (provider, points per request), and per-provider counts for the end-of-run report
+_latencies = {}
+_effective = collections.defaultdict(list)
+_counts = collections.defaultdict(collections.Counter)
+# Blocking requests beyond one per call that are still running: duplicates and abandoned losers
+_extra = set()
+_lock = threading.Lock()
+
+# How often a waiting call rechecks whether its latest request is on the wire and how long it has been there
+POLL_SECONDS = 0.1
+
+
+def get_hedge_percentile():
+    """Return the latency percentile after which a duplicate request is sent (LLM_HEDGE_PERCENTILE, default 0 = off)"""
+    return float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))
+
+def get_hedge_provider(provider):
+    """Return the provider that gets the duplicate (LLM_HEDGE_PROVIDER, default: the same provider)"""
+    return os.getenv("LLM_HEDGE_PROVIDER") or provider
+
+def get_hedge_min_samples():
+    """Return how many latencies must be seen before the percentile is used (LLM_HEDGE_MIN_SAMPLES, default 10)"""
+    return int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "10"))
+
+def get_hedge_initial_delay():
+    """Return the hedge delay in seconds before any latency has been seen (LLM_HEDGE_INITIAL_DELAY, default 20)"""
+    return float(os.getenv("LLM_HEDGE_INITIAL_DELAY", "20"))
+
+def get_hedge_max_duplicates():
+    """Return how many duplicates one call may send (LLM_HEDGE_MAX_DUPLICATES, default 6); each further one goes out
+    only when the request before it is overdue too, so they are rare unless the provider is having a bad time
+    """
+    return int(os.getenv("LLM_HEDGE_MAX_DUPLICATES", "6"))
+
+def get_hedge_max_extra():
+    """Return how many blocking duplicates and abandoned losers may be running at once before no more duplicates
+    are sent (LLM_HEDGE_MAX_EXTRA, default 32)
+    """
+    return int(os.getenv("LLM_HEDGE_MAX_EXTRA", "32"))
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+def record_latency(key, seconds):
+    """Remember how long a successful request was on the wire; the last 200 per key are kept"""
+    with _lock:
+        _latencies.setdefault(key, collections.deque(maxlen=200)).append(seconds)
+
+def hedge_delay(key):
+    """Seconds a request may be on the wire before its duplicate is sent: the configured percentile of recent latencies"""
+    with _lock:
+        seen = list(_latencies.get(key, ()))
+    if len(seen) >= get_hedge_min_samples():
+        return percentile(seen, get_hedge_percentile())
+    if seen:
+        # Too few to trust a percentile yet, but enough to tell a stuck request from a normal one
+        return min(get_hedge_initial_delay(), 3 * percentile(seen, 50))
+    return get_hedge_initial_delay()
+
+def next_wait(key, ticket):
+    """How long to wait before deciding on a duplicate: until the latest request has been on the wire for the hedge
+    delay, rechecked every POLL_SECONDS since the request may still be queued and the delay moves as latencies come in
+    """
+    if ticket.sent_at is None:
+        return POLL_SECONDS
+    return max(0.0, min(POLL_SECONDS, ticket.sent_at + hedge_delay(key) - time.monotonic()))
+
+def overdue(key, ticket):
+    """True once the request has been on the wire for longer than the hedge delay"""
+    return ticket.sent_at is not None and time.monotonic() - ticket.sent_at >= hedge_delay(key)
+
+
+def _finish(provider, start, winner, duplicates):
+    with _lock:
+        _effective[provider].append(time.monotonic() - start)
+        _counts[provider]["calls"] += 1
+        _counts[provider]["hedged"] += bool(duplicates)
+        _counts[provider]["duplicates"] += duplicates
+        _counts[provider]["won_by_duplicate"] += winner == "duplicate"
+
+def _backup_call(provider, prompt, send, n_points):
+    """The duplicate: send() again, or the same prompt to the fallback provider"""
+    fallback = get_hedge_provider(provider)
+    if fallback == provider:
+        return (provider, n_points), send
+    return (fallback, n_points), lambda: chat(fallback, prompt, n_points=n_points)
+
+def _record(key, ticket):
+    # Replies served from the cache never went on the wire and say nothing about latency
+    if ticket.sent_at is not None:
+        record_latency(key, time.monotonic() - ticket.sent_at)
+
+def _start(key, send, ticket):
+    """Run send() on its own daemon thread with `ticket` as its current_ticket and return a Future for it.
+    A loser that can't be interrupted keeps running there without holding up the caller or the interpreter's exit.
+    """
+    future = Future()
+
+    def run():
+        current_ticket.set(ticket)
+        try:
+            result = send()
+            # A loser that was abandoned would skew the delay towards the very tail it was meant to cut
+            if not ticket.abandoned:
+                _record(key, ticket)
+            future.set_result(result)
+        except BaseException as e:
+            future.set_exception(e)
+    threading.Thread(target=run, daemon=True, name=f"hedge-{key[0]}").start()
+    return future
+
+def _forget(future):
+    with _lock:
+        _extra.discard(future)
+
+def _start_duplicate(key, send):
+    """Start a blocking duplicate unless LLM_HEDGE_MAX_EXTRA extra requests are already running.
+    Returns (future, ticket), or None when over the cap.
+    """
+    ticket = RequestTicket(duplicate=True)
+    with _lock:
+        if len(_extra) >= get_hedge_max_extra():
+            return None
+        future = _start(key, send, ticket)
+        _extra.add(future)
+    future.add_done_callback(_forget)
+    return future, ticket
+
+def _abandon(future, ticket):
+    """Stop waiting for a losing blocking request; it counts against LLM_HEDGE_MAX_EXTRA until it finishes"""
+    ticket.abandon()
+    with _lock:
+        _extra.add(future)
+    future.add_done_callback(_forget)
+
+async def _atimed(key, send, ticket):
+    # A task runs in its own copy of the context, so the ticket only applies to this request
+    current_ticket.set(ticket)
+    result = await send()
+    _record(key, ticket)
+    return result
+
+
+def hedge(provider, prompt, send, n_points=1):
+    """Return send()'s reply, racing duplicates when it is slow.
+    Once the request has been on the wire longer than the hedge delay (or has failed), the prompt goes out again to
+    the same or the fallback provider, up to LLM_HEDGE_MAX_DUPLICATES times, and the first good reply wins.
+    Time spent queued for rate limits doesn't count, and duplicates skip the concurrency limit. A blocking SDK call
+    can't be interrupted, so a loser already sent is abandoned: it gives back its concurrency slot and finishes in
+    the background, where its reply only lands in the cache.
+    """
+    if get_hedge_percentile() <= 0:
+        return send()
+    key = (provider, n_points)
+    start = time.monotonic()
+    backup_key, backup_send = _backup_call(provider, prompt, send, n_points)
+    latest = RequestTicket()
+    pending = {_start(key, send, latest): ("primary", latest)}
+    duplicates, error = 0, None
+    try:
+        while pending:
+            can_duplicate = duplicates < get_hedge_max_duplicates()
+            timeout = next_wait(key, latest) if can_duplicate else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                role, _ticket = pending.pop(future)
+                if future.exception() is None:
+                    _finish(provider, start, role, duplicates)
+                    return future.result()
+                error = error or future.exception()
+            if can_duplicate and (done or overdue(key, latest)):
+                started = _start_duplicate(backup_key, backup_send)
+                if started is not None:
+                    duplicates += 1
+                    future, latest = started
+                    pending[future] = ("duplicate", latest)
+                elif not pending:
+                    break
+        raise error
+    finally:
+        for future, (_role, ticket) in pending.items():
+            _abandon(future, ticket)
+
+async def ahedge(provider, prompt, send, n_points=1):
+    """hedge() for a coroutine function send(); losing requests are cancelled, closing their connections"""
+    if get_hedge_percentile() <= 0:
+        return await send()
+    key = (provider, n_points)
+    start = time.monotonic()
+    backup_key, backup_send = _backup_call(provider, prompt, send, n_points)
+    if backup_key[0] != provider:
+        # Another provider's chat() blocks, so the duplicate runs on a worker thread (which inherits the ticket)
+        blocking_send = backup_send
+        backup_send = lambda: asyncio.to_thread(blocking_send)
+    latest = RequestTicket()
+    pending = {asyncio.ensure_future(_atimed(key, send, latest)): ("primary", latest)}
+    duplicates, error = 0, None
+    try:
+        while pending:
+            can_duplicate = duplicates < get_hedge_max_duplicates()
+            timeout = next_wait(key, latest) if can_duplicate else None
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                role, _ticket = pending.pop(task)
+                if task.exception() is None:
+                    _finish(provider, start, role, duplicates)
+                    return task.result()
+                error = error or task.exception()
+            if can_duplicate and (done or overdue(key, latest)):
+                duplicates += 1
+                latest = RequestTicket(duplicate=True)
+                pending[asyncio.ensure_future(_atimed(backup_key, backup_send, latest))] = ("duplicate", latest)
+        raise error
+    finally:
+        for task, (_role, ticket) in pending.items():
+            ticket.abandon()
+            task.cancel()
+
+def report_hedging():
+    """Print per-provider hedging counts and the p50/p99 latency callers saw"""
+    with _lock:
+        counts = {provider: dict(counter) for provider, counter in _counts.items()}
+        effective = {provider: list(seconds) for provider, seconds in _effective.items()}
+    for provider in sorted(counts):
+        count, seconds = counts[provider], effective.get(provider)
+        if not seconds:
+            continue
+        print(f"{provider}: hedged {count['hedged']} of {count['calls']} calls with {count['duplicates']} duplicate(s), "
+              f"{count['won_by_duplicate']} answered by a duplicate; "
+              f"p50 {percentile(seconds, 50):.1f}s, p99 {percentile(seconds, 99):.1f}s")
+    with _lock:
+        extra = len(_extra)
+    if extra:
+        print(f"{extra} abandoned or duplicate request(s) still running; they end with the process")
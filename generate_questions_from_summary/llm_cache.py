@@ -0,0 +1,253 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_MODES = ["on", "readonly", "off"]
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".llm_cache.sqlite")
+DEFAULT_TTL_DAYS = 30
+DEFAULT_MAX_MB = 256
+# Eviction trims the cache to this share of max_bytes, so the next one is many writes away
+EVICT_TO = 0.9
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class CacheMiss(LookupError):
+    """Raised in readonly mode when a request is not in the cache"""
+
+
+def get_cache_mode():
+    """Return LLM_CACHE: on (default), readonly (serve hits, fail on misses, never write) or off"""
+    mode = os.getenv("LLM_CACHE", "on").lower()
+    if mode not in CACHE_MODES:
+        raise ValueError(f"LLM_CACHE must be one of {', '.join(CACHE_MODES)}, got {mode!r}")
+    return mode
+
+def get_default_cache_path():
+    """Return the cache file from LLM_CACHE_PATH, defaulting to .llm_cache.sqlite next to the scripts"""
+    return os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH)
+
+def get_default_ttl():
+    """Return the entry lifetime in seconds from LLM_CACHE_TTL_DAYS (default 30; 0 keeps entries forever)"""
+    return float(os.getenv("LLM_CACHE_TTL_DAYS", DEFAULT_TTL_DAYS)) * 86400
+
+def get_default_max_bytes():
+    """Return the cache size limit in bytes from LLM_CACHE_MAX_MB (default 256 MB)"""
+    return int(float(os.getenv("LLM_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024)
+
+
+class LLMCache:
+    """Model replies in SQLite, keyed by a hash of provider, model, prompt and sampling parameters.
+    Reads refresh an entry's last-used time, so eviction drops the least recently used replies first.
+    The total size is counted once and then kept up to date by this process's writes, so a write only triggers
+    eviction once the cache looks over max_bytes; each run ends with a full evict() that also drops expired entries.
+    Thread-safe; one connection is shared by all threads of the process.
+    """
+
+    def __init__(self, path=None, ttl=None, max_bytes=None, readonly=False):
+        self.path = path or get_default_cache_path()
+        self.ttl = get_default_ttl() if ttl is None else ttl
+        self.max_bytes = get_default_max_bytes() if max_bytes is None else max_bytes
+        self.readonly = readonly
+        self.hits = self.misses = self.writes = self.evictions = 0
+        # Total reply bytes as last counted, adjusted by this process's writes; None until first needed
+        self._total = None
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS replies (key TEXT PRIMARY KEY, provider TEXT, model TEXT, "
+            "response TEXT, size INTEGER, created REAL, last_used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS replies_last_used ON replies (last_used)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)")
+        self._db.commit()
+
+    def key(self, provider, model, prompt, **params):
+        """Hash everything that changes the reply: provider, model, full prompt, temperature, max_tokens, output mode"""
+        payload = json.dumps({"provider": provider, "model": model, "prompt": prompt, "params": params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached reply for a key, or None on a miss (expired entries count as misses)"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT response, created, size FROM replies WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl and row[1] < now - self.ttl:
+                if not self.readonly:
+                    self._db.execute("DELETE FROM replies WHERE key = ?", (key,))
+                    self._db.commit()
+                    if self._total is not None:
+                        self._total -= row[2]
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if not self.readonly:
+                self._db.execute("UPDATE replies SET last_used = ? WHERE key = ?", (now, key))
+                self._db.commit()
+            return row[0]
+
+    def put(self, key, provider, model, response):
+        """Store a reply and evict old entries if the cache grew past max_bytes (no-op when readonly)"""
+        if self.readonly:
+            return
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            if self._total is None:
+                self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM replies").fetchone()[0]
+            replaced = self._db.execute("SELECT size FROM replies WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO replies VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, model, response, size, now, now),
+            )
+            self._db.commit()
+            self.writes += 1
+            self._total += size - (replaced[0] if replaced else 0)
+            full = self._total > self.max_bytes
+        if full:
+            self.evict()
+
+    def size(self):
+        """Return (entries, total reply bytes)"""
+        with self._lock:
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM replies").fetchone()
+        return count, total
+
+    def evict(self):
+        """Drop expired entries, then, if the cache is over max_bytes, least recently used ones until it is back
+        under EVICT_TO of it. Returns the number removed.
+        """
+        removed = 0
+        with self._lock:
+            if self.ttl:
+                removed += self._db.execute("DELETE FROM replies WHERE created < ?", (time.time() - self.ttl,)).rowcount
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM replies").fetchone()[0]
+            if total > self.max_bytes:
+                rows = self._db.execute("SELECT key, size FROM replies ORDER BY last_used").fetchall()
+                stale = []
+                for key, size in rows:
+                    if total <= self.max_bytes * EVICT_TO:
+                        break
+                    stale.append((key,))
+                    total -= size
+                self._db.executemany("DELETE FROM replies WHERE key = ?", stale)
+                removed += len(stale)
+            self._db.commit()
+            self._total = total
+        self.evictions += removed
+        return removed
+
+    def load_stats(self):
+        """Return the hit/miss counters accumulated over all recorded runs"""
+        with self._lock:
+            return dict(self._db.execute("SELECT name, value FROM stats").fetchall())
+
+    def record_stats(self):
+        """Add this process's counters to the persisted totals and reset them"""
+        counters = {"hits": self.hits, "misses": self.misses, "writes": self.writes, "evictions": self.evictions}
+        with self._lock:
+            for name, value in counters.items():
+                self._db.execute(
+                    "INSERT INTO stats VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                    (name, value),
+                )
+            self._db.execute(
+                "INSERT OR REPLACE INTO stats VALUES ('last_run_hits', ?), ('last_run_misses', ?)",
+                (self.hits, self.misses),
+            )
+            self._db.commit()
+        self.hits = self.misses = self.writes = self.evictions = 0
+
+    def clear(self):
+        """Remove every cached reply and the counters"""
+        with self._lock:
+            self._db.execute("DELETE FROM replies")
+            self._db.execute("DELETE FROM stats")
+            self._db.commit()
+            self._total = 0
+            self._db.execute("VACUUM")
+
+
+def get_llm_cache():
+    """Return the process-wide cache configured by LLM_CACHE*, or None when LLM_CACHE=off"""
+    global _cache
+    mode = get_cache_mode()
+    if mode == "off":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache(readonly=mode == "readonly")
+    return _cache
+
+def cache_lookup(provider, model, prompt, params):
+    """Return (cache, key, cached reply or None); raises CacheMiss on a miss in readonly mode"""
+    cache = get_llm_cache()
+    if cache is None:
+        return None, None, None
+    key = cache.key(provider, model, prompt, **params)
+    reply = cache.get(key)
+    if reply is None and cache.readonly:
+        raise CacheMiss(f"{provider}/{model} reply not in the LLM cache (LLM_CACHE=readonly)")
+    return cache, key, reply
+
+def hit_rate(hits, misses):
+    """Return the hit rate as a percentage"""
+    total = hits + misses
+    return 100.0 * hits / total if total else 0.0
+
+def report_run():
+    """Print this run's hit/miss counters and add them to the persisted totals; then apply the TTL and size limit
+    once for the whole run
+    """
+    cache = get_llm_cache()
+    if cache is None:
+        return
+    print(f"LLM cache: {cache.hits} hits, {cache.misses} misses ({hit_rate(cache.hits, cache.misses):.1f}% hit rate)"
+          + (" [readonly]" if cache.readonly else ""))
+    if not cache.readonly:
+        cache.evict()
+    cache.record_stats()
+
+def print_stats(cache):
+    """Print cache size and hit rates"""
+    count, total = cache.size()
+    stats = cache.load_stats()
+    hits, misses = stats.get("hits", 0), stats.get("misses", 0)
+    last_hits, last_misses = stats.get("last_run_hits", 0), stats.get("last_run_misses", 0)
+    print(f"LLM cache: {cache.path}")
+    print(f"  Entries:   {count} ({total / (1024 * 1024):.2f} MB of {cache.max_bytes / (1024 * 1024):.0f} MB)")
+    print(f"  Last run:  {last_hits} hits, {last_misses} misses ({hit_rate(last_hits, last_misses):.1f}% hit rate)")
+    print(f"  All runs:  {hits} hits, {misses} misses ({hit_rate(hits, misses):.1f}% hit rate), "
+          f"{stats.get('evictions', 0)} evicted")
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or maintain the LLM response cache")
+    parser.add_argument("command", choices=["stats", "evict", "clear"], help="stats: show hit rate; evict: enforce TTL and size limit; clear: delete everything")
+    parser.add_argument("--path", default=get_default_cache_path(), help="Cache file (default: LLM_CACHE_PATH or .llm_cache.sqlite)")
+    parser.add_argument("--max-mb", type=float, default=None, help="Size limit in MB (default: LLM_CACHE_MAX_MB or 256)")
+    args = parser.parse_args()
+
+    max_bytes = int(args.max_mb * 1024 * 1024) if args.max_mb is not None else None
+    cache = LLMCache(args.path, max_bytes=max_bytes)
+    if args.command == "stats":
+        print_stats(cache)
+    elif args.command == "evict":
+        print(f"Evicted {cache.evict()} entries")
+    else:
+        cache.clear()
+        print(f"Cleared {cache.path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+import build_comparison_table
+import mcq_processor_from_summary_gemini as gemini_processor
+import mcq_processor_from_summary_mistral as mistral_processor
+import mcq_processor_from_summary_openai as openai_processor
+from hedging import report_hedging
+from llm_cache import report_run
+from providers import PROVIDERS
+from rate_limit import report_limits
+
+load_dotenv()
+
+# Each provider's generate-and-save step (journal, .jsonl, .txt and mapping) and the key it needs
+GENERATORS = {
+    "openai": openai_processor.generate_mcqs_for_points,
+    "gemini": gemini_processor.generate_mcqs_for_points,
+    "mistral": mistral_processor.generate_mcqs_for_points,
+}
+API_KEYS = {"openai": "OPENAI_API_KEY", "gemini": "GEMINI_API_KEY", "mistral": "MISTRAL_API_KEY"}
+
+
+def configured_providers():
+    """Return the providers whose API key is set in .env, in the usual order"""
+    return [provider for provider in PROVIDERS if os.getenv(API_KEYS[provider])]
+
+def run_provider(provider, points):
+    """Generate and save one provider's MCQs; returns (records or exception, seconds taken)"""
+    start = time.perf_counter()
+    try:
+        result = GENERATORS[provider](points)
+    except Exception as e:
+        result = e
+    return result, time.perf_counter() - start
+
+def fan_out(points, providers):
+    """Run every provider on the same points at the same time, one thread each (each keeps its own requests
+    in flight and has its own rate limits), so the run takes as long as the slowest provider.
+    Returns {provider: (records or exception, seconds)}.
+    """
+    with ThreadPoolExecutor(max_workers=len(providers)) as pool:
+        futures = {provider: pool.submit(run_provider, provider, points) for provider in providers}
+        return {provider: future.result() for provider, future in futures.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate summary MCQs with every configured provider at once, then build the comparison table")
+    parser.add_argument("--providers", nargs="+", choices=PROVIDERS, default=None,
+                        help="Providers to run (default: those with an API key in .env)")
+    parser.add_argument("--pdf", default="kinematics_and_dynamics.pdf", help="Summary PDF (default: kinematics_and_dynamics.pdf)")
+    parser.add_argument("--no-table", action="store_true", help="Skip building comparison_table.md/.html")
+    args = parser.parse_args()
+
+    providers = args.providers or configured_providers()
+    if not providers:
+        print("ERROR: No provider configured; set OPENAI_API_KEY, GEMINI_API_KEY and/or MISTRAL_API_KEY in the .env file")
+        return
+
+    try:
+        # Extracted once and shared, so every provider sees exactly the same points
+        pdf_text = openai_processor.extract_text_from_pdf(args.pdf)
+        if not pdf_text:
+            print("Error: Could not extract text from PDF")
+            return
+        points = openai_processor.extract_numbered_points(pdf_text)
+        if not points:
+            print("No numbered points were found in the PDF text.")
+            return
+
+        print(f"Generating MCQs for {len(points)} points with {', '.join(providers)} at the same time...\n")
+        start = time.perf_counter()
+        results = fan_out(points, providers)
+        elapsed = time.perf_counter() - start
+
+        for provider, (result, seconds) in results.items():
+            if isinstance(result, Exception):
+                print(f"{provider}: failed after {seconds:.1f}s: {result}")
+            else:
+                print(f"{provider}: {len(result)} MCQs in {seconds:.1f}s")
+        print(f"All providers finished in {elapsed:.1f}s "
+              f"(one after another: about {sum(seconds for _, seconds in results.values()):.1f}s)\n")
+
+        failed = [provider for provider, (result, _) in results.items() if isinstance(result, Exception)]
+        if not args.no_table and len(failed) < len(results):
+            # Output files left by an earlier run of a provider that failed or wasn't run must not pass as current
+            stale = {provider: "not run" for provider in PROVIDERS if provider not in results}
+            stale.update({provider: "failed in this run" for provider in failed})
+            build_comparison_table.main(stale)
+        if failed:
+            sys.exit(1)
+    finally:
+        report_run()
+        report_limits()
+        report_hedging()
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,18 @@
 import os
 import re
+import sys
 import pdfplumber
 from dotenv import load_dotenv
 
-load_dotenv()
-
-# Gemini SDK
-try:
-    import google.generativeai as genai
-except Exception as e:
-    genai = None
+from hedging import hedge, report_hedging
+from llm_cache import CacheMiss, report_run
+from mcq_records import (batch_points, generate_batch_records, generate_in_threads, generate_records, get_batch_size,
+                         get_concurrency, get_stream_mode, live_writer, save_records, streamed)
+from point_journal import IncompleteRun, PointJournal
+from providers import default_model, gemini_chat, gemini_chat_stream, get_gemini_model
+from rate_limit import report_limits
 
-def get_gemini_model():
-    return os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
-
-def configure_gemini():
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise RuntimeError("GEMINI_API_KEY not set in environment")
-    if genai is None:
-        raise RuntimeError("google-generativeai package not installed. Install with: pip install google-generativeai")
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel(get_gemini_model())
+load_dotenv()
 
 def extract_text_from_pdf(pdf_path):
     text = ""
@@ -35,14 +26,6 @@ def extract_text_from_pdf(pdf_path):
                 text += page_text + "\n"
     return text
 
-def save_file(filename, content):
-    target_path = filename
-    if not os.path.isabs(target_path):
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        target_path = os.path.join(base_dir, target_path)
-    with open(target_path, 'w', encoding='utf-8') as f:
-        f.write(content)
-
 def extract_numbered_points(text):
     normalized = re.sub(r"\r\n?|\u2028", "\n", text)
     lines = normalized.split("\n")
@@ -93,55 +76,62 @@ def extract_numbered_points(text):
 
     return unique_points
 
-def generate_three_mcqs_with_gemini(model, point_text):
-    prompt = f"""You will write THREE distinct MCAT physics multiple-choice questions based on ONE point.
-Each question must be conceptual/theoretical (no calculations) and must test a DIFFERENT facet or ask from a UNIQUE angle. Do NOT paraphrase the same question.
-
-Point:
-{point_text}
-
-STRICT OUTPUT FORMAT FOR EACH MCQ (no extra blank lines, no markdown):
-Question text
-A. Answer choice 1 text
-B. Answer choice 2 text
-C. Answer choice 3 text
-D. Answer choice 4 text
-Answer: [Letter]. [Full correct answer text]
-Explanation: [1-3 sentences focusing on MCAT-relevant concept]
-
-CRITICAL CONSTRAINTS:
-- Produce EXACTLY THREE MCQs.
-- Each MCQ must assess a different perspective (definition vs. application vs. discrimination, etc.).
-- Ensure exactly four options A–D; only one option is indisputably correct.
-- Use precise MCAT-appropriate physics terminology.
-
-SEPARATION:
-- Separate the three MCQs with a single line containing only: ---
-"""
-    resp = model.generate_content(prompt)
-    raw = resp.text.strip() if hasattr(resp, 'text') and resp.text else str(resp)
-
-    parts = []
-    buf = []
-    for line in raw.splitlines():
-        if line.strip() == '---':
-            if buf:
-                parts.append("\n".join(buf).strip())
-                buf = []
-        else:
-            buf.append(line)
-    if buf:
-        parts.append("\n".join(buf).strip())
-    if len(parts) != 3:
-        candidates = [blk.strip() for blk in raw.split("\n\n\n") if blk.strip()]
-        if len(candidates) == 3:
-            parts = candidates
-    return [p.strip() for p in parts[:3]]
+def gemini_json_chat(prompt, n_points=1):
+    """gemini_chat(), hedged with a duplicate request when slow (LLM_HEDGE_PERCENTILE)"""
+    return hedge("gemini", prompt, lambda: gemini_chat(prompt), n_points)
+
+def generate_mcqs_with_gemini(batch, on_record=None):
+    """Ask Gemini in JSON mode, over the shared model client, for three MCQs about each (point_id, text) in a batch.
+    With on_record, the reply for a single point is streamed and each question is passed to it on arrival.
+    Returns {point_id: (records, errors)}.
+    """
+    if on_record is not None and len(batch) == 1:
+        p_idx, point = batch[0]
+        return {p_idx: generate_records(streamed(gemini_chat_stream, p_idx, point, on_record), p_idx, point)}
+    return generate_batch_records(gemini_json_chat, gemini_json_chat, batch)
+
+def generate_mcqs_for_points(points):
+    """Generate MCQs for every point not yet in the journal, several requests at a time (MCQ_CONCURRENCY),
+    and save the Gemini outputs and mapping. Returns the saved records.
+    """
+    # Fail fast on a missing key or SDK; the model client is then reused for every point
+    get_gemini_model()
+    journal = PointJournal('gemini', default_model('gemini'))
+    journal.report_resume(points)
+    concurrency = get_concurrency()
+    batch_size = get_batch_size()
+    on_record = None
+    if get_stream_mode():
+        # Streaming is about time to the first question, so each point gets its own request
+        batch_size = 1
+        on_record = live_writer('gemini')
+    print(f"Found {len(points)} points. Generating MCQs with Gemini, {batch_size} point(s) per request, "
+          f"with up to {concurrency} concurrent request(s)" + (", streaming..." if on_record else "..."))
+
+    batches = batch_points(points, batch_size, done=journal)
+    for batch, results in generate_in_threads(lambda batch: generate_mcqs_with_gemini(batch, on_record), batches, concurrency):
+        if isinstance(results, CacheMiss):
+            # LLM_CACHE=readonly can't reproduce this run; stop before anything is overwritten
+            raise results
+        if isinstance(results, Exception):
+            print(f"Error generating MCQs for points {batch[0][0]}-{batch[-1][0]}: {results}")
+            continue
+        for p_idx, point in batch:
+            point_records, errors = results[p_idx]
+            for error in errors:
+                print(f"Point {p_idx}: rejected {error}")
+            journal.record(point, point_records, errors)
+
+    journal.require_complete(points)
+    records = journal.records(points)
+    save_records(records, 'gemini', 'points_to_questions_gemini.md')
+    journal.finish(points)
+    print(f"Completed: {len(records)} MCQs -> summary_mcqs_gemini.jsonl, summary_questions_gemini.txt")
+    print("Mapping saved to points_to_questions_gemini.md\n")
+    return records
 
 def task_generate_mcqs_from_summary():
     print("Task: Generating 3 MCQs per point with Gemini...")
-    model = configure_gemini()
-
     pdf_text = extract_text_from_pdf('kinematics_and_dynamics.pdf')
     if not pdf_text:
         print("Error: Could not extract text from PDF")
@@ -151,59 +141,26 @@ def task_generate_mcqs_from_summary():
     if not points:
         print("No numbered points were found in the PDF text.")
         return
-
-    print(f"Found {len(points)} points. Generating MCQs...")
-
-    outputs = []
-    mapping_rows = []  # (point_text, [ids])
-    for p_idx, point in enumerate(points, start=1):
-        try:
-            mcqs = generate_three_mcqs_with_gemini(model, point)
-            letters = ['a', 'b', 'c']
-            assigned = []
-            for j, mcq in enumerate(mcqs):
-                if not mcq.strip():
-                    continue
-                lines = mcq.splitlines()
-                q_idx = None
-                for i, ln in enumerate(lines):
-                    if ln.strip():
-                        q_idx = i
-                        break
-                if q_idx is not None:
-                    label = f"{p_idx}{letters[j]}"
-                    lines[q_idx] = f"{label}. {lines[q_idx].lstrip()}"
-                outputs.append("\n".join(lines).strip())
-                assigned.append(f"{p_idx}{letters[j]}")
-            if assigned:
-                mapping_rows.append((point, assigned))
-        except Exception as e:
-            print(f"Error generating MCQs for a point: {e}")
-            continue
-
-    final_output = "\n\n".join(outputs)
-    save_file('summary_questions_gemini.txt', final_output)
-
-    md_lines = ["| Source Point | Question ID(s) |", "|---|---|"]
-    for pt, ids in mapping_rows:
-        safe_point = pt.replace("|", "\\|")
-        md_lines.append(f"| {safe_point} | {', '.join(ids)} |")
-    save_file('points_to_questions_gemini.md', "\n".join(md_lines))
-
-    print(f"Completed: {len(outputs)} MCQs -> summary_questions_gemini.txt")
-    print("Mapping saved to points_to_questions_gemini.md\n")
+    generate_mcqs_for_points(points)
 
 def main():
     print("Starting MCQ generation with Gemini...\n")
     try:
         task_generate_mcqs_from_summary()
-        print("Done. Output: summary_questions_gemini.txt")
+        print("Done. Output: summary_mcqs_gemini.jsonl")
+    except (CacheMiss, IncompleteRun) as e:
+        print(f"Stopped without writing any output: {e}")
+        sys.exit(1)
     except Exception as e:
         print(f"An error occurred: {str(e)}")
         print("\nPlease check:")
         print("1. GEMINI_API_KEY is set; package google-generativeai is installed")
         print("2. You have an active internet connection")
         print("3. The PDF file exists and is readable")
+    finally:
+        report_run()
+        report_limits()
+        report_hedging()
 
 if __name__ == "__main__":
     main()
@@ -1,13 +1,20 @@
+import asyncio
 import os
 import re
+import sys
+import time
 import pdfplumber
 from dotenv import load_dotenv
-from openai import OpenAI
 
-load_dotenv()
+from hedging import ahedge, hedge, report_hedging
+from llm_cache import CacheMiss, report_run
+from mcq_records import (MAX_TOKENS_PER_POINT, agenerate_batch_records, agenerate_records, astreamed, batch_points,
+                         generate_records, get_batch_size, get_concurrency, get_stream_mode, live_writer, save_records)
+from point_journal import IncompleteRun, PointJournal
+from providers import close_async_openai_client, openai_chat, openai_chat_async, openai_chat_stream_async
+from rate_limit import report_limits
 
-# Configure OpenAI API
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+load_dotenv()
 
 def get_openai_model():
     """Return the configured OpenAI model, defaulting to a top-tier paid model."""
@@ -98,67 +105,79 @@ def extract_numbered_points(text):
 
     return unique_points
 
-def generate_three_mcat_mcqs_for_point(point_text):
-    """Generate three distinct MCAT-style MCQs (each with 4 choices, answer, explanation) for a single point.
-    Returns a list of three MCQ strings. Ensures distinct question angles via prompt constraints.
+def openai_json_chat(prompt):
+    """Send a prompt in structured-output mode over the shared client and return the JSON reply.
+    A slow call is hedged with a duplicate request (LLM_HEDGE_PERCENTILE); the first reply wins.
     """
-    prompt = f"""You will write THREE distinct MCAT physics multiple-choice questions based on ONE point.
-Each question must be conceptual/theoretical (no calculations) and must test a DIFFERENT facet or ask from a UNIQUE angle. Do NOT paraphrase the same question.
+    return hedge("openai", prompt, lambda: openai_chat(prompt, get_openai_model()))
 
-Point:
-{point_text}
-
-STRICT OUTPUT FORMAT FOR EACH MCQ (no extra blank lines, no markdown):
-Question text
-A. Answer choice 1 text
-B. Answer choice 2 text
-C. Answer choice 3 text
-D. Answer choice 4 text
-Answer: [Letter]. [Full correct answer text]
-Explanation: [1-3 sentences focusing on MCAT-relevant concept]
+async def openai_json_chat_async(prompt):
+    """openai_json_chat() on the shared async client; the losing request of a hedged pair is cancelled"""
+    return await ahedge("openai", prompt, lambda: openai_chat_async(prompt, get_openai_model()))
 
-CRITICAL CONSTRAINTS:
-- Produce EXACTLY THREE MCQs.
-- Each MCQ must assess a different perspective (definition vs. application vs. discrimination, etc.).
-- Ensure exactly four options A–D; only one option is indisputably correct.
-- Use precise MCAT-appropriate physics terminology.
+async def openai_batch_chat_async(prompt, n_points):
+    """openai_json_chat_async() for a prompt covering n_points points: batch schema and a larger output budget"""
+    return await ahedge("openai", prompt, lambda: openai_chat_async(prompt, get_openai_model(), schema="mcq_batch",
+                                                                    max_tokens=MAX_TOKENS_PER_POINT * n_points),
+                        n_points)
 
-SEPARATION:
-- Separate the three MCQs with a single line containing only: ---
-"""
-    response = client.chat.completions.create(
-        model=get_openai_model(),
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=1400,
-        temperature=0.45
-    )
-    raw = response.choices[0].message.content.strip()
-
-    # Split on separator lines containing only ---
-    parts = []
-    buf = []
-    for line in raw.splitlines():
-        if line.strip() == '---':
-            if buf:
-                parts.append("\n".join(buf).strip())
-                buf = []
-        else:
-            buf.append(line)
-    if buf:
-        parts.append("\n".join(buf).strip())
+def openai_json_chat_stream(prompt):
+    """openai_json_chat() as an async stream of reply pieces"""
+    return openai_chat_stream_async(prompt, get_openai_model())
 
-    # Fallback: if not exactly 3, attempt a simple heuristic split by double blank lines
-    if len(parts) != 3:
-        candidates = [blk.strip() for blk in raw.split("\n\n\n") if blk.strip()]
-        if len(candidates) == 3:
-            parts = candidates
+def generate_three_mcat_mcqs_for_point(point_text, point_id):
+    """Generate three distinct MCAT-style MCQs (each with 4 choices, answer, explanation) for a single point.
+    Returns (records, errors); malformed questions are rejected here rather than when the report is built.
+    """
+    return generate_records(openai_json_chat, point_id, point_text)
 
-    # Trim and return up to 3 items
-    return [p.strip() for p in parts[:3]]
+async def generate_all_points(points, concurrency, batch_size=1, on_record=None, journal=None):
+    """Generate MCQs for every point, batch_size points per request, with at most `concurrency` requests in flight.
+    With on_record, replies are streamed one point per request and each question is passed to it on arrival.
+    With a journal, points already in it are skipped and each point is journaled as soon as it is done.
+    Returns {point_id: (records, errors) or exception} for the points generated.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    batches = batch_points(points, batch_size, done=journal or ())
+    total = sum(len(batch) for batch in batches)
+    done = 0
+
+    async def generate(batch):
+        nonlocal done
+        async with semaphore:
+            try:
+                if on_record is not None:
+                    p_idx, point = batch[0]
+                    call = astreamed(openai_json_chat_stream, p_idx, point, on_record)
+                    results = {p_idx: await agenerate_records(call, p_idx, point)}
+                else:
+                    results = await agenerate_batch_records(openai_json_chat_async, openai_batch_chat_async, batch)
+            except CacheMiss:
+                # LLM_CACHE=readonly can't reproduce this run; stop before anything is overwritten
+                raise
+            except Exception as e:
+                results = {p_idx: e for p_idx, _ in batch}
+        if journal is not None:
+            for p_idx, point in batch:
+                if not isinstance(results[p_idx], Exception):
+                    journal.record(point, *results[p_idx])
+        done += len(batch)
+        print(f"[{done}/{total}] points {batch[0][0]}-{batch[-1][0]} finished")
+        return results
+
+    results = {}
+    try:
+        for batch_results in await asyncio.gather(*(generate(batch) for batch in batches)):
+            results.update(batch_results)
+    finally:
+        # The client's connections die with this event loop; the next asyncio.run() gets a new one
+        await close_async_openai_client()
+    return results
 
 def task1_generate_mcqs_from_summary():
-    """Generate three MCQs per numbered point and save to summary_questions_openai.txt with global numbering.
-    Also writes a point→question mapping table to points_to_questions.md.
+    """Generate three MCQs per numbered point and save them to summary_mcqs_openai.jsonl with global labels.
+    Also writes summary_questions_openai.txt and the point→question mapping table points_to_questions.md.
+    Finished points are journaled to journal_openai.jsonl, so an interrupted run resumes where it stopped.
     """
     print("Task 1: Generating 3 MCQs per numbered point from PDF...")
 
@@ -171,56 +190,42 @@ def task1_generate_mcqs_from_summary():
     if not points:
         print("No numbered points were found in the PDF text.")
         return
+    return generate_mcqs_for_points(points)
 
-    print(f"Found {len(points)} numbered points. Generating MCQs...")
-
-    outputs = []
-    mapping_rows = []  # (point_text, [question_ids like 1a,1b,1c])
-    for p_idx, point in enumerate(points, start=1):
-        try:
-            mcqs = generate_three_mcat_mcqs_for_point(point)
-            assigned = []
-            letters = ['a', 'b', 'c']
-            for j, mcq in enumerate(mcqs):
-                if not mcq.strip():
-                    continue
-                lines = mcq.splitlines()
-                # find first non-empty line index
-                q_idx = None
-                for i, ln in enumerate(lines):
-                    if ln.strip():
-                        q_idx = i
-                        break
-                if q_idx is not None:
-                    label = f"{p_idx}{letters[j]}"
-                    lines[q_idx] = f"{label}. {lines[q_idx].lstrip()}"
-                numbered_mcq = "\n".join(lines).strip()
-                outputs.append(numbered_mcq)
-                assigned.append(f"{p_idx}{letters[j]}")
-            if assigned:
-                mapping_rows.append((point, assigned))
-        except Exception as e:
-            print(f"Error generating MCQs for a point: {e}")
+def generate_mcqs_for_points(points):
+    """Generate MCQs for every point not yet in the journal and save the OpenAI outputs and mapping.
+    Returns the saved records.
+    """
+    journal = PointJournal('openai', get_openai_model())
+    journal.report_resume(points)
+    concurrency = get_concurrency()
+    batch_size = get_batch_size()
+    on_record = None
+    if get_stream_mode():
+        # Streaming is about time to the first question, so each point gets its own request
+        batch_size = 1
+        on_record = live_writer('openai')
+    print(f"Found {len(points)} numbered points. Generating MCQs with OpenAI, {batch_size} point(s) per request, "
+          f"with up to {concurrency} concurrent request(s)" + (", streaming..." if on_record else "..."))
+
+    start = time.perf_counter()
+    results = asyncio.run(generate_all_points(points, concurrency, batch_size, on_record, journal))
+    for p_idx, result in sorted(results.items()):
+        if isinstance(result, Exception):
+            print(f"Error generating MCQs for point {p_idx}: {result}")
             continue
+        for error in result[1]:
+            print(f"Point {p_idx}: rejected {error}")
+    print(f"Generated MCQs for {len(results)} points in {time.perf_counter() - start:.1f}s")
 
-    # Join MCQs with a single blank line between items to keep readability
-    final_output = "\n\n".join(outputs)
-    save_questions('summary_questions_openai.txt', final_output)
-    
-    # Save mapping table (Markdown) for validation
-    md_lines = [
-        "| Source Point | Question ID(s) |",
-        "|---|---|",
-    ]
-    for pt, qnums in mapping_rows:
-        safe_point = pt.replace("|", "\\|")
-        md_lines.append(f"| {safe_point} | {', '.join(str(n) for n in qnums)} |")
-    mapping_md = "\n".join(md_lines)
-    save_questions('points_to_questions.md', mapping_md)
-
-    print(f"Task 1 completed: {len(outputs)} MCQs saved to summary_questions_openai.txt")
+    journal.require_complete(points)
+    records = journal.records(points)
+    save_records(records, 'openai', 'points_to_questions.md')
+    journal.finish(points)
+
+    print(f"Task 1 completed: {len(records)} MCQs saved to summary_mcqs_openai.jsonl and summary_questions_openai.txt")
     print("Mapping saved to points_to_questions.md\n")
-    return final_output
+    return records
 
 def task2_refine_questions(original_mcqs):
     """Task 2: Refine questions with same meaning and choices"""
@@ -248,15 +253,8 @@ D. Answer choice 4 text
 """
     
     # Get refined questions from OpenAI
-    response = client.chat.completions.create(
-        model=get_openai_model(),
-        messages=[
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=4000,
-        temperature=0.7
-    )
-    refined_mcqs = response.choices[0].message.content
+    # Plain-text reply through the shared client: rate limits, retries and the LLM cache apply
+    refined_mcqs = openai_chat(prompt, get_openai_model(), json_mode=False, max_tokens=4000, temperature=0.7)
     
     # Save to file
     save_questions('refined_summary_questions_openai.txt', refined_mcqs)
@@ -294,15 +292,7 @@ MCQs to process:
 
 Add correct answers and explanations for each question:"""
     
-    response_original = client.chat.completions.create(
-        model=get_openai_model(),
-        messages=[
-            {"role": "user", "content": prompt_original}
-        ],
-        max_tokens=4000,
-        temperature=0.7
-    )
-    original_with_answers = response_original.choices[0].message.content
+    original_with_answers = openai_chat(prompt_original, get_openai_model(), json_mode=False, max_tokens=4000, temperature=0.7)
     
     # Process refined questions  
     prompt_refined = f"""For each of the following refined MCAT preparation MCQs, add the correct answer and detailed explanation.
@@ -323,15 +313,7 @@ MCQs to process:
 
 Add correct answers and explanations for each question:"""
     
-    response_refined = client.chat.completions.create(
-        model=get_openai_model(),
-        messages=[
-            {"role": "user", "content": prompt_refined}
-        ],
-        max_tokens=4000,
-        temperature=0.7
-    )
-    refined_with_answers = response_refined.choices[0].message.content
+    refined_with_answers = openai_chat(prompt_refined, get_openai_model(), json_mode=False, max_tokens=4000, temperature=0.7)
     
     # Save updated files
     save_questions('summary_questions_openai.txt', original_with_answers)
@@ -342,7 +324,7 @@ Add correct answers and explanations for each question:"""
     return original_with_answers, refined_with_answers
 
 def main():
-    """Main entrypoint: generate one MCQ per numbered point and write to summary_questions_openai.txt."""
+    """Main entrypoint: generate three MCQs per numbered point and write them to summary_mcqs_openai.jsonl."""
     print("Starting MCQ generation from numbered points...\n")
 
     if not os.getenv("OPENAI_API_KEY"):
@@ -355,13 +337,20 @@ def main():
 
     try:
         task1_generate_mcqs_from_summary()
-        print("Done. Output: summary_questions_openai.txt")
+        print("Done. Output: summary_mcqs_openai.jsonl")
+    except (CacheMiss, IncompleteRun) as e:
+        print(f"Stopped without writing any output: {e}")
+        sys.exit(1)
     except Exception as e:
         print(f"An error occurred: {str(e)}")
         print("\nPlease check:")
         print("1. Your OpenAI API key is correctly set in the .env file")
         print("2. You have an active internet connection")
         print("3. The PDF file exists and is readable")
+    finally:
+        report_run()
+        report_limits()
+        report_hedging()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,469 @@
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# One MCQ as exchanged between stages and stored one per line in summary_mcqs_<provider>.jsonl:
+# {"id": "3b", "point_id": 3, "point": "...", "stem": "...", "choices": [4 strings], "answer": 0-3, "explanation": "..."}
+LETTERS = ["A", "B", "C", "D"]
+LABEL_LETTERS = ["a", "b", "c"]
+
+MCQ_JSON_PROMPT = """You will write THREE distinct MCAT physics multiple-choice questions based on ONE point.
+Each question must be conceptual/theoretical (no calculations) and must test a DIFFERENT facet or ask from a UNIQUE angle. Do NOT paraphrase the same question.
+
+Point:
+{point}
+
+Return ONLY a JSON object of this shape (no markdown, no commentary):
+{{"questions": [{{"stem": "Question text", "choices": ["choice 1", "choice 2", "choice 3", "choice 4"], "answer": 0, "explanation": "1-3 sentences focusing on MCAT-relevant concept"}}]}}
+
+CRITICAL CONSTRAINTS:
+- Produce EXACTLY THREE questions.
+- Each MCQ must assess a different perspective (definition vs. application vs. discrimination, etc.).
+- "choices" holds exactly four option texts, without "A." style prefixes; only one option is indisputably correct.
+- "answer" is the index (0-3) of the correct choice.
+- Use precise MCAT-appropriate physics terminology.
+"""
+
+MCQ_BATCH_PROMPT = """You will write THREE distinct MCAT physics multiple-choice questions for EACH of the numbered points below.
+Each question must be conceptual/theoretical (no calculations) and must test a DIFFERENT facet or ask from a UNIQUE angle. Do NOT paraphrase the same question.
+
+{points}
+
+Return ONLY a JSON object of this shape (no markdown, no commentary), with one entry per point:
+{{"points": [{{"point_id": 1, "questions": [{{"stem": "Question text", "choices": ["choice 1", "choice 2", "choice 3", "choice 4"], "answer": 0, "explanation": "1-3 sentences focusing on MCAT-relevant concept"}}]}}]}}
+
+CRITICAL CONSTRAINTS:
+- Produce EXACTLY THREE questions per point, each about that point only; "point_id" is the number after POINT.
+- Each MCQ must assess a different perspective (definition vs. application vs. discrimination, etc.).
+- "choices" holds exactly four option texts, without "A." style prefixes; only one option is indisputably correct.
+- "answer" is the index (0-3) of the correct choice.
+- Use precise MCAT-appropriate physics terminology.
+"""
+
+# Output budget per point; batched requests scale it by the number of points
+MAX_TOKENS_PER_POINT = 1400
+
+# JSON schema for providers with schema-constrained output (OpenAI structured outputs)
+MCQ_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "questions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "stem": {"type": "string"},
+                    "choices": {"type": "array", "items": {"type": "string"}},
+                    "answer": {"type": "integer", "enum": [0, 1, 2, 3]},
+                    "explanation": {"type": "string"},
+                },
+                "required": ["stem", "choices", "answer", "explanation"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["questions"],
+    "additionalProperties": False,
+}
+
+MCQ_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "points": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "point_id": {"type": "integer"},
+                    "questions": MCQ_SCHEMA["properties"]["questions"],
+                },
+                "required": ["point_id", "questions"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["points"],
+    "additionalProperties": False,
+}
+
+# "A." / "(b)" prefixes models sometimes keep on choice text
+CHOICE_PREFIX_PAT = re.compile(r"^\(?[A-Da-d][.)]\s+")
+
+
+def build_prompt(point_text):
+    """Prompt asking for three MCQs about one point as JSON"""
+    return MCQ_JSON_PROMPT.format(point=point_text)
+
+def get_stream_mode():
+    """Return True when MCQ_STREAM is set: stream replies and emit each question as soon as it arrives"""
+    return os.getenv("MCQ_STREAM", "0").lower() in ("1", "true", "yes", "on")
+
+def get_concurrency():
+    """Return how many requests a processor keeps in flight (MCQ_CONCURRENCY, default 8; 1 runs them one by one)"""
+    return max(1, int(os.getenv("MCQ_CONCURRENCY", "8")))
+
+def get_batch_size():
+    """Return how many points go into one request (MCQ_BATCH_SIZE, default 1 = one point per request)"""
+    return max(1, int(os.getenv("MCQ_BATCH_SIZE", "1")))
+
+def batch_points(points, size, done=()):
+    """Split points into lists of (point_id, text) of at most `size`, numbering points from 1.
+    Points in `done` (e.g. a PointJournal) are left out but keep their place in the numbering.
+    """
+    numbered = [(point_id, text) for point_id, text in enumerate(points, start=1) if text not in done]
+    return [numbered[i:i + size] for i in range(0, len(numbered), size)]
+
+def build_batch_prompt(batch):
+    """Prompt asking for three MCQs about each (point_id, text) in a batch, as one JSON reply"""
+    points = "\n\n".join(f"### POINT {point_id}\n{text}" for point_id, text in batch)
+    return MCQ_BATCH_PROMPT.format(points=points)
+
+def load_json_reply(raw):
+    """Decode a model's JSON reply"""
+    raw = (raw or "").strip()
+    # Tolerate ```json fences from providers without a strict JSON mode
+    fenced = re.match(r"^```(?:json)?\s*(.*?)\s*```$", raw, re.DOTALL)
+    if fenced:
+        raw = fenced.group(1)
+    return json.loads(raw)
+
+def parse_json_response(raw):
+    """Return the list of question objects in a model's JSON reply (bare list or {"questions": [...]})"""
+    data = load_json_reply(raw)
+    if isinstance(data, dict):
+        data = data.get("questions", [])
+    if not isinstance(data, list):
+        raise ValueError("expected a list of questions")
+    return data
+
+def validate_item(item):
+    """Check one generated question and return it normalized as {"stem", "choices", "answer", "explanation"}.
+    Raises ValueError naming the first problem found.
+    """
+    if not isinstance(item, dict):
+        raise ValueError("question is not an object")
+    stem = item.get("stem")
+    if not isinstance(stem, str) or not stem.strip():
+        raise ValueError("missing question stem")
+    choices = item.get("choices")
+    if not isinstance(choices, list) or len(choices) != 4:
+        raise ValueError("expected exactly four choices")
+    if not all(isinstance(choice, str) and choice.strip() for choice in choices):
+        raise ValueError("empty choice")
+    choices = [CHOICE_PREFIX_PAT.sub("", choice.strip()) for choice in choices]
+    if len({choice.lower() for choice in choices}) != 4:
+        raise ValueError("duplicate choices")
+    answer = item.get("answer")
+    if isinstance(answer, str) and answer.strip().upper()[:1] in LETTERS:
+        answer = LETTERS.index(answer.strip().upper()[:1])
+    if isinstance(answer, bool) or not isinstance(answer, int) or not 0 <= answer <= 3:
+        raise ValueError(f"answer must be an index 0-3, got {answer!r}")
+    explanation = item.get("explanation")
+    if not isinstance(explanation, str) or not explanation.strip():
+        raise ValueError("missing explanation")
+    return {"stem": stem.strip(), "choices": choices, "answer": answer, "explanation": explanation.strip()}
+
+def retry_prompt(prompt, errors):
+    """The prompt again, followed by what was wrong with the last reply (also gives the retry its own cache key)"""
+    problems = "\n".join(f"- {error}" for error in errors)
+    return f"{prompt}\nYour previous reply was rejected:\n{problems}\nReturn all three questions again, fixing these problems.\n"
+
+def records_from_response(raw, point_id, point_text):
+    """Validate a model reply for one point and label the good questions "<point_id>a".."c".
+    Returns (records, errors); errors lists why each rejected question (or the whole reply) was dropped.
+    """
+    try:
+        items = parse_json_response(raw)
+    except (ValueError, json.JSONDecodeError) as e:
+        return [], [f"unreadable reply: {e}"]
+    return records_from_items(items, point_id, point_text)
+
+def records_from_items(items, point_id, point_text):
+    """records_from_response() for question objects already decoded from a reply"""
+    records, errors = [], []
+    for n, item in enumerate(items, start=1):
+        try:
+            question = validate_item(item)
+        except ValueError as e:
+            errors.append(f"question {n}: {e}")
+            continue
+        if len(records) == len(LABEL_LETTERS):
+            errors.append(f"question {n}: more than {len(LABEL_LETTERS)} questions")
+            break
+        records.append({
+            "id": f"{point_id}{LABEL_LETTERS[len(records)]}",
+            "point_id": point_id,
+            "point": point_text,
+            **question,
+        })
+    return records, errors
+
+def generate_records(call, point_id, point_text, retries=None):
+    """Ask `call(prompt) -> raw reply` for three MCQs about a point, re-asking while any come back malformed.
+    Returns (records, errors) from the best attempt.
+    """
+    if retries is None:
+        retries = int(os.getenv("MCQ_RETRIES", "1"))
+    prompt = base_prompt = build_prompt(point_text)
+    best = None
+    for _ in range(retries + 1):
+        records, errors = records_from_response(call(prompt), point_id, point_text)
+        if best is None or len(records) > len(best[0]):
+            best = (records, errors)
+        if len(records) == len(LABEL_LETTERS) and not errors:
+            break
+        if len(records) < len(LABEL_LETTERS):
+            errors = errors + [f"only {len(records)} valid questions"]
+        prompt = retry_prompt(base_prompt, errors)
+    return best
+
+async def agenerate_records(call, point_id, point_text, retries=None):
+    """generate_records() for a coroutine `call(prompt) -> raw reply`, so many points can be in flight at once"""
+    if retries is None:
+        retries = int(os.getenv("MCQ_RETRIES", "1"))
+    prompt = base_prompt = build_prompt(point_text)
+    best = None
+    for _ in range(retries + 1):
+        records, errors = records_from_response(await call(prompt), point_id, point_text)
+        if best is None or len(records) > len(best[0]):
+            best = (records, errors)
+        if len(records) == len(LABEL_LETTERS) and not errors:
+            break
+        if len(records) < len(LABEL_LETTERS):
+            errors = errors + [f"only {len(records)} valid questions"]
+        prompt = retry_prompt(base_prompt, errors)
+    return best
+
+def records_from_batch_response(raw, batch):
+    """Validate a batched reply. Returns ({point_id: records} for points that came back complete,
+    [(point_id, text)] of points that are missing or malformed and need asking again).
+    """
+    try:
+        data = load_json_reply(raw)
+        entries = data.get("points") if isinstance(data, dict) else None
+        if not isinstance(entries, list):
+            raise ValueError("expected a list of points")
+    except (ValueError, json.JSONDecodeError):
+        return {}, list(batch)
+    questions = {}
+    for entry in entries:
+        if isinstance(entry, dict) and isinstance(entry.get("questions"), list):
+            # JSON mode without a schema (Gemini, Mistral) may send the id as a string
+            try:
+                point_id = int(entry.get("point_id"))
+            except (TypeError, ValueError):
+                continue
+            questions.setdefault(point_id, entry["questions"])
+    done, failed = {}, []
+    for point_id, text in batch:
+        records, errors = records_from_items(questions.get(point_id, []), point_id, text)
+        if len(records) == len(LABEL_LETTERS) and not errors:
+            done[point_id] = records
+        else:
+            failed.append((point_id, text))
+    return done, failed
+
+def generate_batch_records(call, call_batch, batch, retries=None):
+    """Ask `call_batch(prompt, n_points) -> raw reply` for MCQs about several points at once.
+    Points that come back malformed are re-split into halves and asked again; a point left on its own
+    goes through generate_records() with `call(prompt)`. Returns {point_id: (records, errors)}.
+    """
+    if len(batch) == 1:
+        point_id, text = batch[0]
+        return {point_id: generate_records(call, point_id, text, retries)}
+    done, failed = records_from_batch_response(call_batch(build_batch_prompt(batch), len(batch)), batch)
+    results = {point_id: (records, []) for point_id, records in done.items()}
+    if failed:
+        print(f"Batch of {len(batch)}: re-splitting {len(failed)} malformed point(s)")
+        half = (len(failed) + 1) // 2
+        for part in (failed[:half], failed[half:]):
+            if part:
+                results.update(generate_batch_records(call, call_batch, part, retries))
+    return results
+
+def generate_in_threads(generate, batches, concurrency):
+    """Run generate(batch) for every batch on up to `concurrency` threads.
+    Yields (batch, result or exception) in completion order, so callers can journal each batch as soon as it is done.
+    """
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        futures = {pool.submit(generate, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
+    finally:
+        # On Ctrl+C or an early exit, drop the batches that have not started
+        pool.shutdown(wait=False, cancel_futures=True)
+
+async def agenerate_batch_records(call, call_batch, batch, retries=None):
+    """generate_batch_records() for coroutine `call` and `call_batch`; re-split halves run concurrently"""
+    if len(batch) == 1:
+        point_id, text = batch[0]
+        return {point_id: await agenerate_records(call, point_id, text, retries)}
+    done, failed = records_from_batch_response(await call_batch(build_batch_prompt(batch), len(batch)), batch)
+    results = {point_id: (records, []) for point_id, records in done.items()}
+    if failed:
+        print(f"Batch of {len(batch)}: re-splitting {len(failed)} malformed point(s)")
+        half = (len(failed) + 1) // 2
+        parts = [part for part in (failed[:half], failed[half:]) if part]
+        for part_results in await asyncio.gather(*(agenerate_batch_records(call, call_batch, part, retries) for part in parts)):
+            results.update(part_results)
+    return results
+
+class QuestionStreamParser:
+    """Picks complete question objects out of a JSON reply while it is still arriving.
+    feed() returns every object with a "stem" whose closing brace came in with the new text.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.in_string = False
+        self.escape = False
+        self.open_objects = []
+
+    def feed(self, chunk):
+        start = len(self.text)
+        self.text += chunk
+        found = []
+        for i in range(start, len(self.text)):
+            c = self.text[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+            elif c == '"':
+                self.in_string = True
+            elif c == "{":
+                self.open_objects.append(i)
+            elif c == "}" and self.open_objects:
+                item = self.text[self.open_objects.pop():i + 1]
+                if '"stem"' not in item:
+                    continue
+                try:
+                    item = json.loads(item)
+                except ValueError:
+                    continue
+                if isinstance(item, dict) and "stem" in item:
+                    found.append(item)
+        return found
+
+def preview_record(item, point_id, point_text, emitted):
+    """Label a streamed question like records_from_items() would, given how many were emitted before it.
+    Returns None for a malformed question or one past the third.
+    """
+    if emitted >= len(LABEL_LETTERS):
+        return None
+    try:
+        question = validate_item(item)
+    except ValueError:
+        return None
+    return {"id": f"{point_id}{LABEL_LETTERS[emitted]}", "point_id": point_id, "point": point_text, **question}
+
+def streamed(call_stream, point_id, point_text, on_record):
+    """Turn `call_stream(prompt) -> text chunks` into a `call(prompt) -> reply` for generate_records().
+    Each valid question goes to on_record(record) as soon as it has streamed in; a retry streams its own.
+    """
+    def call(prompt):
+        parser, parts, emitted = QuestionStreamParser(), [], 0
+        for chunk in call_stream(prompt):
+            parts.append(chunk)
+            for item in parser.feed(chunk):
+                record = preview_record(item, point_id, point_text, emitted)
+                if record is not None:
+                    emitted += 1
+                    on_record(record)
+        return "".join(parts)
+    return call
+
+def astreamed(call_stream, point_id, point_text, on_record):
+    """streamed() for an async generator `call_stream(prompt)`, giving a coroutine call for agenerate_records()"""
+    async def call(prompt):
+        parser, parts, emitted = QuestionStreamParser(), [], 0
+        async for chunk in call_stream(prompt):
+            parts.append(chunk)
+            for item in parser.feed(chunk):
+                record = preview_record(item, point_id, point_text, emitted)
+                if record is not None:
+                    emitted += 1
+                    on_record(record)
+        return "".join(parts)
+    return call
+
+def live_writer(provider):
+    """Empty summary_mcqs_<provider>.live.jsonl and return on_record(record), which appends each record as it arrives.
+    The file holds questions in arrival order until save_records() writes the outputs in point order and removes it;
+    the last run's summary_mcqs_<provider>.jsonl stays untouched until then. The time to the first question is printed.
+    """
+    path = live_path(provider)
+    open(path, "w", encoding="utf-8").close()
+    lock = threading.Lock()
+    start = time.perf_counter()
+    count = 0
+
+    def on_record(record):
+        nonlocal count
+        with lock, open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+            if count == 1:
+                print(f"{provider}: first question ({record['id']}) after {time.perf_counter() - start:.2f}s")
+    return on_record
+
+def live_path(provider):
+    """Path of the arrival-order file written while streaming"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), f"summary_mcqs_{provider}.live.jsonl")
+
+def format_mcq_text(record):
+    """Render a record in the plain-text layout of summary_questions_<provider>.txt"""
+    lines = [f"{record['id']}. {record['stem']}"]
+    lines += [f"{letter}. {choice}" for letter, choice in zip(LETTERS, record["choices"])]
+    lines.append(f"Answer: {LETTERS[record['answer']]}. {record['choices'][record['answer']]}")
+    lines.append(f"Explanation: {record['explanation']}")
+    return "\n".join(lines)
+
+def mapping_markdown(records):
+    """Point -> question id table, as in points_to_questions*.md"""
+    rows = {}
+    for record in records:
+        rows.setdefault(record["point"], []).append(record["id"])
+    md_lines = ["| Source Point | Question ID(s) |", "|---|---|"]
+    for point, ids in rows.items():
+        safe_point = point.replace("|", "\\|")
+        md_lines.append(f"| {safe_point} | {', '.join(ids)} |")
+    return "\n".join(md_lines)
+
+def records_to_jsonl(records):
+    """Serialize records one JSON object per line"""
+    return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+
+def read_jsonl(path):
+    """Read records written by records_to_jsonl; returns [] if the file does not exist"""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def save_records(records, provider, mapping_file):
+    """Write summary_mcqs_<provider>.jsonl next to this script, plus the .txt and mapping views rendered from it,
+    and drop the streaming run's arrival-order file
+    """
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    outputs = {
+        f"summary_mcqs_{provider}.jsonl": records_to_jsonl(records),
+        f"summary_questions_{provider}.txt": "\n\n".join(format_mcq_text(record) for record in records),
+        mapping_file: mapping_markdown(records),
+    }
+    for filename, content in outputs.items():
+        with open(os.path.join(base_dir, filename), "w", encoding="utf-8") as f:
+            f.write(content)
+    if os.path.exists(live_path(provider)):
+        os.remove(live_path(provider))
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+
+from mcq_records import LABEL_LETTERS, MCQ_BATCH_PROMPT, MCQ_BATCH_SCHEMA, MCQ_JSON_PROMPT, MCQ_SCHEMA
+
+# Changes whenever the prompts or schemas do, so questions asked the old way are not replayed
+PROMPT_VERSION = hashlib.sha256(
+    json.dumps([MCQ_JSON_PROMPT, MCQ_BATCH_PROMPT, MCQ_SCHEMA, MCQ_BATCH_SCHEMA], sort_keys=True).encode("utf-8")
+).hexdigest()[:12]
+
+
+class IncompleteRun(RuntimeError):
+    """Raised when points are left without questions, so no outputs are written over the last complete run's"""
+
+
+class PointJournal:
+    """Append-only journal_<provider>.jsonl holding each point's records as soon as the point is done.
+    Entries are keyed by point text, model and prompt version, so a rerun after a crash skips points already paid
+    for and survives the PDF being renumbered; a line cut short by a crash is ignored. The journal is only for
+    resuming: it is deleted once a run has covered every point.
+    """
+
+    def __init__(self, provider, model):
+        self.path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"journal_{provider}.jsonl")
+        self.model = model
+        self.entries = {}
+        # Points that came back with fewer than three good questions: used in this run's output, asked again next run
+        self.partial = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if entry.get("model") == model and entry.get("prompt_version") == PROMPT_VERSION:
+                        self.entries[entry["point"]] = entry
+            # Terminate a line cut short by a crash so the next entry starts on its own line
+            with open(self.path, "rb+") as f:
+                size = f.seek(0, os.SEEK_END)
+                if size:
+                    f.seek(size - 1)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")
+
+    def __contains__(self, point_text):
+        return point_text in self.entries
+
+    def pending(self, points):
+        """Return the point texts (in order) that still need generating"""
+        return [point for point in points if point not in self.entries]
+
+    def record(self, point_text, records, errors):
+        """Append a finished point and flush it to disk. Only points with all three questions are kept;
+        an incomplete point still goes into this run's output but is asked again next run
+        """
+        entry = {"point": point_text, "model": self.model, "prompt_version": PROMPT_VERSION,
+                 "records": records, "errors": errors}
+        if len(records) < len(LABEL_LETTERS):
+            if records:
+                self.partial[point_text] = entry
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries[point_text] = entry
+        self.partial.pop(point_text, None)
+
+    def records(self, points):
+        """All records for `points` (journaled or partial), in point order, labeled by each point's position in this run"""
+        ordered = []
+        for point_id, point in enumerate(points, start=1):
+            entry = self.entries.get(point) or self.partial.get(point)
+            if entry is None:
+                continue
+            for letter, record in zip(LABEL_LETTERS, entry["records"]):
+                ordered.append({**record, "id": f"{point_id}{letter}", "point_id": point_id})
+        return ordered
+
+    def report_resume(self, points):
+        """Print how many points an earlier run already finished"""
+        done = len(points) - len(self.pending(points))
+        if done:
+            print(f"Resuming: {done} of {len(points)} points already in {os.path.basename(self.path)} "
+                  f"(delete it to start over)")
+
+    def report_missing(self, points):
+        """Print the points that are still missing questions, so failures don't go unnoticed; returns their ids"""
+        missing = [str(point_id) for point_id, point in enumerate(points, start=1)
+                   if point not in self.entries and point not in self.partial]
+        partial = [str(point_id) for point_id, point in enumerate(points, start=1) if point in self.partial]
+        if missing:
+            print(f"{len(missing)} point(s) have no questions yet ({', '.join(missing)}); run again to retry them")
+        if partial:
+            print(f"{len(partial)} point(s) have fewer than three questions ({', '.join(partial)}); run again to retry them")
+        return missing
+
+    def require_complete(self, points):
+        """Report missing points and raise IncompleteRun if any point has no questions at all"""
+        missing = self.report_missing(points)
+        if missing:
+            raise IncompleteRun(f"{len(missing)} point(s) have no questions; outputs from earlier runs were left as they were")
+
+    def finish(self, points):
+        """Delete the journal once every point has all its questions; the next run starts over
+        (through the LLM cache, so unchanged points cost nothing while it is on)
+        """
+        if not self.pending(points) and os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,356 @@
+import asyncio
+import json
+import os
+import threading
+import weakref
+
+import httpx
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from llm_cache import cache_lookup
+from mcq_records import MAX_TOKENS_PER_POINT, MCQ_BATCH_SCHEMA, MCQ_SCHEMA
+from rate_limit import acall_with_limits, astream_with_limits, call_with_limits, estimate_tokens, stream_with_limits
+
+# Optional SDKs
+try:
+    from openai import AsyncOpenAI, OpenAI
+except Exception:
+    AsyncOpenAI = OpenAI = None
+
+try:
+    import google.generativeai as genai
+except Exception:
+    genai = None
+
+load_dotenv()
+
+PROVIDERS = ["openai", "gemini", "mistral"]
+
+# Structured-output schemas by name: three MCQs for one point, or for each point of a batch
+SCHEMAS = {"mcqs": MCQ_SCHEMA, "mcq_batch": MCQ_BATCH_SCHEMA}
+
+# One long-lived client per provider (and per model for Gemini), created on first use and shared by every call
+_clients = {}
+# AsyncOpenAI clients per event loop: an httpx.AsyncClient's connections belong to the loop that opened them,
+# so a later asyncio.run() (the fan-out, a Streamlit rerun) must not reuse one from a closed loop
+_async_clients = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def get_pool_size():
+    """Return the connections kept open per provider (LLM_POOL_SIZE, default 10)"""
+    return int(os.getenv("LLM_POOL_SIZE", "10"))
+
+def get_timeout():
+    """Return the per-request timeout in seconds (LLM_TIMEOUT, default 60)"""
+    return float(os.getenv("LLM_TIMEOUT", "60"))
+
+def get_connect_timeout():
+    """Return the connection timeout in seconds (LLM_CONNECT_TIMEOUT, default 10)"""
+    return float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+
+def default_model(provider):
+    """Return the model configured for a provider in .env"""
+    if provider == "openai":
+        return os.getenv("OPENAI_MODEL", "gpt-4.1")
+    if provider == "gemini":
+        return os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+    return os.getenv("MISTRAL_MODEL", "mistral-large-latest")
+
+def _cached(key, create):
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = create()
+    return client
+
+def _httpx_settings():
+    pool = get_pool_size()
+    return {
+        "timeout": httpx.Timeout(get_timeout(), connect=get_connect_timeout()),
+        # Concurrency is up to rate_limit; capping connections here too would queue requests (and hedged
+        # duplicates) inside httpx where no limit can see them
+        "limits": httpx.Limits(max_connections=None, max_keepalive_connections=pool),
+    }
+
+def _openai_key():
+    if OpenAI is None:
+        raise RuntimeError("openai package not installed. pip install openai")
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY not set")
+    return api_key
+
+def get_openai_client():
+    """Shared OpenAI client with a keep-alive connection pool; retries are left to rate_limit"""
+    return _cached("openai", lambda: OpenAI(api_key=_openai_key(), max_retries=0,
+                                            http_client=httpx.Client(**_httpx_settings())))
+
+def get_async_openai_client():
+    """AsyncOpenAI client shared by every call on the running event loop; close it with close_async_openai_client()"""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            client = _async_clients[loop] = AsyncOpenAI(api_key=_openai_key(), max_retries=0,
+                                                        http_client=httpx.AsyncClient(**_httpx_settings()))
+    return client
+
+async def close_async_openai_client():
+    """Close the running event loop's AsyncOpenAI client, if it made one; call before the loop ends"""
+    with _lock:
+        client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+def get_gemini_model(model=None):
+    """Shared GenerativeModel per model name; the API key is configured once"""
+    model = model or default_model("gemini")
+
+    def create():
+        if genai is None:
+            raise RuntimeError("google-generativeai package not installed. Install with: pip install google-generativeai")
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise RuntimeError("GEMINI_API_KEY not set in environment")
+        genai.configure(api_key=api_key)
+        return genai.GenerativeModel(model)
+    return _cached(("gemini", model), create)
+
+def get_mistral_session():
+    """Shared requests.Session with a pooled, keep-alive adapter and the Mistral auth header"""
+    def create():
+        api_key = os.getenv("MISTRAL_API_KEY")
+        if not api_key:
+            raise RuntimeError("MISTRAL_API_KEY not set in environment")
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=get_pool_size(), pool_maxsize=get_pool_size())
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"})
+        return session
+    return _cached("mistral", create)
+
+def get_mistral_api_url():
+    return os.getenv("MISTRAL_API_URL", "https://api.mistral.ai/v1/chat/completions")
+
+
+def openai_request(prompt, model=None, json_mode=True, max_tokens=MAX_TOKENS_PER_POINT, temperature=0.45, schema="mcqs"):
+    """Chat completion arguments; json_mode asks for structured output matching SCHEMAS[schema]"""
+    request = {
+        "model": model or default_model("openai"),
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+    }
+    if json_mode:
+        request["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": schema, "schema": SCHEMAS[schema], "strict": True},
+        }
+    return request
+
+def sampling_params(request):
+    """Request settings that change the reply, as part of the LLM cache key"""
+    return {"temperature": request["temperature"], "max_tokens": request["max_tokens"],
+            "response_format": request.get("response_format")}
+
+def openai_chat(prompt, model=None, json_mode=True, **kwargs):
+    request = openai_request(prompt, model, json_mode, **kwargs)
+    cache, key, reply = cache_lookup("openai", request["model"], prompt, sampling_params(request))
+    if reply is None:
+        response = call_with_limits("openai", estimate_tokens(prompt, request["max_tokens"]),
+                                    lambda: get_openai_client().chat.completions.create(**request))
+        reply = response.choices[0].message.content or ""
+        if cache is not None:
+            cache.put(key, "openai", request["model"], reply)
+    return reply
+
+async def openai_chat_async(prompt, model=None, json_mode=True, **kwargs):
+    request = openai_request(prompt, model, json_mode, **kwargs)
+    cache, key, reply = cache_lookup("openai", request["model"], prompt, sampling_params(request))
+    if reply is None:
+        response = await acall_with_limits("openai", estimate_tokens(prompt, request["max_tokens"]),
+                                           lambda: get_async_openai_client().chat.completions.create(**request))
+        reply = response.choices[0].message.content or ""
+        if cache is not None:
+            cache.put(key, "openai", request["model"], reply)
+    return reply
+
+def _gemini_generate(model, prompt, generation_config, stream=False):
+    return get_gemini_model(model).generate_content(
+        prompt, generation_config=generation_config, stream=stream, request_options={"timeout": get_timeout()}
+    )
+
+def gemini_chat(prompt, model=None, json_mode=True):
+    model = model or default_model("gemini")
+    generation_config = {"response_mime_type": "application/json"} if json_mode else None
+    # Gemini runs with the model's default sampling settings
+    cache, key, reply = cache_lookup("gemini", model, prompt,
+                                     {"temperature": None, "max_tokens": None, "response_format": generation_config})
+    if reply is None:
+        resp = call_with_limits("gemini", estimate_tokens(prompt, MAX_TOKENS_PER_POINT),
+                                lambda: _gemini_generate(model, prompt, generation_config))
+        reply = resp.text if hasattr(resp, 'text') and resp.text else str(resp)
+        if cache is not None:
+            cache.put(key, "gemini", model, reply)
+    return reply
+
+def mistral_request(prompt, model=None, json_mode=True, max_tokens=MAX_TOKENS_PER_POINT):
+    """Mistral chat completion body; json_mode asks for a JSON object"""
+    body = {
+        "model": model or default_model("mistral"),
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.45,
+        "max_tokens": max_tokens,
+    }
+    if json_mode:
+        body["response_format"] = {"type": "json_object"}
+    return body
+
+def _mistral_post(body, api_url=None, stream=False):
+    resp = get_mistral_session().post(api_url or get_mistral_api_url(), json=body, stream=stream,
+                                      timeout=(get_connect_timeout(), get_timeout()))
+    if not resp.ok:
+        resp.close()
+    resp.raise_for_status()
+    return resp
+
+def mistral_chat(prompt, model=None, json_mode=True, api_url=None, max_tokens=MAX_TOKENS_PER_POINT):
+    body = mistral_request(prompt, model, json_mode, max_tokens)
+    cache, key, reply = cache_lookup("mistral", body["model"], prompt, sampling_params(body))
+    if reply is None:
+        resp = call_with_limits("mistral", estimate_tokens(prompt, body["max_tokens"]),
+                                lambda: _mistral_post(body, api_url))
+        data = resp.json()
+        reply = data["choices"][0]["message"]["content"]
+        if cache is not None:
+            cache.put(key, "mistral", body["model"], reply)
+    return reply
+
+def chat(provider, prompt, model=None, json_mode=True, n_points=1):
+    """Send one prompt to a provider ("openai", "gemini" or "mistral") over its shared client.
+    n_points > 1 marks a batched prompt: the output budget grows with it and OpenAI gets the batch schema.
+    """
+    max_tokens = MAX_TOKENS_PER_POINT * n_points
+    if provider == "openai":
+        return openai_chat(prompt, model, json_mode, max_tokens=max_tokens, schema="mcq_batch" if n_points > 1 else "mcqs")
+    if provider == "gemini":
+        return gemini_chat(prompt, model, json_mode)
+    if provider == "mistral":
+        return mistral_chat(prompt, model, json_mode, max_tokens=max_tokens)
+    raise ValueError(f"Unknown provider: {provider}")
+
+
+# Streaming variants: yield the reply in pieces as the provider sends it. A cached reply comes back as one piece;
+# a streamed reply is cached once it has arrived in full. Rate limits and retries cover the whole stream: the
+# concurrency slot is held until it has been read, and an error while reading counts as a failed request.
+
+def _openai_pieces(stream):
+    with stream:
+        for chunk in stream:
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                yield text
+
+async def _aopenai_pieces(stream):
+    async with stream:
+        async for chunk in stream:
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                yield text
+
+def _gemini_pieces(stream):
+    for chunk in stream:
+        if chunk.text:
+            yield chunk.text
+
+def _mistral_pieces(resp):
+    # Server-sent events: "data: {chunk}" lines, ending with "data: [DONE]"
+    with resp:
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            choices = json.loads(data).get("choices") or []
+            text = choices[0].get("delta", {}).get("content") if choices else None
+            if text:
+                yield text
+
+def openai_chat_stream(prompt, model=None, json_mode=True, **kwargs):
+    request = openai_request(prompt, model, json_mode, **kwargs)
+    cache, key, reply = cache_lookup("openai", request["model"], prompt, sampling_params(request))
+    if reply is not None:
+        yield reply
+        return
+    parts = []
+    for text in stream_with_limits("openai", estimate_tokens(prompt, request["max_tokens"]),
+                                   lambda: get_openai_client().chat.completions.create(**request, stream=True),
+                                   _openai_pieces):
+        parts.append(text)
+        yield text
+    if cache is not None:
+        cache.put(key, "openai", request["model"], "".join(parts))
+
+async def openai_chat_stream_async(prompt, model=None, json_mode=True, **kwargs):
+    request = openai_request(prompt, model, json_mode, **kwargs)
+    cache, key, reply = cache_lookup("openai", request["model"], prompt, sampling_params(request))
+    if reply is not None:
+        yield reply
+        return
+    parts = []
+    async for text in astream_with_limits("openai", estimate_tokens(prompt, request["max_tokens"]),
+                                          lambda: get_async_openai_client().chat.completions.create(**request, stream=True),
+                                          _aopenai_pieces):
+        parts.append(text)
+        yield text
+    if cache is not None:
+        cache.put(key, "openai", request["model"], "".join(parts))
+
+def gemini_chat_stream(prompt, model=None, json_mode=True):
+    model = model or default_model("gemini")
+    generation_config = {"response_mime_type": "application/json"} if json_mode else None
+    cache, key, reply = cache_lookup("gemini", model, prompt,
+                                     {"temperature": None, "max_tokens": None, "response_format": generation_config})
+    if reply is not None:
+        yield reply
+        return
+    parts = []
+    for text in stream_with_limits("gemini", estimate_tokens(prompt, MAX_TOKENS_PER_POINT),
+                                   lambda: _gemini_generate(model, prompt, generation_config, stream=True),
+                                   _gemini_pieces):
+        parts.append(text)
+        yield text
+    if cache is not None:
+        cache.put(key, "gemini", model, "".join(parts))
+
+def mistral_chat_stream(prompt, model=None, json_mode=True, api_url=None, max_tokens=MAX_TOKENS_PER_POINT):
+    body = mistral_request(prompt, model, json_mode, max_tokens)
+    cache, key, reply = cache_lookup("mistral", body["model"], prompt, sampling_params(body))
+    if reply is not None:
+        yield reply
+        return
+    parts = []
+    for text in stream_with_limits("mistral", estimate_tokens(prompt, body["max_tokens"]),
+                                   lambda: _mistral_post({**body, "stream": True}, api_url, stream=True),
+                                   _mistral_pieces):
+        parts.append(text)
+        yield text
+    if cache is not None:
+        cache.put(key, "mistral", body["model"], "".join(parts))
+
+def chat_stream(provider, prompt, model=None, json_mode=True):
+    """chat() for one point, yielding the reply in pieces as it streams in"""
+    if provider == "openai":
+        return openai_chat_stream(prompt, model, json_mode)
+    if provider == "gemini":
+        return gemini_chat_stream(prompt, model, json_mode)
+    if provider == "mistral":
+        return mistral_chat_stream(prompt, model, json_mode)
+    raise ValueError(f"Unknown provider: {provider}")
@@ -0,0 +1,399 @@
+import asyncio
+import contextvars
+import email.utils
+import os
+import random
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Shared per-provider limiters, created on first use
+_limiters = {}
+_lock = threading.Lock()
+
+
+class RateLimitExhausted(RuntimeError):
+    """Raised when a request is still throttled or failing after every retry"""
+
+
+class RequestAbandoned(RuntimeError):
+    """Raised instead of sending a request whose caller has stopped waiting for it"""
+
+
+class RequestTicket:
+    """Follows one request through the limits for a caller that races it against others (hedging).
+    `sent_at` is set each time an attempt gets past the buckets and the concurrency limit and goes on the wire.
+    A duplicate skips the concurrency limit, which is likely full of the slow requests it is racing. abandon()
+    stops an attempt that hasn't been sent and hands back the slot of one that has.
+    """
+
+    def __init__(self, duplicate=False):
+        self.duplicate = duplicate
+        self.sent_at = None
+        self.abandoned = False
+        self.release = None
+        self.lock = threading.Lock()
+
+    def sent(self, release):
+        with self.lock:
+            self.sent_at = time.monotonic()
+            self.release = release
+            abandoned = self.abandoned
+        if abandoned:
+            release()
+
+    def abandon(self):
+        with self.lock:
+            self.abandoned = True
+            release = self.release
+        if release is not None:
+            release()
+
+# The ticket of the request being made in this thread or task, if any
+current_ticket = contextvars.ContextVar("current_ticket", default=None)
+
+
+def get_max_retries():
+    """Return how many times a throttled or failed request is retried (LLM_MAX_RETRIES, default 5)"""
+    return int(os.getenv("LLM_MAX_RETRIES", "5"))
+
+def get_backoff_base():
+    """Return the first backoff delay in seconds (LLM_BACKOFF_BASE, default 1)"""
+    return float(os.getenv("LLM_BACKOFF_BASE", "1"))
+
+def get_backoff_max():
+    """Return the longest backoff delay in seconds (LLM_BACKOFF_MAX, default 60)"""
+    return float(os.getenv("LLM_BACKOFF_MAX", "60"))
+
+def get_provider_limit(provider, name, default="0"):
+    """Return <PROVIDER>_<NAME> (e.g. OPENAI_RPM) from .env as a float; 0 means no limit"""
+    return float(os.getenv(f"{provider.upper()}_{name}", default))
+
+
+class TokenBucket:
+    """Allows `per_minute` units a minute with bursts up to one minute's worth. Thread-safe.
+    reserve() books the units straight away and returns how long the caller must wait before using them,
+    so callers queue up in order instead of polling.
+    """
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # A single request larger than the bucket still gets through, after a full refill
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def drain(self):
+        """Drop any saved-up burst; used when the server says we are over its limit after all"""
+        if self.rate > 0:
+            with self.lock:
+                self.tokens = min(self.tokens, 0.0)
+
+    def interval(self):
+        """Seconds between units at the configured rate, or 0 when there is no limit"""
+        return 1 / self.rate if self.rate > 0 else 0.0
+
+
+class AIMDLimit:
+    """Concurrency limit found by additive increase / multiplicative decrease, shared by threads and event loops.
+    Every success adds 1/limit (about +1 per round of requests); a throttled request halves the limit,
+    at most once per typical request time so one burst of 429s counts as a single signal.
+    """
+
+    def __init__(self, initial, maximum, minimum=1):
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.minimum = minimum
+        self.latency = 1.0
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def try_acquire(self, bypass=False):
+        with self.condition:
+            if bypass or self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self, bypass=False):
+        """Take a slot, waiting for one to free up; with bypass (hedged duplicates) it is counted but never waits"""
+        with self.condition:
+            while not bypass and self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        return self._releaser()
+
+    async def aacquire(self, bypass=False):
+        """acquire() for event loops; polled rather than awaited on a condition, so the same limit works across
+        threads and event loops
+        """
+        while not self.try_acquire(bypass):
+            await asyncio.sleep(0.05)
+        return self._releaser()
+
+    def _releaser(self):
+        """Release function for one slot that does nothing after the first call"""
+        released = []
+
+        def release():
+            with self.condition:
+                if released:
+                    return
+                released.append(True)
+                self.in_flight -= 1
+                self.condition.notify_all()
+        return release
+
+    def on_success(self, elapsed):
+        with self.condition:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self.latency = 0.8 * self.latency + 0.2 * elapsed
+            self.condition.notify_all()
+
+    def on_throttle(self):
+        with self.condition:
+            now = time.monotonic()
+            if now - self.last_decrease >= self.latency:
+                self.limit = max(self.minimum, self.limit / 2)
+                self.last_decrease = now
+
+
+class ProviderLimiter:
+    """Requests/min and tokens/min buckets plus the adaptive concurrency limit for one provider"""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.requests = TokenBucket(get_provider_limit(provider, "RPM"))
+        self.tokens = TokenBucket(get_provider_limit(provider, "TPM"))
+        self.concurrency = AIMDLimit(get_provider_limit(provider, "INITIAL_CONCURRENCY", "4"),
+                                     get_provider_limit(provider, "MAX_CONCURRENCY", "32"))
+        self.throttled = 0
+        self.retries = 0
+
+    def reserve(self, tokens):
+        """Book one request of about `tokens` tokens; returns the seconds to wait before sending it"""
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+
+def get_limiter(provider):
+    """Return the process-wide limiter for a provider"""
+    with _lock:
+        if provider not in _limiters:
+            _limiters[provider] = ProviderLimiter(provider)
+        return _limiters[provider]
+
+def estimate_tokens(prompt, max_tokens):
+    """Rough token cost of a request for the tokens/min budget: prompt at ~4 characters a token plus the output cap"""
+    return len(prompt) // 4 + (max_tokens or 0)
+
+def error_status(exc):
+    """Return the HTTP status of a provider SDK or requests error, or None"""
+    for owner in (exc, getattr(exc, "response", None)):
+        status = getattr(owner, "status_code", None)
+        if isinstance(status, int):
+            return status
+    code = getattr(exc, "code", None)
+    return code if isinstance(code, int) else None
+
+def retry_after(exc):
+    """Return the delay the server asked for (Retry-After / retry-after-ms), in seconds, or None"""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    millis = headers.get("retry-after-ms")
+    if millis:
+        try:
+            return float(millis) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        moment = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        # Unreadable header: fall back to jittered backoff rather than losing the original error
+        return None
+    return max(0.0, moment.timestamp() - time.time()) if moment else None
+
+def is_retryable(exc):
+    """429, 5xx, timeouts and dropped connections are worth retrying; other errors are not"""
+    status = error_status(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    name = type(exc).__name__
+    return any(word in name for word in ("Timeout", "Connection", "Unavailable", "ResourceExhausted"))
+
+def backoff_delay(exc, attempt, floor=0.0):
+    """Retry-After when the server gave one, otherwise exponential backoff with full jitter, never under `floor`"""
+    delay = retry_after(exc)
+    if delay is not None:
+        return delay + random.uniform(0, 0.1 * delay + 0.05)
+    return max(floor, random.uniform(0, min(get_backoff_max(), get_backoff_base() * 2 ** attempt)))
+
+def _record_throttle(limiter, exc, attempt):
+    """Count a 429 and shrink the concurrency limit; returns the least the retry should wait"""
+    if error_status(exc) != 429:
+        return 0.0
+    limiter.throttled += 1
+    limiter.concurrency.on_throttle()
+    # With <PROVIDER>_RPM set, the server counts differently than our bucket: stop bursting, and wait at least
+    # one request interval, doubling per attempt, so retries don't land in the same full window
+    limiter.requests.drain()
+    return min(get_backoff_max(), limiter.requests.interval() * 2 ** attempt)
+
+def _on_failure(limiter, exc, attempt, max_retries):
+    """Record a failed attempt and return how long to wait before the next one; re-raises if it is the last"""
+    if not is_retryable(exc):
+        raise exc
+    floor = _record_throttle(limiter, exc, attempt)
+    if attempt == max_retries:
+        raise RateLimitExhausted(f"{limiter.provider}: giving up after {max_retries + 1} attempts: {exc}") from exc
+    limiter.retries += 1
+    return backoff_delay(exc, attempt, floor)
+
+def _check_abandoned(provider, ticket):
+    if ticket is not None and ticket.abandoned:
+        raise RequestAbandoned(f"{provider}: request no longer needed")
+
+def call_with_limits(provider, tokens, send):
+    """Run send() under the provider's rate and concurrency limits, retrying throttled and transient failures.
+    A RequestTicket in current_ticket is told when each attempt is sent.
+    """
+    limiter = get_limiter(provider)
+    ticket = current_ticket.get()
+    max_retries = get_max_retries()
+    for attempt in range(max_retries + 1):
+        time.sleep(limiter.reserve(tokens))
+        _check_abandoned(provider, ticket)
+        release = limiter.concurrency.acquire(bypass=ticket is not None and ticket.duplicate)
+        try:
+            if ticket is not None:
+                ticket.sent(release)
+            start = time.monotonic()
+            try:
+                result = send()
+            except Exception as e:
+                delay = _on_failure(limiter, e, attempt, max_retries)
+            else:
+                limiter.concurrency.on_success(time.monotonic() - start)
+                return result
+        finally:
+            release()
+        time.sleep(delay)
+        _check_abandoned(provider, ticket)
+
+async def acall_with_limits(provider, tokens, send):
+    """call_with_limits() for a coroutine function send()"""
+    limiter = get_limiter(provider)
+    ticket = current_ticket.get()
+    max_retries = get_max_retries()
+    for attempt in range(max_retries + 1):
+        await asyncio.sleep(limiter.reserve(tokens))
+        _check_abandoned(provider, ticket)
+        release = await limiter.concurrency.aacquire(bypass=ticket is not None and ticket.duplicate)
+        try:
+            if ticket is not None:
+                ticket.sent(release)
+            start = time.monotonic()
+            try:
+                result = await send()
+            except Exception as e:
+                delay = _on_failure(limiter, e, attempt, max_retries)
+            else:
+                limiter.concurrency.on_success(time.monotonic() - start)
+                return result
+        finally:
+            release()
+        await asyncio.sleep(delay)
+        _check_abandoned(provider, ticket)
+
+def stream_with_limits(provider, tokens, open_stream, pieces):
+    """call_with_limits() for a streamed reply: yields pieces(open_stream()) and holds the concurrency slot until
+    the stream has been read to the end (or the caller stops reading), so success and latency are recorded then.
+    A failure before the first piece is retried like any other; one after it is counted and raised, since the
+    caller has already used part of the reply.
+    """
+    limiter = get_limiter(provider)
+    ticket = current_ticket.get()
+    max_retries = get_max_retries()
+    for attempt in range(max_retries + 1):
+        time.sleep(limiter.reserve(tokens))
+        _check_abandoned(provider, ticket)
+        release = limiter.concurrency.acquire(bypass=ticket is not None and ticket.duplicate)
+        started = False
+        try:
+            if ticket is not None:
+                ticket.sent(release)
+            start = time.monotonic()
+            try:
+                for piece in pieces(open_stream()):
+                    started = True
+                    yield piece
+            except Exception as e:
+                if started:
+                    _record_throttle(limiter, e, attempt)
+                    raise
+                delay = _on_failure(limiter, e, attempt, max_retries)
+            else:
+                limiter.concurrency.on_success(time.monotonic() - start)
+                return
+        finally:
+            release()
+        time.sleep(delay)
+        _check_abandoned(provider, ticket)
+
+async def astream_with_limits(provider, tokens, open_stream, pieces):
+    """stream_with_limits() for a coroutine function open_stream() and an async generator function pieces()"""
+    limiter = get_limiter(provider)
+    ticket = current_ticket.get()
+    max_retries = get_max_retries()
+    for attempt in range(max_retries + 1):
+        await asyncio.sleep(limiter.reserve(tokens))
+        _check_abandoned(provider, ticket)
+        release = await limiter.concurrency.aacquire(bypass=ticket is not None and ticket.duplicate)
+        started = False
+        try:
+            if ticket is not None:
+                ticket.sent(release)
+            start = time.monotonic()
+            try:
+                async for piece in pieces(await open_stream()):
+                    started = True
+                    yield piece
+            except Exception as e:
+                if started:
+                    _record_throttle(limiter, e, attempt)
+                    raise
+                delay = _on_failure(limiter, e, attempt, max_retries)
+            else:
+                limiter.concurrency.on_success(time.monotonic() - start)
+                return
+        finally:
+            release()
+        await asyncio.sleep(delay)
+        _check_abandoned(provider, ticket)
+
+def report_limits():
+    """Print throttling and retry counts for every provider used in this run"""
+    for provider, limiter in sorted(_limiters.items()):
+        if limiter.throttled or limiter.retries:
+            print(f"{provider}: {limiter.throttled} throttled responses, {limiter.retries} retries, "
+                  f"settled at {int(limiter.concurrency.limit)} concurrent request(s)")
@@ -5,18 +5,10 @@ import pdfplumber
 import streamlit as st
 from dotenv import load_dotenv
 
-# Optional SDKs
-try:
-    from openai import OpenAI as OpenAIClient
-except Exception:
-    OpenAIClient = None
-
-try:
-    import google.generativeai as genai
-except Exception:
-    genai = None
-
-import requests
+from llm_cache import get_llm_cache, hit_rate
+from mcq_records import (batch_points, format_mcq_text, generate_batch_records, generate_records, get_batch_size,
+                         mapping_markdown, records_to_jsonl, streamed)
+from providers import chat, chat_stream
 
 load_dotenv()
 
@@ -82,147 +74,20 @@ def extract_numbered_points(text: str):
     return unique_points
 
 
-def generate_three_mcqs_openai(point_text: str, model: str) -> list[str]:
-    if OpenAIClient is None:
-        raise RuntimeError("openai package not installed. pip install openai")
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY not set")
-    client = OpenAIClient(api_key=api_key)
-    prompt = f"""You will write THREE distinct MCAT physics multiple-choice questions based on ONE point.
-Each question must be conceptual/theoretical (no calculations) and must test a DIFFERENT facet or ask from a UNIQUE angle. Do NOT paraphrase the same question.
-
-Point:
-{point_text}
-
-STRICT OUTPUT FORMAT FOR EACH MCQ (no extra blank lines, no markdown):
-Question text
-A. Answer choice 1 text
-B. Answer choice 2 text
-C. Answer choice 3 text
-D. Answer choice 4 text
-Answer: [Letter]. [Full correct answer text]
-Explanation: [1-3 sentences focusing on MCAT-relevant concept]
-
-CRITICAL CONSTRAINTS:
-- Produce EXACTLY THREE MCQs.
-- Each MCQ must assess a different perspective (definition vs. application vs. discrimination, etc.).
-- Ensure exactly four options A–D; only one option is indisputably correct.
-- Use precise MCAT-appropriate physics terminology.
-
-SEPARATION:
-- Separate the three MCQs with a single line containing only: ---
-"""
-    resp = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=1400,
-        temperature=0.45,
+def generate_mcqs(provider: str, batch: list, model: str, on_record=None):
+    """Generate three MCQ records for each (point_id, text) in a batch over the provider's shared, pooled client.
+    With on_record, a single point's reply is streamed and each question is passed to it on arrival.
+    Returns {point_id: (records, errors)}.
+    """
+    if on_record is not None and len(batch) == 1:
+        p_idx, point = batch[0]
+        call = streamed(lambda prompt: chat_stream(provider, prompt, model), p_idx, point, on_record)
+        return {p_idx: generate_records(call, p_idx, point)}
+    return generate_batch_records(
+        lambda prompt: chat(provider, prompt, model),
+        lambda prompt, n_points: chat(provider, prompt, model, n_points=n_points),
+        batch,
     )
-    return split_three_blocks(resp.choices[0].message.content or "")
-
-
-def configure_gemini(model: str):
-    if genai is None:
-        raise RuntimeError("google-generativeai not installed. pip install google-generativeai")
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise RuntimeError("GEMINI_API_KEY not set")
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel(model)
-
-
-def generate_three_mcqs_gemini(point_text: str, model: str) -> list[str]:
-    m = configure_gemini(model)
-    prompt = f"""You will write THREE distinct MCAT physics multiple-choice questions based on ONE point.
-Each question must be conceptual/theoretical (no calculations) and must test a DIFFERENT facet or ask from a UNIQUE angle. Do NOT paraphrase the same question.
-
-Point:
-{point_text}
-
-STRICT OUTPUT FORMAT FOR EACH MCQ (no extra blank lines, no markdown):
-Question text
-A. Answer choice 1 text
-B. Answer choice 2 text
-C. Answer choice 3 text
-D. Answer choice 4 text
-Answer: [Letter]. [Full correct answer text]
-Explanation: [1-3 sentences focusing on MCAT-relevant concept]
-
-CRITICAL CONSTRAINTS:
-- Produce EXACTLY THREE MCQs.
-- Each MCQ must assess a different perspective (definition vs. application vs. discrimination, etc.).
-- Ensure exactly four options A–D; only one option is indisputably correct.
-- Use precise MCAT-appropriate physics terminology.
-
-SEPARATION:
-- Separate the three MCQs with a single line containing only: ---
-"""
-    resp = m.generate_content(prompt)
-    raw = getattr(resp, 'text', None) or str(resp)
-    return split_three_blocks(raw)
-
-
-def generate_three_mcqs_mistral(point_text: str, model: str, api_url: str) -> list[str]:
-    api_key = os.getenv("MISTRAL_API_KEY")
-    if not api_key:
-        raise RuntimeError("MISTRAL_API_KEY not set")
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-    prompt = f"""You will write THREE distinct MCAT physics multiple-choice questions based on ONE point.
-Each question must be conceptual/theoretical (no calculations) and must test a DIFFERENT facet or ask from a UNIQUE angle. Do NOT paraphrase the same question.
-
-Point:
-{point_text}
-
-STRICT OUTPUT FORMAT FOR EACH MCQ (no extra blank lines, no markdown):
-Question text
-A. Answer choice 1 text
-B. Answer choice 2 text
-C. Answer choice 3 text
-D. Answer choice 4 text
-Answer: [Letter]. [Full correct answer text]
-Explanation: [1-3 sentences focusing on MCAT-relevant concept]
-
-CRITICAL CONSTRAINTS:
-- Produce EXACTLY THREE MCQs.
-- Each MCQ must assess a different perspective (definition vs. application vs. discrimination, etc.).
-- Ensure exactly four options A–D; only one option is indisputably correct.
-- Use precise MCAT-appropriate physics terminology.
-
-SEPARATION:
-- Separate the three MCQs with a single line containing only: ---
-"""
-    body = {
-        "model": model,
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.45,
-        "max_tokens": 1400,
-    }
-    resp = requests.post(api_url, headers=headers, json=body, timeout=60)
-    resp.raise_for_status()
-    data = resp.json()
-    content = data["choices"][0]["message"]["content"]
-    return split_three_blocks(content)
-
-
-def split_three_blocks(raw: str) -> list[str]:
-    raw = (raw or "").strip()
-    parts = []
-    buf = []
-    for line in raw.splitlines():
-        if line.strip() == '---':
-            if buf:
-                parts.append("\n".join(buf).strip())
-                buf = []
-        else:
-            buf.append(line)
-    if buf:
-        parts.append("\n".join(buf).strip())
-    if len(parts) != 3:
-        candidates = [blk.strip() for blk in raw.split("\n\n\n") if blk.strip()]
-        if len(candidates) == 3:
-            parts = candidates
-    return [p.strip() for p in parts[:3]]
 
 
 st.set_page_config(page_title="MCAT MCQ Generator", layout="wide")
@@ -236,6 +101,11 @@ with st.sidebar:
         model = st.text_input("Gemini Model", value=os.getenv("GEMINI_MODEL", "gemini-1.5-pro"))
     else:
         model = st.text_input("Mistral Model", value=os.getenv("MISTRAL_MODEL", "mistral-large-latest"))
+    stream = st.checkbox("Show questions as they arrive", value=True,
+                         help="Streams each reply and shows every question as soon as it is complete (one point per request).")
+    batch_size = st.number_input("Points per request", min_value=1, max_value=20, value=min(get_batch_size(), 20),
+                                 disabled=stream,
+                                 help="Larger batches repeat the instructions less often; malformed batches are re-split automatically.")
 
 uploaded = st.file_uploader("Upload a PDF", type=["pdf"]) 
 
@@ -253,50 +123,34 @@ if uploaded is not None:
         if st.button("Generate 3 MCQs per point"):
             target_points = points
 
+            live = st.container()
+            on_record = (lambda record: live.text(format_mcq_text(record))) if stream else None
+
             with st.spinner("Generating MCQs for all points... This may take a while"):
-                outputs = []
-                mapping = []
-                for p_idx, pt in enumerate(target_points, start=1):
+                records = []
+                for batch in batch_points(target_points, 1 if stream else batch_size):
                     try:
-                        if provider == "OpenAI":
-                            mcqs = generate_three_mcqs_openai(pt, model)
-                        elif provider == "Gemini":
-                            mcqs = generate_three_mcqs_gemini(pt, model)
-                        else:
-                            api_url = os.getenv("MISTRAL_API_URL", "https://api.mistral.ai/v1/chat/completions")
-                            mcqs = generate_three_mcqs_mistral(pt, model, api_url)
-
-                        letters = ['a', 'b', 'c']
-                        assigned = []
-                        for j, mcq in enumerate(mcqs):
-                            if not mcq.strip():
-                                continue
-                            lines = mcq.splitlines()
-                            q_idx = None
-                            for k, ln in enumerate(lines):
-                                if ln.strip():
-                                    q_idx = k
-                                    break
-                            label = f"{p_idx}{letters[j]}"
-                            if q_idx is not None:
-                                lines[q_idx] = f"{label}. {lines[q_idx].lstrip()}"
-                            outputs.append("\n".join(lines).strip())
-                            assigned.append(label)
-                        if assigned:
-                            mapping.append((pt, assigned))
+                        results = generate_mcqs(provider.lower(), batch, model, on_record)
                     except Exception as e:
-                        st.error(f"Error generating for point {p_idx}: {e}")
-
-            st.success(f"Generated {len(outputs)} MCQs.")
+                        st.error(f"Error generating for points {batch[0][0]}-{batch[-1][0]}: {e}")
+                        continue
+                    for p_idx, _ in batch:
+                        point_records, errors = results[p_idx]
+                        for error in errors:
+                            st.warning(f"Point {p_idx}: rejected {error}")
+                        records.extend(point_records)
+
+            st.success(f"Generated {len(records)} MCQs.")
+            cache = get_llm_cache()
+            if cache is not None:
+                st.caption(f"LLM cache: {cache.hits} hits, {cache.misses} misses ({hit_rate(cache.hits, cache.misses):.1f}% hit rate)")
+                cache.record_stats()
 
             provider_tag = provider.lower()
-            txt = "\n\n".join(outputs)
-            md_lines = ["| Source Point | Question ID(s) |", "|---|---|"]
-            for pt, ids in mapping:
-                safe = pt.replace("|", "\\|")
-                md_lines.append(f"| {safe} | {', '.join(ids)} |")
-            md = "\n".join(md_lines)
+            txt = "\n\n".join(format_mcq_text(r) for r in records)
+            md = mapping_markdown(records)
 
+            st.download_button("Download MCQs (.jsonl)", data=records_to_jsonl(records).encode("utf-8"), file_name=f"summary_mcqs_{provider_tag}.jsonl", mime="application/jsonl")
             st.download_button("Download MCQs (.txt)", data=txt.encode("utf-8"), file_name=f"summary_questions_{provider_tag}.txt", mime="text/plain")
             st.download_button("Download Mapping (.md)", data=md.encode("utf-8"), file_name=f"points_to_questions_{provider_tag}.md", mime="text/markdown")
 
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import re
+
+from mcq_layout import CHOICE_LETTERS, CHOICE_PAT
+from mcq_parser import clean_line
+
+DEFAULT_STORE_FILE = "mcq_answers.json"
+
+# "**Question 3**" / "Question 3" headers in model output
+HEADER_PAT = re.compile(r"^Question\s+\d+\s*:?$", re.IGNORECASE)
+# "Correct Answer: ..." / "Answer - ..." labels in front of the answer line
+ANSWER_LABEL_PAT = re.compile(r"^(?:correct\s+)?answer\s*[:\-]?\s*", re.IGNORECASE)
+# Words too common in question stems to say whether two stems ask about the same thing
+STEM_STOPWORDS = {"which", "following", "would", "most", "likely", "what", "that", "this", "these", "those", "with",
+                  "from", "have", "does", "expected", "result", "best", "describes", "statement", "true", "false"}
+
+
+def normalize_choice(text):
+    """Lowercase, drop punctuation and collapse whitespace, so OCR and model re-typing don't change the key"""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+def choice_key(choices):
+    """Hash of the normalized choice set; the same four choices in any order give the same key"""
+    normalized = sorted(normalize_choice(choice) for choice in choices)
+    return hashlib.sha256("\n".join(normalized).encode("utf-8")).hexdigest()[:16]
+
+def stem_words(text):
+    """Content words of a question stem, cut to five letters so "gland" and "glands" agree"""
+    return {word[:5] for word in normalize_choice(text).split() if len(word) >= 4 and word not in STEM_STOPWORDS}
+
+def match_choice(answer, choices):
+    """Return the index of the choice an answer line refers to (the text itself, "A. text" or "A"), or None.
+    The text is compared first, so a choice like "C. elegans" or "d" isn't mistaken for a letter.
+    """
+    answer = ANSWER_LABEL_PAT.sub("", clean_line(answer))
+    normalized = normalize_choice(answer)
+    targets = [normalize_choice(choice) for choice in choices]
+    if normalized in targets:
+        return targets.index(normalized)
+    letter_match = CHOICE_PAT.match(answer)
+    if letter_match:
+        return CHOICE_LETTERS.index(letter_match.group(1).upper())
+    if answer.upper() in CHOICE_LETTERS:
+        return CHOICE_LETTERS.index(answer.upper())
+    contained = [i for i, target in enumerate(targets) if target and (target in normalized or normalized in target)]
+    return contained[0] if len(contained) == 1 else None
+
+def parse_answered_mcqs(text):
+    """Parse model output laid out as question / A.-D. / correct answer / explanation blocks.
+    Returns a list of {"question", "choices", "answer" (choice index), "explanation"}; blocks whose
+    answer line can't be matched to one of the choices are left out.
+    """
+    lines = [clean_line(line) for line in text.splitlines()]
+    # A block is anchored on four consecutive A.-D. lines (blank lines between them allowed)
+    anchors = []
+    i = 0
+    while i < len(lines):
+        found, j = [], i
+        for letter in CHOICE_LETTERS:
+            while j < len(lines) and not lines[j]:
+                j += 1
+            m = CHOICE_PAT.match(lines[j]) if j < len(lines) else None
+            if not m or m.group(1).upper() != letter:
+                break
+            found.append((j, m.group(2).strip()))
+            j += 1
+        if len(found) == 4:
+            anchors.append(found)
+            i = j
+        else:
+            i += 1
+
+    records = []
+    previous_end = 0
+    for n, found in enumerate(anchors):
+        first, last = found[0][0], found[-1][0]
+        # The question is the paragraph right above A.
+        start = first
+        while start > previous_end and lines[start - 1]:
+            start -= 1
+        question = " ".join(line for line in lines[start:first] if not HEADER_PAT.match(line))
+        # The answer is the first line after D.; the explanation runs up to the next question's paragraph
+        if n + 1 < len(anchors):
+            end = anchors[n + 1][0][0]
+            while end > last + 1 and lines[end - 1]:
+                end -= 1
+        else:
+            end = len(lines)
+        tail = [line for line in lines[last + 1:end] if line and not HEADER_PAT.match(line)]
+        previous_end = end
+        choices = [text for _, text in found]
+        if not tail:
+            continue
+        answer = match_choice(tail[0], choices)
+        if answer is None:
+            continue
+        records.append({"question": question, "choices": choices, "answer": answer, "explanation": " ".join(tail[1:])})
+    return records
+
+
+class AnswerStore:
+    """Answers and explanations per question: a list of stored questions per choice_key() of their choices,
+    since different questions can share a choice set (True/False, the same four numbers).
+    Answers are kept as choice text, so a question whose choices were reordered still finds its letter.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_FILE, load=True):
+        self.path = path
+        self.entries = {}
+        if not load:
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        # Stores written before the per-key lists held a single entry per key
+        self.entries = {key: [entry] if isinstance(entry, dict) else entry for key, entry in entries.items()}
+
+    def find(self, question, choices):
+        """Return the stored entry for this question, or None when there is none or it is ambiguous.
+        A stem that matches exactly wins; otherwise the choice set must belong to a single stored question
+        whose stem shares content words with this one (refining rewords the stem but keeps its subject).
+        """
+        candidates = self.entries.get(choice_key(choices), [])
+        exact = [entry for entry in candidates if normalize_choice(entry["question"]) == normalize_choice(question)]
+        if len(exact) == 1:
+            return exact[0]
+        if len(candidates) == 1 and stem_words(candidates[0]["question"]) & stem_words(question):
+            return candidates[0]
+        return None
+
+    def get(self, question, choices):
+        """Return (answer index into `choices`, explanation) for a stored question, or None"""
+        entry = self.find(question, choices)
+        if entry is None:
+            return None
+        targets = [normalize_choice(choice) for choice in choices]
+        answer = normalize_choice(entry["answer"])
+        if answer not in targets:
+            return None
+        return targets.index(answer), entry["explanation"]
+
+    def put(self, question, choices, answer, explanation):
+        """Record the answer (an index into `choices`) and explanation for a question, replacing an earlier
+        entry for the same stem and choices
+        """
+        entries = self.entries.setdefault(choice_key(choices), [])
+        entries[:] = [entry for entry in entries if normalize_choice(entry["question"]) != normalize_choice(question)]
+        entries.append({
+            "question": question,
+            "answer": choices[answer],
+            "explanation": explanation,
+        })
+
+    def save(self):
+        """Write the store atomically"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,166 @@
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from ocr import (
+    PageWriter,
+    default_ocr_options,
+    get_default_window,
+    get_default_workers,
+    init_worker,
+    iter_pages,
+    resolve_backend,
+)
+from ocr_backends import BACKEND_CHOICES
+from ocr_cache import OCRCache
+
+
+def find_pdfs(inputs):
+    """Expand directories (recursively) and glob patterns into a sorted list of PDF paths"""
+    found = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "**", "*.pdf")
+        for path in glob.glob(pattern, recursive=True):
+            if path.lower().endswith(".pdf") and os.path.isfile(path):
+                found.add(os.path.abspath(path))
+    return sorted(found)
+
+def output_path_for(pdf_path, root, out_dir, fmt="txt"):
+    """Mirror the PDF's location under the common input root, so same-named files in different folders don't clash"""
+    relative = os.path.relpath(pdf_path, root)
+    return os.path.join(out_dir, os.path.splitext(relative)[0] + "." + fmt)
+
+def file_signature(pdf_path):
+    """Size and mtime; a file whose signature changed since it was recorded is processed again"""
+    st = os.stat(pdf_path)
+    return {"size": st.st_size, "mtime": int(st.st_mtime)}
+
+def load_manifest(manifest_path):
+    """Return {pdf_path: entry} for every file recorded as finished"""
+    done = {}
+    if not os.path.exists(manifest_path):
+        return done
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a half-written last line; that file is simply redone
+                continue
+            done[entry["pdf"]] = entry
+    return done
+
+def append_manifest(manifest_path, entry):
+    """Record one finished file; flushed and fsynced so a crash right after never loses it"""
+    with open(manifest_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def ocr_file(task):
+    """Worker: OCR one PDF, streaming pages into a temp file that replaces the output once the PDF is done"""
+    pdf_path, out_path, options, window, hybrid, fmt = task
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = out_path + ".tmp"
+    sources = []
+    with PageWriter(tmp_path, fmt) as writer:
+        for page in iter_pages(pdf_path, workers=1, window=window, hybrid=hybrid, options=options):
+            writer.write(page)
+            sources.append(page["source"])
+    os.replace(tmp_path, out_path)
+
+    return {
+        "pages": len(sources),
+        "seconds": round(time.perf_counter() - start, 2),
+        "cache_hits": sources.count("cache"),
+        "cache_misses": sum(1 for source in sources if source.startswith("ocr")),
+    }
+
+def main():
+    options = default_ocr_options()
+    parser = argparse.ArgumentParser(description="OCR every PDF in a directory or glob, resuming after crashes")
+    parser.add_argument("inputs", nargs="+", help="Directories (searched recursively) and/or glob patterns, e.g. \"exams/*.pdf\"")
+    parser.add_argument("-o", "--out-dir", default="ocr_output", help="Where to write one output file per PDF (default: ocr_output)")
+    parser.add_argument("--format", choices=["txt", "jsonl"], default="txt", help="Per-PDF output format, as in ocr.py (default: txt)")
+    parser.add_argument("--manifest", default=None, help="Finished-files log (default: <out-dir>/manifest.jsonl)")
+    parser.add_argument("-j", "--jobs", type=int, default=get_default_workers(),
+                        help="PDFs processed concurrently, one worker process each (default: OCR_WORKERS or CPU count)")
+    parser.add_argument("--window", type=int, default=get_default_window(), help="Pages rasterized at a time per worker")
+    parser.add_argument("--hybrid", action="store_true", help="Use embedded text layers and OCR only scanned pages")
+    parser.add_argument("--dpi", type=int, default=options["dpi"], help="Rasterization DPI")
+    parser.add_argument("--preprocess", action="store_true", default=options["preprocess"], help="Preprocess pages before OCR")
+    parser.add_argument("--backend", choices=BACKEND_CHOICES, default=options["backend"], help="OCR backend (default: auto)")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore the OCR result cache")
+    parser.add_argument("--force", action="store_true", help="Reprocess files even if the manifest says they are done")
+    args = parser.parse_args()
+
+    options.update(
+        dpi=args.dpi,
+        preprocess=args.preprocess,
+        backend=resolve_backend(args.backend),
+        cache_dir=None if args.no_cache else options["cache_dir"],
+    )
+    manifest_path = args.manifest or os.path.join(args.out_dir, "manifest.jsonl")
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    pdfs = find_pdfs(args.inputs)
+    if not pdfs:
+        print("No PDF files matched.")
+        return
+    root = os.path.commonpath([os.path.dirname(p) for p in pdfs])
+
+    done = {} if args.force else load_manifest(manifest_path)
+    tasks = []
+    for pdf_path in pdfs:
+        entry = done.get(pdf_path)
+        if entry and entry["signature"] == file_signature(pdf_path) and os.path.exists(entry["output"]):
+            continue
+        out_path = output_path_for(pdf_path, root, args.out_dir, args.format)
+        tasks.append((pdf_path, out_path, options, args.window, args.hybrid, args.format))
+    print(f"Found {len(pdfs)} PDFs: {len(pdfs) - len(tasks)} already done, {len(tasks)} to process with {args.jobs} job(s)\n")
+    if not tasks:
+        return
+
+    start = time.perf_counter()
+    total_pages = hits = misses = finished = failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(tasks))), initializer=init_worker) as pool:
+        futures = {pool.submit(ocr_file, task): task for task in tasks}
+        for future in as_completed(futures):
+            pdf_path, out_path = futures[future][:2]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"FAILED {pdf_path}: {e}")
+                continue
+            append_manifest(manifest_path, {
+                "pdf": pdf_path,
+                "output": out_path,
+                "signature": file_signature(pdf_path),
+                **result,
+            })
+            finished += 1
+            total_pages += result["pages"]
+            hits += result["cache_hits"]
+            misses += result["cache_misses"]
+            minutes = max((time.perf_counter() - start) / 60, 1e-6)
+            print(f"[{finished}/{len(tasks)}] {os.path.relpath(pdf_path, root)}: {result['pages']} pages in {result['seconds']:.1f}s "
+                  f"({finished / minutes:.1f} files/min, {total_pages / minutes:.1f} pages/min)")
+
+    minutes = max((time.perf_counter() - start) / 60, 1e-6)
+    print(f"\nDone: {finished} files, {total_pages} pages in {minutes * 60:.1f}s "
+          f"({finished / minutes:.1f} files/min, {total_pages / minutes:.1f} pages/min)")
+    if failed:
+        print(f"{failed} file(s) failed; rerun the same command to retry them")
+    if options["cache_dir"]:
+        cache = OCRCache(options["cache_dir"])
+        cache.record_stats(hits, misses)
+        cache.evict()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import re
+import time
+
+import numpy as np
+from pdf2image import convert_from_path
+
+from ocr import DEFAULT_DPI
+from ocr_backends import get_backend, tesserocr_installed
+from preprocess import DEFAULT_TARGET_DPI, preprocess_page
+
+
+def normalize_text(text):
+    """Collapse whitespace and typographic quotes so accuracy reflects characters, not layout"""
+    text = text.replace("’", "'").replace("‘", "'").replace("“", '"').replace("”", '"')
+    return re.sub(r"\s+", " ", text).strip()
+
+def edit_distance(a, b):
+    """Levenshtein distance between two strings, one NumPy row per character of a"""
+    if not a or not b:
+        return max(len(a), len(b))
+    b_codes = np.frombuffer(b.encode("utf-32-le"), dtype=np.uint32)
+    offsets = np.arange(len(b) + 1)
+    prev = offsets.copy()
+    for i, ch in enumerate(a, start=1):
+        cost = (b_codes != ord(ch)).astype(np.int64)
+        cur = np.empty_like(prev)
+        cur[0] = i
+        cur[1:] = np.minimum(prev[1:] + 1, prev[:-1] + cost)
+        # Insertions chain along the row: cur[j] = min over k <= j of cur[k] + (j - k)
+        cur = np.minimum.accumulate(cur - offsets) + offsets
+        prev = cur
+    return int(prev[-1])
+
+def char_accuracy(reference, hypothesis):
+    """Return 1 - CER (character error rate) of the hypothesis against the reference, floored at 0"""
+    reference, hypothesis = normalize_text(reference), normalize_text(hypothesis)
+    if not reference:
+        return 0.0
+    return max(0.0, 1.0 - edit_distance(reference, hypothesis) / len(reference))
+
+def run_mode(images, preprocess, backend, dpi, target_dpi):
+    """OCR every page, returning (texts, per-page seconds including preprocessing)"""
+    texts, timings = [], []
+    for image in images:
+        start = time.perf_counter()
+        if preprocess:
+            image = preprocess_page(image, dpi, target_dpi)
+        texts.append(backend.image_to_string(image))
+        timings.append(time.perf_counter() - start)
+    return texts, timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR time and character accuracy per backend, with and without preprocessing")
+    parser.add_argument("pdf_path", nargs="?", default="test.pdf", help="PDF to OCR (default: test.pdf)")
+    parser.add_argument("--reference", default="test_reference.txt", help="Ground-truth text for the PDF (default: test_reference.txt)")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI, help=f"Rasterization DPI (default: {DEFAULT_DPI})")
+    parser.add_argument("--target-dpi", type=int, default=DEFAULT_TARGET_DPI, help=f"Preprocessing target DPI (default: {DEFAULT_TARGET_DPI})")
+    parser.add_argument("--tesseract-config", default="", help="Extra Tesseract arguments")
+    parser.add_argument("--repeat", type=int, default=1, help="Repeat each mode and keep the fastest run (default: 1)")
+    args = parser.parse_args()
+
+    with open(args.reference, "r", encoding="utf-8") as f:
+        reference = f.read()
+    images = convert_from_path(args.pdf_path, dpi=args.dpi)
+    print(f"{args.pdf_path}: {len(images)} page(s) at {args.dpi} DPI\n")
+
+    backend_names = ["pytesseract"] + (["tesserocr"] if tesserocr_installed() else [])
+    latencies = {}
+    print(f"{'Backend':<12} {'Mode':<14} {'ms/page':>8} {'char accuracy':>14}")
+    for backend_name in backend_names:
+        # Engine start-up is paid here, outside the timed loop, as a long-lived worker would
+        backend = get_backend(backend_name, args.tesseract_config)
+        for label, preprocess in (("raw", False), ("preprocessed", True)):
+            best = None
+            for _ in range(max(1, args.repeat)):
+                texts, timings = run_mode(images, preprocess, backend, args.dpi, args.target_dpi)
+                if best is None or sum(timings) < sum(best[1]):
+                    best = (texts, timings)
+            texts, timings = best
+            latencies[(backend_name, label)] = 1000 * sum(timings) / len(timings)
+            accuracy = char_accuracy(reference, "\n".join(texts))
+            print(f"{backend_name:<12} {label:<14} {latencies[(backend_name, label)]:>8.0f} {accuracy:>13.1%}")
+
+    if not tesserocr_installed():
+        print("\ntesserocr not installed; skipping the in-process backend (pip install tesserocr)")
+    else:
+        for label in ("raw", "preprocessed"):
+            saved = latencies[("pytesseract", label)] - latencies[("tesserocr", label)]
+            print(f"\ntesserocr vs pytesseract ({label}): {saved:+.0f} ms/page saved")
+
+if __name__ == "__main__":
+    main()
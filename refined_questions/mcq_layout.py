@@ -0,0 +1,115 @@
+import json
+import re
+
+from ocr_backends import iter_words
+
+CHOICE_LETTERS = ["A", "B", "C", "D"]
+
+# "9." / "10)" / "(11)" at the start of a line; Tesseract often reads the period as "," or ":"
+QUESTION_PAT = re.compile(r"^\(?(\d{1,3})\s*[.,:)]\s*(.*)$")
+# "A." / "b)" / "(C)"; a bare leading "A" is not a marker ("A disorder of the...")
+CHOICE_PAT = re.compile(r"^\(?([A-Da-d])\s*[.,:)]\s*(.*)$")
+
+
+def group_lines(data):
+    """Group image_to_data words into text lines in Tesseract's reading order.
+    Each line records where its text starts horizontally, skipping a leading "9." or "A." marker,
+    so continuation lines can be matched against the indentation of the item they belong to.
+    """
+    lines = []
+    index = {}
+    for word in iter_words(data):
+        key = (word["block_num"], word["par_num"], word["line_num"])
+        if key not in index:
+            index[key] = len(lines)
+            lines.append({"words": [], "left": word["left"], "height": word["height"]})
+        line = lines[index[key]]
+        line["words"].append(word)
+        line["left"] = min(line["left"], word["left"])
+        line["height"] = max(line["height"], word["height"])
+
+    for line in lines:
+        words = line["words"]
+        line["text"] = " ".join(w["text"].strip() for w in words)
+        first = words[0]["text"].strip()
+        is_marker = QUESTION_PAT.match(first) or CHOICE_PAT.match(first)
+        if is_marker and not is_marker.group(2) and len(words) > 1:
+            line["text_left"] = words[1]["left"]
+        else:
+            line["text_left"] = line["left"]
+    return lines
+
+def _finish(record):
+    choices = [record["choices"].get(letter, "").strip() for letter in CHOICE_LETTERS]
+    stem = record["question"].strip()
+    return {
+        "number": record["number"],
+        "question": stem,
+        "choices": choices,
+        "page": record["page"],
+        "clean": bool(stem) and all(choices) and list(record["choices"]) == CHOICE_LETTERS,
+    }
+
+def detect_mcqs(data, page_no=1):
+    """Turn one page of image_to_data output into question records.
+    Returns (records, clean): each record is {"number", "question", "choices" (A-D), "page", "clean"}.
+    The page is clean when it has questions, every question has a stem and exactly four choices
+    A-D in order, and no text after the first question was left unassigned.
+    """
+    records = []
+    current = None
+    choice = None
+    choice_left = 0
+    stray_lines = 0
+
+    for line in group_lines(data):
+        text = line["text"]
+        tolerance = line["height"]
+        q_match = QUESTION_PAT.match(text)
+        c_match = CHOICE_PAT.match(text)
+
+        if q_match and (current is None or current["choices"] or not current["question"].strip()):
+            if current is not None:
+                records.append(_finish(current))
+            current = {"number": int(q_match.group(1)), "question": q_match.group(2), "choices": {}, "page": page_no}
+            choice = None
+        elif c_match and current is not None:
+            choice = c_match.group(1).upper()
+            if choice in current["choices"]:
+                # A repeated letter means we lost track of the structure
+                current["choices"]["?"] = c_match.group(2)
+            else:
+                current["choices"][choice] = c_match.group(2)
+            choice_left = line["text_left"]
+        elif current is not None and choice is None:
+            current["question"] += " " + text
+        elif current is not None and line["left"] >= choice_left - tolerance:
+            # Indented under the choice text: a wrapped choice
+            current["choices"][choice] += " " + text
+        elif records or current is not None:
+            # Back at the margin after the choices without a question number: a question we can't place
+            stray_lines += 1
+
+    if current is not None:
+        records.append(_finish(current))
+    clean = bool(records) and stray_lines == 0 and all(r["clean"] for r in records)
+    return records, clean
+
+def format_mcqs(records, start=1):
+    """Format question records the way task 1 lays out MCQs, numbering them from `start`"""
+    blocks = []
+    for number, record in enumerate(records, start=start):
+        lines = [f"{number}. {record['question']}", ""]
+        lines += [f"{letter}. {text}" for letter, text in zip(CHOICE_LETTERS, record["choices"])]
+        blocks.append("\n".join(lines))
+    return "\n\n\n".join(blocks)
+
+def read_layout(path):
+    """Return (per-page records {"page", "clean", "text", "mcqs", ...}, sha256 of the text output they were written
+    with or None) from ocr.py --layout. The hash is on the last line, which ocr.py only adds once the run has finished.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    pages = [record for record in records if "page" in record]
+    output_hash = records[-1].get("output_sha256") if records else None
+    return pages, output_hash
@@ -0,0 +1,188 @@
+import argparse
+import re
+
+from mcq_layout import CHOICE_LETTERS, CHOICE_PAT, format_mcqs
+
+# "9." / "1O." / "(12)" at the start of a line; O/o/l/I/| inside the number are OCR misreads of 0 and 1
+NUMBER_PAT = re.compile(r"^\(?([0-9OolI|]{1,3})\s*[.,:)]\s*(.*)$")
+# Page delimiter lines written by ocr.py
+PAGE_PAT = re.compile(r"^=+ Page (\d+) =+$")
+# Bullets and dashes Tesseract puts in front of lines, plus markdown bold from already formatted text
+BULLET_PAT = re.compile(r"^(?:[•·▪●○■□‣⁃∙»>*\-–—]+\s+|\*+)")
+# Characters that rarely appear in real questions but often in OCR garbage
+NOISE_PAT = re.compile(r"[^\w\s.,;:?!'\"()\[\]/%&$+=<>\-–—‘’“”]")
+# Choice markers commonly misread when the next expected letter is the one in the value
+CHOICE_MISREADS = {"8": "B", "0": "D", "O": "D"}
+DIGIT_FIXES = str.maketrans("OolI|", "00111")
+
+DEFAULT_MIN_CONFIDENCE = 0.8
+
+
+def clean_line(line):
+    """Strip stray bullets, markdown bold and surrounding whitespace from one OCR line"""
+    line = BULLET_PAT.sub("", line.strip())
+    return line.replace("**", "").strip()
+
+def join_broken(text, continuation):
+    """Append a wrapped line, re-joining words hyphenated across the break"""
+    if not text:
+        return continuation
+    if text.endswith("-") and text[-2:-1].isalpha() and continuation[:1].islower():
+        return text[:-1] + continuation
+    return text + " " + continuation
+
+def split_inline_choices(text, letters):
+    """Split "foo B. bar C. baz" into ("foo", [("B", "bar"), ("C", "baz")]), trying the letters in order"""
+    head, extras = text, []
+    for letter in letters:
+        rest = extras[-1][1] if extras else head
+        m = re.search(rf"\s\(?{letter}[.)]\s+", rest)
+        if not m:
+            break
+        if extras:
+            extras[-1] = (extras[-1][0], rest[:m.start()].strip())
+        else:
+            head = rest[:m.start()].strip()
+        extras.append((letter, rest[m.end():].strip()))
+    return head, extras
+
+def _new_record(number, text, page, line):
+    return {"number": number, "question": text, "choices": {}, "page": page, "raw": [line], "issues": []}
+
+def _add_choice(record, letter, text):
+    if letter in record["choices"]:
+        record["issues"].append(f"repeated choice {letter}")
+        record["choices"][letter] += " " + text
+    else:
+        record["choices"][letter] = text
+
+def score(record, previous_number):
+    """Return (confidence 0-1, issues) for a parsed question; 1.0 means it can be formatted without the model"""
+    issues = list(record["issues"])
+    confidence = 1.0 - 0.05 * sum(1 for issue in issues if issue.startswith("read "))
+    confidence -= 0.3 * sum(1 for issue in issues if issue.startswith("repeated "))
+
+    stem = record["question"].strip()
+    choices = [record["choices"].get(letter, "").strip() for letter in CHOICE_LETTERS]
+    if not stem:
+        issues.append("no question text")
+        confidence = 0.0
+    elif len(stem.split()) < 3:
+        issues.append("very short question")
+        confidence -= 0.3
+    missing = [letter for letter, text in zip(CHOICE_LETTERS, choices) if not text]
+    if missing:
+        issues.append(f"missing choice(s) {''.join(missing)}")
+        confidence -= 0.5
+    if list(record["choices"]) != CHOICE_LETTERS[:len(record["choices"])]:
+        issues.append("choices out of order")
+        confidence -= 0.3
+    if previous_number is not None and record["number"] != previous_number + 1:
+        issues.append(f"numbered {record['number']} after {previous_number}")
+        confidence -= 0.15
+
+    text = stem + " " + " ".join(choices)
+    if len(NOISE_PAT.findall(text)) > 0.03 * len(text):
+        issues.append("unusual characters")
+        confidence -= 0.3
+    others = [len(c) for c in choices[:-1] if c]
+    if choices[-1] and others and len(choices[-1]) > 80 and len(choices[-1]) > 2.5 * max(others):
+        # Text after D. without a question number is usually an unnumbered question swallowed into D
+        issues.append("last choice much longer than the others")
+        confidence -= 0.3
+    return max(0.0, round(confidence, 2)), issues
+
+def parse_mcq_text(content):
+    """Parse OCR'd MCQ text into question records without the model.
+    Returns (preamble, records). Each record is {"number", "question", "choices" (A-D), "page",
+    "clean", "confidence", "issues", "raw"}, where raw is the original text of the question.
+    """
+    preamble = []
+    records = []
+    current = None
+    page = 1
+
+    for raw_line in content.splitlines():
+        page_match = PAGE_PAT.match(raw_line.strip())
+        if page_match:
+            page = int(page_match.group(1))
+            continue
+        line = clean_line(raw_line)
+        if not line:
+            continue
+
+        expected = None
+        if current is not None:
+            expected = next((letter for letter in CHOICE_LETTERS if letter not in current["choices"]), None)
+        c_match = CHOICE_PAT.match(line)
+        n_match = NUMBER_PAT.match(line)
+        misread = n_match and expected and current["choices"] and CHOICE_MISREADS.get(n_match.group(1)) == expected
+
+        if misread:
+            current["issues"].append(f"read {n_match.group(1)!r} as {expected}")
+            _add_choice(current, expected, n_match.group(2))
+            current["raw"].append(raw_line)
+        elif c_match and current is not None:
+            letter = c_match.group(1).upper()
+            text, extras = split_inline_choices(c_match.group(2), CHOICE_LETTERS[CHOICE_LETTERS.index(letter) + 1:])
+            _add_choice(current, letter, text)
+            for extra_letter, extra_text in extras:
+                _add_choice(current, extra_letter, extra_text)
+            current["raw"].append(raw_line)
+        elif n_match and any(ch.isdigit() for ch in n_match.group(1)) and (current is None or current["choices"]):
+            if current is not None:
+                records.append(current)
+            number = n_match.group(1)
+            stem, extras = n_match.group(2), []
+            if "?" in stem or ":" in stem:
+                # "9. Which...? A. foo B. bar" with the choices run into the question line
+                stem, extras = split_inline_choices(stem, CHOICE_LETTERS)
+            current = _new_record(int(number.translate(DIGIT_FIXES)), stem, page, raw_line)
+            if not number.isdigit():
+                current["issues"].append(f"read {number!r} as {number.translate(DIGIT_FIXES)}")
+            for letter, text in extras:
+                _add_choice(current, letter, text)
+        elif current is None:
+            preamble.append(line)
+        else:
+            if current["choices"]:
+                letter = list(current["choices"])[-1]
+                current["choices"][letter] = join_broken(current["choices"][letter], line)
+            else:
+                current["question"] = join_broken(current["question"], line)
+            current["raw"].append(raw_line)
+
+    if current is not None:
+        records.append(current)
+
+    previous_number = None
+    for record in records:
+        record["confidence"], record["issues"] = score(record, previous_number)
+        record["clean"] = record["confidence"] >= 1.0
+        record["choices"] = [record["choices"].get(letter, "").strip() for letter in CHOICE_LETTERS]
+        record["question"] = record["question"].strip()
+        record["raw"] = "\n".join(record["raw"])
+        previous_number = record["number"]
+    return "\n".join(preamble), records
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse OCR'd MCQs locally and show how confident the parse is per question")
+    parser.add_argument("path", nargs="?", default="output.txt", help="OCR text to parse (default: output.txt)")
+    parser.add_argument("--min-confidence", type=float, default=DEFAULT_MIN_CONFIDENCE,
+                        help=f"Questions below this would be sent to the model (default: {DEFAULT_MIN_CONFIDENCE})")
+    parser.add_argument("--print", action="store_true", help="Print the locally formatted questions")
+    args = parser.parse_args()
+
+    with open(args.path, "r", encoding="utf-8") as f:
+        _, records = parse_mcq_text(f.read())
+    for record in records:
+        flag = "ok " if record["confidence"] >= args.min_confidence else "LLM"
+        issues = f" ({'; '.join(record['issues'])})" if record["issues"] else ""
+        print(f"{flag} Q{record['number']:<4} page {record['page']:<3} confidence {record['confidence']:.2f}{issues}")
+    local = [r for r in records if r["confidence"] >= args.min_confidence]
+    print(f"\n{len(local)} of {len(records)} questions can be formatted locally")
+    if args.print:
+        print("\n" + format_mcqs(local))
+
+if __name__ == "__main__":
+    main()
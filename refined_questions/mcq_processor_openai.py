@@ -1,9 +1,50 @@
+import argparse
+import itertools
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from openai import OpenAI
 
+# Optional exact token counting; falls back to a ~4 characters/token estimate
+try:
+    import tiktoken
+except Exception:
+    tiktoken = None
+
+from answer_store import DEFAULT_STORE_FILE, AnswerStore, parse_answered_mcqs
+from mcq_layout import CHOICE_LETTERS, format_mcqs, read_layout
+from mcq_parser import DEFAULT_MIN_CONFIDENCE, parse_mcq_text
+from task_graph import DEFAULT_STATE_FILE, Task, file_hash, run_graph
+
 load_dotenv()
 
+# Per-page question records written by `python ocr.py --layout`
+LAYOUT_FILE = 'mcq_layout.jsonl'
+
+# Pipeline files: OCR text in, one artifact per task out
+SOURCE_FILE = 'output.txt'
+FORMATTED_FILE = 'mcq_formatted.txt'
+FINAL_FILE = 'mcq_formatted_final.txt'
+REFINED_FILE = 'mcq_refined.txt'
+REFINED_ANSWERS_FILE = 'mcq_refined_with_answers.txt'
+# Answers from task 2, reused by task 4
+ANSWERS_FILE = DEFAULT_STORE_FILE
+
+# Task 1 splits the OCR text into chunks of about this many tokens and formats them concurrently
+CHUNK_TOKENS = int(os.getenv("MCQ_CHUNK_TOKENS", "1200"))
+FORMAT_WORKERS = int(os.getenv("MCQ_FORMAT_WORKERS", "4"))
+
+# Questions the local parser is at least this confident about (0-1) are formatted without the model
+MIN_CONFIDENCE = float(os.getenv("MCQ_MIN_CONFIDENCE", DEFAULT_MIN_CONFIDENCE))
+
+# "3." / "**3.**" / "Q3)" / "Question 3." at the start of a line
+QUESTION_START_PAT = re.compile(r"^(\s*\**\s*(?:Q(?:uestion)?\s*)?)(\d{1,3})(\s*\**\s*[.)])", re.IGNORECASE)
+# Page delimiter lines written by ocr.py
+PAGE_DELIMITER_PAT = re.compile(r"^=+ Page \d+ =+$")
+# "**Question 3**" headers in task 4's output
+QUESTION_HEADER_PAT = re.compile(r"\*\*Question \d+\*\*")
+
 # Configure OpenAI API
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
@@ -17,17 +58,77 @@ def write_file(filename, content):
     with open(filename, 'w', encoding='utf-8') as f:
         f.write(content)
 
-def task1_format_mcqs():
-    """Task 1: Format MCQs with proper numbering"""
-    print("Task 1: Formatting MCQs...")
-    
-    # Read the content
-    content = read_file('output.txt')
-    
-    # Create prompt for formatting
+def load_fresh_layout(source=SOURCE_FILE):
+    """Return the layout records from ocr.py --layout if they were produced with the current OCR text, else None.
+    Compares the hash of `source` recorded by ocr.py with the file's contents now, so copies and checkouts still match.
+    """
+    if not os.path.exists(LAYOUT_FILE) or not os.path.exists(source):
+        return None
+    pages, output_hash = read_layout(LAYOUT_FILE)
+    if output_hash is None or output_hash != file_hash(source):
+        return None
+    return pages
+
+def count_tokens(text):
+    """Count (or estimate) the tokens a piece of text costs in a prompt"""
+    if tiktoken is not None:
+        return len(tiktoken.get_encoding("cl100k_base").encode(text))
+    return len(text) // 4 + 1
+
+def split_questions(content):
+    """Split OCR text into one segment per question; any preamble stays in front of the first question.
+    Returns a list of (segment_text, is_question).
+    """
+    segments = []
+    buf = []
+    buf_is_question = False
+    for line in content.splitlines():
+        if PAGE_DELIMITER_PAT.match(line.strip()):
+            continue
+        if QUESTION_START_PAT.match(line):
+            if buf and "".join(buf).strip():
+                segments.append(("\n".join(buf).strip(), buf_is_question))
+            buf, buf_is_question = [], True
+        buf.append(line)
+    if buf and "".join(buf).strip():
+        segments.append(("\n".join(buf).strip(), buf_is_question))
+    return segments
+
+def chunk_questions(segments, budget=CHUNK_TOKENS):
+    """Pack whole question segments into chunks of at most `budget` tokens (an oversized question gets its own chunk).
+    Returns a list of (chunk_text, question_count).
+    """
+    chunks = []
+    parts, count, tokens = [], 0, 0
+    for text, is_question in segments:
+        cost = count_tokens(text)
+        if parts and tokens + cost > budget:
+            chunks.append(("\n\n".join(parts), count))
+            parts, count, tokens = [], 0, 0
+        parts.append(text)
+        count += int(is_question)
+        tokens += cost
+    if parts:
+        chunks.append(("\n\n".join(parts), count))
+    return chunks
+
+def renumber_questions(text):
+    """Renumber questions 1, 2, 3... in document order, so stitched chunks read as one continuous list"""
+    lines = text.splitlines()
+    number = 0
+    for i, line in enumerate(lines):
+        m = QUESTION_START_PAT.match(line)
+        if m:
+            number += 1
+            lines[i] = f"{m.group(1)}{number}{m.group(3)}{line[m.end():]}"
+    return "\n".join(lines)
+
+def llm_format_mcqs(content, start=1):
+    """Ask the model to fix up and number raw OCR'd MCQs, numbering from `start`"""
+    numbering = "" if start == 1 else f"\n    Number the questions sequentially starting from {start}."
     prompt = f"""Please correct and format the following MCQs in a proper format with clear question numbers. 
     Make sure each question is properly numbered sequentially, and fix any formatting issues.
-    Keep the original questions and choices intact, just improve the formatting and numbering.
+    Keep the original questions and choices intact, just improve the formatting and numbering.{numbering}
     
     Content to format:
     {content}
@@ -43,17 +144,106 @@ def task1_format_mcqs():
         max_tokens=3000,
         temperature=0.7
     )
-    formatted_content = response.choices[0].message.content
+    return response.choices[0].message.content
+
+def format_pieces(pieces, workers=FORMAT_WORKERS, budget=CHUNK_TOKENS):
+    """Format an ordered list of ("local", formatted_text, question_count) and ("llm", raw_text) pieces.
+    Raw text is split on question boundaries into token-budgeted chunks that are sent to the model
+    concurrently; results are stitched back in order and renumbered continuously.
+    """
+    outputs = []
+    jobs = []  # (index in outputs, chunk text, first question number)
+    number = 1
+    for piece in pieces:
+        if piece[0] == "local":
+            outputs.append(piece[1])
+            number += piece[2]
+            continue
+        for chunk_text, count in chunk_questions(split_questions(piece[1]), budget):
+            outputs.append(None)
+            jobs.append((len(outputs) - 1, chunk_text, number))
+            number += count
+
+    if jobs:
+        print(f"Formatting {len(jobs)} chunk(s) with up to {workers} concurrent request(s)...")
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            results = pool.map(lambda job: llm_format_mcqs(job[1], start=job[2]), jobs)
+            for (index, _, _), formatted in zip(jobs, results):
+                outputs[index] = formatted.strip()
+    return renumber_questions("\n\n\n".join(outputs))
+
+def plan_pieces(content, min_confidence=MIN_CONFIDENCE):
+    """Parse raw OCR text locally and split it into format_pieces() input: runs of confidently parsed
+    questions are formatted here, and only the original text of the doubtful ones goes to the model.
+    Returns (pieces, local_count, llm_count).
+    """
+    preamble, records = parse_mcq_text(content)
+    if not records:
+        return ([("llm", content)] if content.strip() else []), 0, 0
+
+    pieces = [("local", preamble, 0)] if preamble else []
+    run = []
+    llm_count = 0
+    for record in records:
+        if record["confidence"] >= min_confidence:
+            run.append(record)
+            continue
+        if run:
+            pieces.append(("local", format_mcqs(run), len(run)))
+            run = []
+        if pieces and pieces[-1][0] == "llm":
+            pieces[-1] = ("llm", pieces[-1][1] + "\n" + record["raw"])
+        else:
+            pieces.append(("llm", record["raw"]))
+        llm_count += 1
+    if run:
+        pieces.append(("local", format_mcqs(run), len(run)))
+    return pieces, len(records) - llm_count, llm_count
+
+def format_from_layout(layout_pages):
+    """Format pages that the layout stage parsed cleanly locally; the rest go through the text parser"""
+    pieces = []
+    layout_count = local_count = llm_count = 0
+    for page in layout_pages:
+        if page["clean"]:
+            pieces.append(("local", format_mcqs(page["mcqs"]), len(page["mcqs"])))
+            layout_count += 1
+        elif page["text"].strip():
+            page_pieces, local, llm = plan_pieces(page["text"])
+            pieces += page_pieces
+            local_count += local
+            llm_count += llm
+    print(f"Layout records found: {layout_count} page(s) formatted from word boxes; "
+          f"{local_count} question(s) on the other pages parsed locally, {llm_count} sent to the model")
+    return format_pieces(pieces)
+
+def task1_format_mcqs():
+    """Task 1: Format MCQs with proper numbering"""
+    print("Task 1: Formatting MCQs...")
+    
+    # Read the content
+    content = read_file(SOURCE_FILE)
+    
+    # Pages that ocr.py --layout already parsed into clean question records skip the model entirely
+    layout_pages = load_fresh_layout()
+    if layout_pages is not None:
+        formatted_content = format_from_layout(layout_pages)
+    else:
+        pieces, local_count, llm_count = plan_pieces(content)
+        print(f"Parsed {local_count} question(s) locally, {llm_count} sent to the model")
+        formatted_content = format_pieces(pieces)
     
-    # Replace the content in output.txt
-    write_file('output.txt', formatted_content)
-    print("Task 1 completed: output.txt has been updated with formatted MCQs.\n")
+    # Keep output.txt as the OCR text, so the next run can tell whether it changed
+    write_file(FORMATTED_FILE, formatted_content)
+    print(f"Task 1 completed: Formatted MCQs saved to {FORMATTED_FILE}\n")
     
     return formatted_content
 
-def task2_generate_formatted_output(formatted_content):
+def task2_generate_formatted_output(formatted_content=None):
     """Task 2: Generate complete formatted output with answers and explanations"""
     print("Task 2: Generating formatted output with answers and explanations...")
+    if formatted_content is None:
+        formatted_content = read_file(FORMATTED_FILE)
     
     # Create prompt for complete formatting
     prompt = f"""For each MCQ below, reformat it in the exact following structure:
@@ -100,14 +290,25 @@ Format each question exactly as shown above:"""
     formatted_output = response.choices[0].message.content
     
     # Save formatted output to a new file
-    write_file('mcq_formatted_final.txt', formatted_output)
-    print("Task 2 completed: Formatted output saved to mcq_formatted_final.txt\n")
+    write_file(FINAL_FILE, formatted_output)
+
+    # Keep each answer so task 4 can reuse it for the refined version of the same question; the store
+    # starts empty so questions from an earlier exam can't be matched
+    store = AnswerStore(ANSWERS_FILE, load=False)
+    answered = parse_answered_mcqs(formatted_output)
+    for record in answered:
+        store.put(record["question"], record["choices"], record["answer"], record["explanation"])
+    store.save()
+    print(f"Stored answers for {len(answered)} question(s) in {ANSWERS_FILE}")
+    print(f"Task 2 completed: Formatted output saved to {FINAL_FILE}\n")
     
     return formatted_output
 
-def task3_refine_questions(formatted_content):
+def task3_refine_questions(formatted_content=None):
     """Task 3: Refine questions while keeping choices unchanged"""
     print("Task 3: Refining questions...")
+    if formatted_content is None:
+        formatted_content = read_file(FORMATTED_FILE)
     
     # Create prompt for refining
     prompt = f"""Refine each question below to make it clearer and more professional while maintaining the same meaning.
@@ -134,19 +335,13 @@ def task3_refine_questions(formatted_content):
     refined_content = response.choices[0].message.content
     
     # Save refined questions to a new file
-    write_file('mcq_refined.txt', refined_content)
-    print("Task 3 completed: Refined questions saved to mcq_refined.txt\n")
+    write_file(REFINED_FILE, refined_content)
+    print(f"Task 3 completed: Refined questions saved to {REFINED_FILE}\n")
     
     return refined_content
 
-def task4_generate_answers_for_refined():
-    """Task 4: Generate answers and explanations for refined MCQs"""
-    print("Task 4: Generating answers and explanations for refined MCQs...")
-    
-    # Read the refined content
-    refined_content = read_file('mcq_refined.txt')
-    
-    # Create prompt for generating answers and explanations
+def llm_answer_mcqs(refined_content):
+    """Ask the model for answers and explanations for refined MCQs, in task 4's layout"""
     prompt = f"""For each MCQ below, reformat it in the exact following structure:
 
 **Question [number]**
@@ -193,16 +388,111 @@ Format each question exactly as shown above. REMEMBER: Every single question mus
         max_tokens=4000,
         temperature=0.7
     )
-    formatted_output = response.choices[0].message.content
+    return response.choices[0].message.content
+
+def llm_explain(question, choices, answer):
+    """Ask the model for just the explanation of an already known answer"""
+    options = "\n".join(f"{letter}. {text}" for letter, text in zip(CHOICE_LETTERS, choices))
+    prompt = f"""Explain in two or three sentences why the answer below is correct. Output only the explanation.
+
+{question}
+{options}
+Correct answer: {CHOICE_LETTERS[answer]}. {choices[answer]}"""
+
+    response = client.chat.completions.create(
+        model="gpt-3.5-turbo",
+        messages=[
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=300,
+        temperature=0.7
+    )
+    return response.choices[0].message.content.strip()
+
+def format_answered(record, answer, explanation):
+    """Lay out one answered question the way task 4 asks the model to"""
+    lines = ["**Question 1**", "", record["question"]]
+    lines += [f"{letter}. {text}" for letter, text in zip(CHOICE_LETTERS, record["choices"])]
+    lines += [f"{CHOICE_LETTERS[answer]}. {record['choices'][answer]}", explanation]
+    return "\n".join(lines)
+
+def renumber_headers(text):
+    """Renumber "**Question N**" headers 1, 2, 3... in document order"""
+    counter = itertools.count(1)
+    return QUESTION_HEADER_PAT.sub(lambda m: f"**Question {next(counter)}**", text)
+
+def task4_generate_answers_for_refined():
+    """Task 4: Generate answers and explanations for refined MCQs"""
+    print("Task 4: Generating answers and explanations for refined MCQs...")
+    
+    # Read the refined content
+    refined_content = read_file(REFINED_FILE)
+
+    # Task 3 keeps the choices unchanged, so most refined questions match an answer stored by task 2
+    store = AnswerStore(ANSWERS_FILE)
+    _, records = parse_mcq_text(refined_content)
+    if not records or not store.entries:
+        formatted_output = llm_answer_mcqs(refined_content)
+    else:
+        parts = []  # formatted text, or a ("explain", ...) / ("answer", ...) job for the model
+        reused = explained = 0
+        for record in records:
+            hit = store.get(record["question"], record["choices"]) if record["question"] and all(record["choices"]) else None
+            if hit is None:
+                if parts and isinstance(parts[-1], tuple) and parts[-1][0] == "answer":
+                    parts[-1] = ("answer", parts[-1][1] + "\n\n" + record["raw"])
+                else:
+                    parts.append(("answer", record["raw"]))
+            elif hit[1]:
+                parts.append(format_answered(record, *hit))
+                reused += 1
+            else:
+                parts.append(("explain", record, hit[0]))
+                reused += 1
+                explained += 1
+        missed = len(records) - reused
+        print(f"Reused {reused} answer(s) from Task 2 ({explained} needing a new explanation); {missed} question(s) sent to the model")
+
+        def run(job):
+            if job[0] == "explain":
+                return format_answered(job[1], job[2], llm_explain(job[1]["question"], job[1]["choices"], job[2]))
+            return llm_answer_mcqs(job[1]).strip()
+
+        jobs = [(i, part) for i, part in enumerate(parts) if isinstance(part, tuple)]
+        with ThreadPoolExecutor(max_workers=max(1, FORMAT_WORKERS)) as pool:
+            for (i, _), result in zip(jobs, pool.map(run, [job for _, job in jobs])):
+                parts[i] = result
+        formatted_output = renumber_headers("\n\n\n".join(parts))
     
     # Save formatted output to a new file
-    write_file('mcq_refined_with_answers.txt', formatted_output)
-    print("Task 4 completed: Refined MCQs with answers and explanations saved to mcq_refined_with_answers.txt\n")
+    write_file(REFINED_ANSWERS_FILE, formatted_output)
+    print(f"Task 4 completed: Refined MCQs with answers and explanations saved to {REFINED_ANSWERS_FILE}\n")
     
     return formatted_output
 
+# Task 1 feeds tasks 2 and 3, which run side by side; task 4 needs task 3's refined questions and task 2's answers
+TASKS = [
+    Task("format", task1_format_mcqs, inputs=[SOURCE_FILE, LAYOUT_FILE], outputs=[FORMATTED_FILE], optional=[LAYOUT_FILE]),
+    Task("answers", task2_generate_formatted_output, inputs=[FORMATTED_FILE], outputs=[FINAL_FILE, ANSWERS_FILE]),
+    Task("refine", task3_refine_questions, inputs=[FORMATTED_FILE], outputs=[REFINED_FILE]),
+    Task("refined-answers", task4_generate_answers_for_refined, inputs=[REFINED_FILE, ANSWERS_FILE],
+         outputs=[REFINED_ANSWERS_FILE], optional=[ANSWERS_FILE]),
+]
+
 def main():
     """Main function to execute all tasks"""
+    parser = argparse.ArgumentParser(description="Format, answer and refine OCR'd MCQs with OpenAI")
+    parser.add_argument("tasks", nargs="*", metavar="TASK",
+                        help=f"Tasks to bring up to date, along with the tasks they depend on: {', '.join(task.name for task in TASKS)} (default: all)")
+    parser.add_argument("-j", "--jobs", type=int, default=int(os.getenv("MCQ_TASK_WORKERS", "2")),
+                        help="Independent tasks run at the same time (default: MCQ_TASK_WORKERS or 2)")
+    parser.add_argument("--force", action="store_true", help="Rerun tasks even if their inputs are unchanged")
+    parser.add_argument("--state-file", default=DEFAULT_STATE_FILE, help=f"Input/output hashes from earlier runs (default: {DEFAULT_STATE_FILE})")
+    args = parser.parse_args()
+    unknown = set(args.tasks) - {task.name for task in TASKS}
+    if unknown:
+        parser.error(f"unknown task(s): {', '.join(sorted(unknown))}")
+
     print("Starting MCQ Processing with OpenAI...\n")
     
     # Check if API key is set
@@ -214,36 +504,26 @@ def main():
         print("3. Copy the key and add it to your .env file as: OPENAI_API_KEY=your_key_here")
         return
     
-    try:
-        # Check if user wants to run Task 4 only
-        if input("Do you want to generate answers for refined MCQs? (y/n): ").lower().startswith('y'):
-            task4_generate_answers_for_refined()
-            print("Task 4 completed!")
-            print("\nOutput file:")
-            print("- mcq_refined_with_answers.txt: Refined MCQs with answers and explanations")
-            return
-        
-        # Execute Task 1
-        formatted_content = task1_format_mcqs()
-        
-        # Execute Task 2
-        task2_generate_formatted_output(formatted_content)
-        
-        # Execute Task 3
-        task3_refine_questions(formatted_content)
-        
-        print("All tasks completed successfully!")
-        print("\nOutput files:")
-        print("- output.txt: Formatted MCQs (Task 1)")
-        print("- mcq_formatted_final.txt: Formatted output with answers and explanations (Task 2)")
-        print("- mcq_refined.txt: Refined questions with original choices (Task 3)")
-        
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
-        print("\nPlease check:")
+    status = run_graph(TASKS, targets=args.tasks, force=args.force, workers=args.jobs, state_file=args.state_file)
+
+    if any(result in ("failed", "blocked") for result in status.values()):
+        print("\nSome tasks did not complete. Please check:")
         print("1. Your OpenAI API key is correctly set in the .env file")
         print("2. You have an active internet connection")
         print("3. If you see quota errors, check your OpenAI usage and billing settings")
+        return
+
+    print("\nAll tasks completed successfully!")
+    print("\nOutput files:")
+    descriptions = {
+        FORMATTED_FILE: "Formatted MCQs (Task 1)",
+        FINAL_FILE: "Formatted output with answers and explanations (Task 2)",
+        REFINED_FILE: "Refined questions with original choices (Task 3)",
+        REFINED_ANSWERS_FILE: "Refined MCQs with answers and explanations (Task 4)",
+    }
+    for task in TASKS:
+        if task.name in status:
+            print(f"- {task.outputs[0]}: {descriptions[task.outputs[0]]} ({status[task.name]})")
 
 if __name__ == "__main__":
     main()
@@ -1,16 +1,357 @@
-from pdf2image import convert_from_path
-import pytesseract
+import argparse
+import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 
-# Convert PDF to images (using system PATH)
-pdf_path = "test.pdf"
-images = convert_from_path(pdf_path)
+from pdf2image import convert_from_path, pdfinfo_from_path
+import pdfplumber
 
-extracted_text = ""
-for image in images:
-    text = pytesseract.image_to_string(image)
-    extracted_text += text + "\n"
+from ocr_backends import (
+    BACKEND_CHOICES,
+    data_to_text,
+    get_backend,
+    get_default_backend,
+    mean_confidence,
+    resolve_backend,
+)
+from mcq_layout import detect_mcqs
+from ocr_cache import OCRCache, get_default_cache_dir
+from preprocess import DEFAULT_TARGET_DPI, preprocess_page
+from task_graph import file_hash
 
-with open("output.txt", "w", encoding="utf-8") as text_file:
-    text_file.write(extracted_text)
-print(extracted_text)
\ No newline at end of file
+# pdf2image's default rendering resolution
+DEFAULT_DPI = 200
+
+# Adaptive mode: fast first pass, then pages below the confidence threshold are redone at high DPI
+DEFAULT_LOW_DPI = 150
+DEFAULT_HIGH_DPI = 300
+DEFAULT_MIN_CONFIDENCE = 70.0
+
+# A page's embedded text layer is trusted only if it has at least this many letters/digits
+MIN_TEXT_LAYER_CHARS = int(os.getenv("OCR_MIN_TEXT_LAYER_CHARS", "25"))
+
+
+def get_default_workers():
+    """Return the worker count from OCR_WORKERS, defaulting to the number of CPU cores"""
+    return int(os.getenv("OCR_WORKERS", os.cpu_count() or 1))
+
+def get_default_window():
+    """Return the rasterization window (pages held in memory per worker) from OCR_WINDOW, default 4"""
+    return int(os.getenv("OCR_WINDOW", "4"))
+
+def default_ocr_options():
+    """Return the per-page OCR settings shared by every worker (all values must be picklable)"""
+    return {
+        "dpi": int(os.getenv("OCR_DPI", DEFAULT_DPI)),
+        "config": os.getenv("OCR_TESSERACT_CONFIG", ""),
+        "cache_dir": get_default_cache_dir(),
+        "preprocess": os.getenv("OCR_PREPROCESS", "").lower() in ("1", "true", "yes"),
+        "target_dpi": int(os.getenv("OCR_TARGET_DPI", DEFAULT_TARGET_DPI)),
+        "backend": get_default_backend(),
+        "adaptive": os.getenv("OCR_ADAPTIVE", "").lower() in ("1", "true", "yes"),
+        "high_dpi": int(os.getenv("OCR_HIGH_DPI", DEFAULT_HIGH_DPI)),
+        "min_confidence": float(os.getenv("OCR_MIN_CONFIDENCE", DEFAULT_MIN_CONFIDENCE)),
+        "layout": False,
+    }
+
+def cache_settings(options):
+    """Return the settings string mixed into the cache key; anything that changes the OCR text belongs here"""
+    # The two backends don't produce identical text from the same page and settings
+    settings = f"{resolve_backend(options['backend'])}|{options['config']}"
+    if options["preprocess"]:
+        settings += f"|preprocess@{options['target_dpi']}"
+    if options["adaptive"]:
+        settings += f"|adaptive@{options['high_dpi']}<{options['min_confidence']}"
+    if options["layout"]:
+        settings += "|layout"
+    return settings
+
+def get_page_count(pdf_path):
+    """Return the number of pages in the PDF (uses pdfinfo from the system PATH)"""
+    return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+def init_worker():
+    """Pin Tesseract to one thread per process so the pool doesn't oversubscribe the cores.
+    Runs before the worker creates its engine, which is when tesserocr (and OpenMP) gets loaded.
+    """
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+def page_windows(page_numbers, window):
+    """Group ascending page numbers into contiguous (first_page, last_page) windows of at most `window` pages"""
+    windows = []
+    for page_no in page_numbers:
+        if windows:
+            first, last = windows[-1]
+            if page_no == last + 1 and (window <= 0 or last - first + 1 < window):
+                windows[-1] = (first, page_no)
+                continue
+        windows.append((page_no, page_no))
+    return windows
+
+def has_usable_text_layer(text):
+    """Return True if an embedded text layer looks like real text rather than an empty or garbled layer"""
+    if not text or "(cid:" in text:
+        return False
+    return sum(ch.isalnum() for ch in text) >= MIN_TEXT_LAYER_CHARS
+
+def get_text_layers(pdf_path):
+    """Return the embedded text of each page, or None for pages that need OCR (scanned/image-only pages)"""
+    layers = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            page_text = page.extract_text()
+            layers.append(page_text if has_usable_text_layer(page_text) else None)
+    return layers
+
+def recognize(image, dpi, options):
+    """Run the configured backend on one page image (preprocessing it first if enabled).
+    Returns (text, data); data is the image_to_data word table in layout mode and None otherwise.
+    """
+    if options["preprocess"]:
+        image = preprocess_page(image, dpi, options["target_dpi"])
+    backend = get_backend(options["backend"], options["config"])
+    if options["layout"]:
+        data = backend.image_to_data(image)
+        return data_to_text(data), data
+    return backend.image_to_string(image), None
+
+def recognize_adaptive(image, options, render_high_dpi):
+    """Two-pass OCR: keep the fast low-DPI result when Tesseract is confident about it,
+    otherwise re-rasterize the page at high DPI and OCR it again.
+    Returns (text, data, source) with source "ocr" or "ocr-high".
+    """
+    low_image = image
+    if options["preprocess"]:
+        low_image = preprocess_page(image, options["dpi"], options["target_dpi"])
+    data = get_backend(options["backend"], options["config"]).image_to_data(low_image)
+    confidence = mean_confidence(data)
+    # Pages with no recognizable words are blank at any resolution, so they are not retried
+    if confidence is None or confidence >= options["min_confidence"]:
+        return data_to_text(data), data, "ocr"
+    text, data = recognize(render_high_dpi(), options["high_dpi"], options)
+    return text, data, "ocr-high"
+
+def ocr_image(image, options, cache=None, render_high_dpi=None, page_no=1):
+    """OCR one page image, returning a result dict {"text", "source"} (plus "mcqs" and "clean" in layout mode).
+    Source is "cache" on a cache hit, "ocr-high" if adaptive mode redid the page at high DPI, and "ocr" otherwise.
+    """
+    key = None
+    if cache is not None:
+        key = cache.key(image, options["dpi"], cache_settings(options), options["backend"])
+        cached = cache.get(key)
+        if cached is not None:
+            # Layout-mode entries hold the detected questions as JSON alongside the text
+            result = json.loads(cached) if options["layout"] else {"text": cached}
+            result["source"] = "cache"
+            return result
+
+    if options["adaptive"]:
+        text, data, source = recognize_adaptive(image, options, render_high_dpi)
+    else:
+        text, data = recognize(image, options["dpi"], options)
+        source = "ocr"
+    result = {"text": text}
+    if options["layout"]:
+        result["mcqs"], result["clean"] = detect_mcqs(data, page_no)
+
+    if cache is not None:
+        cache.put(key, json.dumps(result, ensure_ascii=False) if options["layout"] else text)
+    result["source"] = source
+    return result
+
+def ocr_page_range(task):
+    """Rasterize and OCR one window of pages, returning their result dicts in page order.
+    Only this window's images are alive at a time; they are released before the next window is rasterized.
+    Also used as the worker function, so full-resolution images never get pickled between processes.
+    """
+    pdf_path, first_page, last_page, options = task
+    cache = OCRCache(options["cache_dir"]) if options["cache_dir"] else None
+    images = convert_from_path(pdf_path, dpi=options["dpi"], first_page=first_page, last_page=last_page)
+    results = []
+    for page_no in range(first_page, first_page + len(images)):
+        def render_high_dpi(page_no=page_no):
+            return convert_from_path(pdf_path, dpi=options["high_dpi"], first_page=page_no, last_page=page_no)[0]
+        # pop() hands each page image to Tesseract and drops our reference right after
+        results.append(ocr_image(images.pop(0), options, cache, render_high_dpi, page_no))
+    return results
+
+def iter_ocr_results(pdf_path, page_numbers, workers=1, window=4, options=None):
+    """Yield OCR result dicts for the given pages in order while rasterizing the PDF window by window.
+    Peak memory is bounded by workers * window pages, not by the page count.
+    """
+    options = options or default_ocr_options()
+    tasks = [(pdf_path, first, last, options) for first, last in page_windows(page_numbers, window)]
+    if not tasks:
+        return
+
+    if workers <= 1:
+        for task in tasks:
+            yield from ocr_page_range(task)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=init_worker) as pool:
+        # map() yields results in submission order, so pages come back in document order
+        for results in pool.map(ocr_page_range, tasks):
+            yield from results
+
+def iter_pages(pdf_path, workers=1, window=4, hybrid=False, options=None):
+    """Yield one dict per page in page order: {"page", "text", "source"} plus "mcqs"/"clean" in layout mode.
+    Source is "ocr", "ocr-high" or "cache" for rasterized pages. With hybrid=True, pages that already
+    carry a usable text layer are taken from it (source "text") and only the remaining pages are rasterized.
+    """
+    if hybrid:
+        layers = get_text_layers(pdf_path)
+    else:
+        layers = [None] * get_page_count(pdf_path)
+
+    ocr_pages = [page_no for page_no, layer in enumerate(layers, start=1) if layer is None]
+    ocr_results = iter_ocr_results(pdf_path, ocr_pages, workers=workers, window=window, options=options)
+    for page_no, layer in enumerate(layers, start=1):
+        if layer is not None:
+            # No word boxes for text-layer pages, so layout mode leaves them to the LLM formatter
+            page = {"text": layer, "source": "text"}
+            if options and options["layout"]:
+                page.update(mcqs=[], clean=False)
+        else:
+            page = next(ocr_results)
+        yield {"page": page_no, **page}
+
+def ocr_pdf(pdf_path, workers=1, window=4, hybrid=False, options=None):
+    """Extract every page of the PDF and return the page texts in page order"""
+    pages = iter_pages(pdf_path, workers=workers, window=window, hybrid=hybrid, options=options)
+    return [page["text"] for page in pages]
+
+class PageWriter:
+    """Streams pages to the output file as soon as they are recognized.
+    "txt" writes each page's text under a "===== Page N =====" delimiter (unless delimiters=False);
+    "jsonl" writes one JSON object per page. Every page is flushed, so downstream stages can tail the file.
+    """
+
+    def __init__(self, path, fmt="txt", delimiters=True):
+        self.fmt = fmt
+        self.delimiters = delimiters
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, page):
+        if self.fmt == "jsonl":
+            self.file.write(json.dumps(page, ensure_ascii=False) + "\n")
+        else:
+            if self.delimiters:
+                self.file.write(page_delimiter(page["page"]) + "\n")
+            self.file.write(page["text"] + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def page_delimiter(page_no):
+    """Line written before each page's text in txt output"""
+    return f"===== Page {page_no} ====="
+
+def main():
+    options = default_ocr_options()
+    parser = argparse.ArgumentParser(description="Extract text from a scanned PDF with Tesseract OCR")
+    parser.add_argument("pdf_path", nargs="?", default="test.pdf", help="PDF to OCR (default: test.pdf)")
+    parser.add_argument("-o", "--output", default="output.txt", help="Text file to write (default: output.txt)")
+    parser.add_argument("--format", choices=["txt", "jsonl"], default="txt",
+                        help="txt: page texts with page delimiters; jsonl: one JSON object per page (default: txt)")
+    parser.add_argument("--no-page-delimiters", action="store_true", help="Write txt output without the page delimiter lines")
+    parser.add_argument("--echo", action="store_true", help="Also print each page to stdout as it is recognized")
+    parser.add_argument("-w", "--workers", type=int, default=get_default_workers(),
+                        help="Number of OCR worker processes (default: OCR_WORKERS or CPU count; 1 = sequential)")
+    parser.add_argument("--window", type=int, default=get_default_window(),
+                        help="Pages rasterized at a time per worker (default: OCR_WINDOW or 4; 0 = whole PDF)")
+    parser.add_argument("--hybrid", action="store_true",
+                        help="Use the embedded text layer where a page has one and OCR only the scanned pages")
+    parser.add_argument("--dpi", type=int, default=None,
+                        help=f"Rasterization DPI (default: OCR_DPI or {DEFAULT_DPI}; {DEFAULT_LOW_DPI} for the first pass with --adaptive)")
+    parser.add_argument("--tesseract-config", default=options["config"],
+                        help="Extra Tesseract arguments, e.g. \"--psm 6 -l eng\" (default: OCR_TESSERACT_CONFIG)")
+    parser.add_argument("--preprocess", action="store_true", default=options["preprocess"],
+                        help="Grayscale, binarize, deskew, crop and downscale pages before OCR (default: OCR_PREPROCESS)")
+    parser.add_argument("--target-dpi", type=int, default=options["target_dpi"],
+                        help=f"Resolution pages are downscaled to when preprocessing (default: OCR_TARGET_DPI or {DEFAULT_TARGET_DPI})")
+    parser.add_argument("--backend", choices=BACKEND_CHOICES, default=options["backend"],
+                        help="auto uses the in-process tesserocr engine when installed, else pytesseract (default: OCR_BACKEND or auto)")
+    parser.add_argument("--adaptive", action="store_true", default=options["adaptive"],
+                        help="OCR at low --dpi first and redo only low-confidence pages at --high-dpi (default: OCR_ADAPTIVE)")
+    parser.add_argument("--high-dpi", type=int, default=options["high_dpi"],
+                        help=f"Second-pass DPI for adaptive mode (default: OCR_HIGH_DPI or {DEFAULT_HIGH_DPI})")
+    parser.add_argument("--min-confidence", type=float, default=options["min_confidence"],
+                        help=f"Mean word confidence (0-100) below which a page is redone (default: OCR_MIN_CONFIDENCE or {DEFAULT_MIN_CONFIDENCE:g})")
+    parser.add_argument("--layout", nargs="?", const="mcq_layout.jsonl", default=None, metavar="JSONL",
+                        help="Detect questions and A-D choices from word boxes and write per-page records (default file: mcq_layout.jsonl)")
+    parser.add_argument("--cache-dir", default=options["cache_dir"], help="OCR result cache directory (default: OCR_CACHE_DIR or .ocr_cache)")
+    parser.add_argument("--no-cache", action="store_true", help="Always run Tesseract, ignoring the OCR result cache")
+    args = parser.parse_args()
+
+    dpi = args.dpi
+    if dpi is None:
+        dpi = int(os.getenv("OCR_DPI", DEFAULT_LOW_DPI if args.adaptive else DEFAULT_DPI))
+    options.update(
+        dpi=dpi,
+        config=args.tesseract_config,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        preprocess=args.preprocess,
+        target_dpi=args.target_dpi,
+        backend=resolve_backend(args.backend),
+        adaptive=args.adaptive,
+        high_dpi=args.high_dpi,
+        min_confidence=args.min_confidence,
+        layout=bool(args.layout),
+    )
+
+    start = time.perf_counter()
+    sources = []
+    question_count = clean_count = 0
+    layout_context = open(args.layout, "w", encoding="utf-8") if options["layout"] else nullcontext()
+    with PageWriter(args.output, args.format, delimiters=not args.no_page_delimiters) as writer, layout_context as layout_file:
+        for page in iter_pages(args.pdf_path, workers=args.workers, window=args.window, hybrid=args.hybrid, options=options):
+            writer.write(page)
+            if args.echo:
+                print(page_delimiter(page["page"]))
+                print(page["text"], flush=True)
+            sources.append(page["source"])
+            if layout_file:
+                layout_file.write(json.dumps(page, ensure_ascii=False) + "\n")
+                layout_file.flush()
+                question_count += len(page["mcqs"])
+                clean_count += page["clean"]
+    if layout_file:
+        # Lets mcq_processor_openai.py check that the layout records belong to the text it is about to format
+        with open(args.layout, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"output": args.output, "output_sha256": file_hash(args.output)}) + "\n")
+    elapsed = time.perf_counter() - start
+
+    page_count = len(sources)
+    ocr_count = sum(1 for source in sources if source != "text")
+    pages_per_sec = page_count / elapsed if elapsed > 0 else 0.0
+    print(f"OCR: {page_count} pages -> {args.output} in {elapsed:.1f}s ({pages_per_sec:.2f} pages/sec, {args.workers} worker(s), {options['backend']})")
+    if args.hybrid:
+        print(f"     {page_count - ocr_count} pages from the text layer, {ocr_count} pages rasterized")
+
+    if options["adaptive"]:
+        redone = sources.count("ocr-high")
+        print(f"     Adaptive: {redone} of {ocr_count} pages redone at {options['high_dpi']} DPI")
+
+    if options["layout"]:
+        print(f"     Layout: {question_count} questions, {clean_count} of {page_count} pages clean -> {args.layout}")
+
+    if options["cache_dir"]:
+        hits = sources.count("cache")
+        misses = sum(1 for source in sources if source.startswith("ocr"))
+        cache = OCRCache(options["cache_dir"])
+        cache.record_stats(hits, misses)
+        cache.evict()
+        print(f"     OCR cache: {hits} hits, {misses} misses (python ocr_cache.py stats for totals)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import importlib.util
+import os
+import shlex
+
+import pytesseract
+
+# The optional in-process engine (pip install tesserocr) is imported only when an engine is created: loading it
+# loads libtesseract and OpenMP, which read OMP_THREAD_LIMIT once, so a pool worker must set that first.
+# pytesseract is the fallback.
+
+BACKEND_CHOICES = ["auto", "tesserocr", "pytesseract"]
+
+# Columns of pytesseract.image_to_data(output_type=DICT); both backends return this shape
+DATA_KEYS = ["level", "page_num", "block_num", "par_num", "line_num", "word_num",
+             "left", "top", "width", "height", "conf", "text"]
+
+# One initialized engine per (backend, config) per process
+_engines = {}
+
+
+def get_default_backend():
+    """Return the OCR backend from OCR_BACKEND (auto, tesserocr or pytesseract), default auto"""
+    return os.getenv("OCR_BACKEND", "auto")
+
+def tesserocr_installed():
+    """True if the tesserocr package is available; checked without importing it"""
+    return importlib.util.find_spec("tesserocr") is not None
+
+def resolve_backend(name):
+    """Map "auto" to tesserocr when it is installed, otherwise pytesseract"""
+    if name == "auto":
+        return "tesserocr" if tesserocr_installed() else "pytesseract"
+    if name == "tesserocr" and not tesserocr_installed():
+        raise RuntimeError("tesserocr package not installed. Install with: pip install tesserocr")
+    return name
+
+def backend_version(name):
+    """Return the version of the Tesseract a backend runs: the linked library for tesserocr (asked without
+    spawning the CLI), the tesseract CLI for pytesseract
+    """
+    if resolve_backend(name) == "tesserocr":
+        import tesserocr
+
+        return tesserocr.tesseract_version().splitlines()[0]
+    return str(pytesseract.get_tesseract_version())
+
+
+class PytesseractBackend:
+    """Runs the tesseract CLI through pytesseract: one temp image and one subprocess per page"""
+
+    name = "pytesseract"
+
+    def __init__(self, config=""):
+        self.config = config
+
+    def image_to_string(self, image):
+        return pytesseract.image_to_string(image, config=self.config)
+
+    def image_to_data(self, image):
+        return pytesseract.image_to_data(image, config=self.config, output_type=pytesseract.Output.DICT)
+
+    def close(self):
+        pass
+
+
+class TesserocrBackend:
+    """Keeps one libtesseract engine alive and feeds it page after page, so the language model loads once.
+    Understands the usual CLI-style config: -l LANG, --psm N, --oem N and -c VAR=VALUE.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, config=""):
+        import tesserocr
+
+        lang, psm, oem, variables = "eng", None, None, {}
+        tokens = shlex.split(config)
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            value = tokens[i + 1] if i + 1 < len(tokens) else ""
+            if token == "-l":
+                lang = value
+            elif token == "--psm":
+                psm = int(value)
+            elif token == "--oem":
+                oem = int(value)
+            elif token == "-c":
+                var, _, var_value = value.partition("=")
+                variables[var] = var_value
+            else:
+                raise ValueError(f"Unsupported Tesseract option for the tesserocr backend: {token}")
+            i += 2
+
+        kwargs = {"lang": lang}
+        if psm is not None:
+            kwargs["psm"] = psm
+        if oem is not None:
+            kwargs["oem"] = oem
+        self.api = tesserocr.PyTessBaseAPI(**kwargs)
+        for var, var_value in variables.items():
+            self.api.SetVariable(var, var_value)
+
+    def image_to_string(self, image):
+        self.api.SetImage(image)
+        return self.api.GetUTF8Text()
+
+    def image_to_data(self, image):
+        """Return word boxes and confidences in the same dict-of-lists shape as pytesseract.image_to_data"""
+        import tesserocr
+
+        RIL = tesserocr.RIL
+        self.api.SetImage(image)
+        self.api.Recognize()
+        data = {key: [] for key in DATA_KEYS}
+        block_num = par_num = line_num = word_num = 0
+        iterator = self.api.GetIterator()
+        if iterator is None:
+            return data
+        for word in tesserocr.iterate_level(iterator, RIL.WORD):
+            if word.IsAtBeginningOf(RIL.BLOCK):
+                block_num, par_num, line_num, word_num = block_num + 1, 0, 0, 0
+            if word.IsAtBeginningOf(RIL.PARA):
+                par_num, line_num, word_num = par_num + 1, 0, 0
+            if word.IsAtBeginningOf(RIL.TEXTLINE):
+                line_num, word_num = line_num + 1, 0
+            word_num += 1
+            box = word.BoundingBox(RIL.WORD)
+            if box is None:
+                continue
+            left, top, right, bottom = box
+            row = {
+                "level": 5, "page_num": 1, "block_num": block_num, "par_num": par_num,
+                "line_num": line_num, "word_num": word_num, "left": left, "top": top,
+                "width": right - left, "height": bottom - top,
+                "conf": word.Confidence(RIL.WORD), "text": word.GetUTF8Text(RIL.WORD) or "",
+            }
+            for key in DATA_KEYS:
+                data[key].append(row[key])
+        return data
+
+    def close(self):
+        self.api.End()
+
+
+def get_backend(name="auto", config=""):
+    """Return this process's engine for the backend, creating it on first use and reusing it afterwards"""
+    name = resolve_backend(name)
+    key = (name, config)
+    if key not in _engines:
+        backend_class = TesserocrBackend if name == "tesserocr" else PytesseractBackend
+        _engines[key] = backend_class(config)
+    return _engines[key]
+
+def iter_words(data):
+    """Yield one dict per recognized word (skipping the empty block/paragraph/line rows)"""
+    for i, text in enumerate(data["text"]):
+        if text and text.strip() and float(data["conf"][i]) >= 0:
+            yield {key: data[key][i] for key in DATA_KEYS}
+
+def mean_confidence(data):
+    """Mean word confidence (0-100) for a page, or None if no words were recognized"""
+    confs = [float(word["conf"]) for word in iter_words(data)]
+    return sum(confs) / len(confs) if confs else None
+
+def data_to_text(data):
+    """Rebuild plain text from image_to_data output: one line per text line, blank line between paragraphs"""
+    lines = []
+    current_key = None
+    current_par = None
+    for word in iter_words(data):
+        par = (word["block_num"], word["par_num"])
+        key = par + (word["line_num"],)
+        if key != current_key:
+            if current_par is not None and par != current_par:
+                lines.append("")
+            lines.append(word["text"].strip())
+            current_key, current_par = key, par
+        else:
+            lines[-1] += " " + word["text"].strip()
+    return "\n".join(lines) + "\n" if lines else ""
@@ -0,0 +1,159 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+
+from ocr_backends import backend_version, resolve_backend
+
+DEFAULT_CACHE_DIR = ".ocr_cache"
+DEFAULT_MAX_MB = 512
+
+_tesseract_versions = {}
+
+
+def get_default_cache_dir():
+    """Return the cache directory from OCR_CACHE_DIR, defaulting to .ocr_cache"""
+    return os.getenv("OCR_CACHE_DIR", DEFAULT_CACHE_DIR)
+
+def get_default_max_bytes():
+    """Return the cache size limit in bytes from OCR_CACHE_MAX_MB (default 512 MB)"""
+    return int(float(os.getenv("OCR_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024)
+
+def get_tesseract_version(backend="auto"):
+    """Return the version of the Tesseract a backend runs, once per process and backend;
+    upgrading either the library or the CLI invalidates the entries it made
+    """
+    backend = resolve_backend(backend)
+    if backend not in _tesseract_versions:
+        _tesseract_versions[backend] = backend_version(backend)
+    return _tesseract_versions[backend]
+
+
+class OCRCache:
+    """Persistent on-disk OCR results, keyed by a hash of the rasterized page plus the OCR settings.
+    Entries are plain text files under <cache_dir>/<key[:2]>/<key>.txt. Reads refresh the file's
+    mtime, so eviction drops the least recently used pages first.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or get_default_cache_dir()
+        self.max_bytes = get_default_max_bytes() if max_bytes is None else max_bytes
+        self.stats_path = os.path.join(self.cache_dir, "stats.json")
+
+    def key(self, image, dpi, config="", backend="auto"):
+        """Hash the page pixels together with everything else that changes Tesseract's output,
+        including the backend and the version of the Tesseract behind it
+        """
+        digest = hashlib.sha256()
+        digest.update(f"{image.mode}|{image.size}|{dpi}|{config}|{get_tesseract_version(backend)}|".encode("utf-8"))
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".txt")
+
+    def get(self, key):
+        """Return the cached text for a key, or None on a miss"""
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return text
+
+    def put(self, key, text):
+        """Store the text for a key (atomically, so concurrent workers never see partial entries)"""
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".txt"):
+                    continue
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes; returns the number removed"""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+        return removed
+
+    def load_stats(self):
+        """Return the persisted hit/miss counters"""
+        try:
+            with open(self.stats_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"hits": 0, "misses": 0, "last_run": {"hits": 0, "misses": 0}}
+
+    def record_stats(self, hits, misses):
+        """Add one run's hit/miss counts to the persisted counters"""
+        stats = self.load_stats()
+        stats["hits"] += hits
+        stats["misses"] += misses
+        stats["last_run"] = {"hits": hits, "misses": misses}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.stats_path, "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2)
+
+    def clear(self):
+        """Remove every cached entry and the counters"""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+
+def hit_rate(hits, misses):
+    """Return the hit rate as a percentage"""
+    total = hits + misses
+    return 100.0 * hits / total if total else 0.0
+
+def print_stats(cache):
+    """Print cache size and hit rate"""
+    entries = cache._entries()
+    size_mb = sum(size for _, size, _ in entries) / (1024 * 1024)
+    stats = cache.load_stats()
+    last = stats["last_run"]
+    print(f"OCR cache: {cache.cache_dir}")
+    print(f"  Entries:   {len(entries)} ({size_mb:.2f} MB of {cache.max_bytes / (1024 * 1024):.0f} MB)")
+    print(f"  Last run:  {last['hits']} hits, {last['misses']} misses ({hit_rate(last['hits'], last['misses']):.1f}% hit rate)")
+    print(f"  All runs:  {stats['hits']} hits, {stats['misses']} misses ({hit_rate(stats['hits'], stats['misses']):.1f}% hit rate)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or maintain the OCR result cache")
+    parser.add_argument("command", choices=["stats", "evict", "clear"], help="stats: show hit rate; evict: enforce size limit; clear: delete everything")
+    parser.add_argument("--cache-dir", default=get_default_cache_dir(), help="Cache directory (default: OCR_CACHE_DIR or .ocr_cache)")
+    parser.add_argument("--max-mb", type=float, default=None, help="Size limit in MB (default: OCR_CACHE_MAX_MB or 512)")
+    args = parser.parse_args()
+
+    max_bytes = int(args.max_mb * 1024 * 1024) if args.max_mb is not None else None
+    cache = OCRCache(args.cache_dir, max_bytes=max_bytes)
+    if args.command == "stats":
+        print_stats(cache)
+    elif args.command == "evict":
+        print(f"Evicted {cache.evict()} entries")
+    else:
+        cache.clear()
+        print(f"Cleared {cache.cache_dir}")
+
+if __name__ == "__main__":
+    main()
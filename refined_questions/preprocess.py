@@ -0,0 +1,96 @@
+import numpy as np
+from PIL import Image
+
+# Tesseract is most accurate on text rendered at roughly 300 DPI
+DEFAULT_TARGET_DPI = 300
+
+
+def to_grayscale(arr):
+    """Convert an RGB(A) or grayscale array to an 8-bit grayscale array (ITU-R 601 luma weights)"""
+    if arr.ndim == 2:
+        return arr.astype(np.uint8)
+    rgb = arr[..., :3].astype(np.float32)
+    return (rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)).clip(0, 255).astype(np.uint8)
+
+def downscale(gray, source_dpi, target_dpi=DEFAULT_TARGET_DPI):
+    """Shrink the page to target_dpi if it was rendered above it; never upscales"""
+    if not source_dpi or source_dpi <= target_dpi:
+        return gray
+    scale = target_dpi / source_dpi
+    height, width = gray.shape
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return np.asarray(Image.fromarray(gray).resize(size, Image.LANCZOS))
+
+def adaptive_binarize(gray, block=31, offset=10):
+    """Bradley-Roth adaptive threshold: a pixel is ink if it is darker than its local mean minus offset.
+    Local means come from an integral image, so the cost is O(pixels) regardless of block size.
+    """
+    height, width = gray.shape
+    half = block // 2
+    integral = np.zeros((height + 1, width + 1), dtype=np.int64)
+    integral[1:, 1:] = gray.astype(np.int64).cumsum(axis=0).cumsum(axis=1)
+
+    y0 = np.clip(np.arange(height) - half, 0, height)
+    y1 = np.clip(np.arange(height) + half + 1, 0, height)
+    x0 = np.clip(np.arange(width) - half, 0, width)
+    x1 = np.clip(np.arange(width) + half + 1, 0, width)
+    window_sum = (
+        integral[y1][:, x1] - integral[y0][:, x1] - integral[y1][:, x0] + integral[y0][:, x0]
+    )
+    area = (y1 - y0)[:, None] * (x1 - x0)[None, :]
+    local_mean = window_sum / area
+    return np.where(gray < local_mean - offset, 0, 255).astype(np.uint8)
+
+def estimate_skew(binary, max_angle=5.0, step=0.25, max_samples=100000):
+    """Estimate the counter-clockwise rotation (degrees) that makes text lines horizontal.
+    Ink pixel coordinates are rotated for every candidate angle at once with a projection profile;
+    the angle whose row histogram is sharpest (largest sum of squares) wins.
+    """
+    ys, xs = np.nonzero(binary == 0)
+    if len(ys) == 0:
+        return 0.0
+    if len(ys) > max_samples:
+        pick = np.random.default_rng(0).choice(len(ys), max_samples, replace=False)
+        ys, xs = ys[pick], xs[pick]
+
+    angles = np.arange(-max_angle, max_angle + step / 2, step)
+    radians = np.deg2rad(angles)
+    # rows[i, k] = projected row of ink pixel k when the page is rotated by angles[i]
+    rows = np.rint(ys[None, :] * np.cos(radians)[:, None] - xs[None, :] * np.sin(radians)[:, None]).astype(np.int64)
+    rows -= rows.min()
+    n_rows = rows.max() + 1
+    offsets = (np.arange(len(angles)) * n_rows)[:, None]
+    hist = np.bincount((rows + offsets).ravel(), minlength=len(angles) * n_rows).reshape(len(angles), n_rows)
+    scores = (hist.astype(np.float64) ** 2).sum(axis=1)
+    return float(angles[int(np.argmax(scores))])
+
+def deskew(binary, angle):
+    """Rotate the page counter-clockwise by angle degrees (from estimate_skew), padding with white"""
+    if abs(angle) < 1e-3:
+        return binary
+    rotated = Image.fromarray(binary).rotate(angle, resample=Image.NEAREST, expand=True, fillcolor=255)
+    return np.asarray(rotated)
+
+def crop_borders(binary, margin=10, border_fill=0.9):
+    """Crop to the ink bounding box, ignoring dark scanner borders (rows/columns that are almost all ink)"""
+    ink = binary == 0
+    border_rows = ink.mean(axis=1) >= border_fill
+    border_cols = ink.mean(axis=0) >= border_fill
+    content = ink & ~border_rows[:, None] & ~border_cols[None, :]
+    rows = np.nonzero(content.any(axis=1))[0]
+    cols = np.nonzero(content.any(axis=0))[0]
+    if len(rows) == 0 or len(cols) == 0:
+        return binary
+    height, width = binary.shape
+    top, bottom = max(rows[0] - margin, 0), min(rows[-1] + margin + 1, height)
+    left, right = max(cols[0] - margin, 0), min(cols[-1] + margin + 1, width)
+    # Drop border ink that survived inside the margin
+    return np.where(content, 0, 255).astype(np.uint8)[top:bottom, left:right]
+
+def preprocess_page(image, source_dpi, target_dpi=DEFAULT_TARGET_DPI):
+    """Grayscale, downscale, binarize, deskew and crop one page; returns a PIL image ready for Tesseract"""
+    gray = to_grayscale(np.asarray(image))
+    gray = downscale(gray, source_dpi, target_dpi)
+    binary = adaptive_binarize(gray)
+    binary = deskew(binary, estimate_skew(binary))
+    return Image.fromarray(crop_borders(binary))
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+DEFAULT_STATE_FILE = ".task_state.json"
+
+
+class Task:
+    """One pipeline step: a function that reads `inputs` and writes `outputs` (file paths).
+    Inputs listed in `optional` may be missing; they still count towards the hash when present.
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), optional=()):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.optional = set(optional)
+
+
+def file_hash(path):
+    """sha256 of a file's contents, or None if it does not exist"""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_state(state_file):
+    """Return {task name: {"inputs": {path: hash}, "outputs": {path: hash}}} from the last runs"""
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_state(state_file, state):
+    """Write the task state atomically"""
+    tmp_path = state_file + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_file)
+
+def upstream_of(tasks, targets):
+    """Return the target tasks plus everything they depend on, in declaration order"""
+    producers = {path: task for task in tasks for path in task.outputs}
+    needed = set()
+    stack = list(targets)
+    while stack:
+        name = stack.pop()
+        if name in needed:
+            continue
+        needed.add(name)
+        task = next(t for t in tasks if t.name == name)
+        stack += [producers[path].name for path in task.inputs if path in producers]
+    return [task for task in tasks if task.name in needed]
+
+def is_up_to_date(task, state):
+    """A task can be skipped when its inputs hash the same as last time and its outputs are untouched"""
+    previous = state.get(task.name)
+    if previous is None:
+        return False
+    if previous["inputs"] != {path: file_hash(path) for path in task.inputs}:
+        return False
+    return previous["outputs"] == {path: file_hash(path) for path in task.outputs}
+
+def run_graph(tasks, targets=None, force=False, workers=4, state_file=DEFAULT_STATE_FILE):
+    """Run the tasks (or only `targets` and their upstream tasks) in dependency order.
+    A task starts as soon as every task producing one of its inputs has finished, so independent
+    tasks run concurrently. Tasks whose input and output hashes match the last run are skipped.
+    Returns {task name: "ran" | "skipped" | "failed" | "blocked"}.
+    """
+    if targets:
+        unknown = set(targets) - {task.name for task in tasks}
+        if unknown:
+            raise ValueError(f"Unknown task(s): {', '.join(sorted(unknown))}")
+        tasks = upstream_of(tasks, targets)
+
+    producers = {path: task.name for task in tasks for path in task.outputs}
+    deps = {task.name: {producers[path] for path in task.inputs if path in producers} for task in tasks}
+    state = load_state(state_file)
+    status = {}
+    pending = list(tasks)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        running = {}
+        while pending or running:
+            ready = [task for task in pending if deps[task.name] <= set(status)]
+            if not ready and not running:
+                raise ValueError(f"Dependency cycle between: {', '.join(task.name for task in pending)}")
+            for task in ready:
+                pending.remove(task)
+                if any(status[dep] in ("failed", "blocked") for dep in deps[task.name]):
+                    status[task.name] = "blocked"
+                    print(f"[{task.name}] not run: an upstream task failed")
+                    continue
+                missing = [path for path in task.inputs if path not in task.optional and not os.path.exists(path)]
+                if missing:
+                    status[task.name] = "failed"
+                    print(f"[{task.name}] missing input(s): {', '.join(missing)}")
+                    continue
+                if not force and is_up_to_date(task, state):
+                    status[task.name] = "skipped"
+                    print(f"[{task.name}] up to date, skipped")
+                    continue
+                input_hashes = {path: file_hash(path) for path in task.inputs}
+                running[pool.submit(task.func)] = (task, input_hashes, time.perf_counter())
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task, input_hashes, start = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    status[task.name] = "failed"
+                    state.pop(task.name, None)
+                    print(f"[{task.name}] failed: {e}")
+                else:
+                    status[task.name] = "ran"
+                    state[task.name] = {
+                        "inputs": input_hashes,
+                        "outputs": {path: file_hash(path) for path in task.outputs},
+                    }
+                    print(f"[{task.name}] done in {time.perf_counter() - start:.1f}s")
+                save_state(state_file, state)
+    return status